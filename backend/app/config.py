@@ -35,6 +35,50 @@ class Settings(BaseSettings):
     MINIO_UPLOAD_CHUNK_SIZE: int = 10 * 1024 * 1024
     MINIO_EXPIRES: int = 3600  # seconds
     MINIO_SECURE: str = "False"  # http vs https
+    # where file bytes are stored: "minio" or "local" (a directory on the API server)
+    STORAGE_BACKEND: str = "minio"
+    LOCAL_STORAGE_PATH: str = "/tmp/clowder-storage"
+    # shared connection pool used by all requests talking to Minio
+    MINIO_POOL_MAXSIZE: int = 32
+    MINIO_CONNECT_TIMEOUT: float = 10  # seconds
+    MINIO_READ_TIMEOUT: float = 300  # seconds
+    MINIO_RETRIES: int = 5
+
+    # Dataset archives download this many files ahead, holding at most this many bytes in memory
+    ARCHIVE_PREFETCH_PARALLELISM: int = 8
+    ARCHIVE_PREFETCH_BYTE_BUDGET: int = 64 * 1024 * 1024
+    # Released dataset versions are zipped once and served from storage afterwards
+    CACHE_FROZEN_ARCHIVES: bool = True
+    # Releases share the files and folders that did not change since the previous release instead of copying them.
+    # Must stay enabled once releases share documents, older releases would lose the shared ones otherwise.
+    FREEZE_SNAPSHOTS: bool = False
+    # A release whose job made no progress for this many seconds was interrupted, e.g. by a restart. It is removed
+    # again and its job marked as failed, checked every FREEZE_JOB_SWEEP_INTERVAL seconds.
+    FREEZE_JOB_TIMEOUT: int = 60 * 60
+    FREEZE_JOB_SWEEP_INTERVAL: int = 10 * 60
+
+    # Files of an uploaded zip are stored this many at a time when creating a dataset from it
+    ZIP_INGEST_PARALLELISM: int = 8
+
+    # Views served from collections kept up to date from a change stream instead of being computed on every query,
+    # e.g. ["datasets_view", "files_view"]. Needs MongoDB to run as a replica set, the views stay live otherwise.
+    MATERIALIZED_VIEWS: List[str] = []
+    # One process maintains the materialized views while it renews a lease of this many seconds, the others take over
+    # when it runs out
+    MATERIALIZED_VIEW_LEASE: int = 30
+
+    # Roles of users on datasets, and the datasets and statuses of files and datasets, are cached in every worker for
+    # this many seconds (0 disables the cache). A worker drops its entries when it writes authorizations, groups or
+    # statuses itself, and with ROLE_CACHE_CHANGE_STREAM also when other workers do, which needs a replica set.
+    ROLE_CACHE_TTL: int = 60
+    ROLE_CACHE_SIZE: int = 10000
+    ROLE_CACHE_CHANGE_STREAM: bool = False
+
+    # Resumable upload sessions that are not committed within this many seconds are garbage-collected
+    UPLOAD_SESSION_EXPIRATION: int = 24 * 60 * 60
+    UPLOAD_SESSION_SWEEP_INTERVAL: int = (
+        60 * 60
+    )  # seconds between garbage collection runs
 
     # Files in the listed directories can be added to Clowder without copying them elsewhere
     LOCAL_WHITELIST: List[str] = []
@@ -43,6 +87,17 @@ class Settings(BaseSettings):
     auth_base = "http://localhost:8080"
     auth_realm = "clowder"
     auth_client_id = "clowder2-backend"
+    # Access tokens are verified against the realm's signing keys, which are fetched again this often (seconds),
+    # and at most this often when a token is signed with an unknown key
+    JWKS_REFRESH_INTERVAL: int = 60 * 60
+    JWKS_MIN_REFRESH_INTERVAL: int = 30
+    # Verified access tokens remembered until they expire
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000
+    # API keys found in the database are accepted for this many seconds without looking them up again, a deleted key
+    # keeps working on other workers for as long
+    API_KEY_CACHE_TTL: int = 60
+    API_KEY_CACHE_SIZE: int = 10000
+    API_KEY_SWEEP_INTERVAL: int = 60 * 60  # seconds between removals of expired keys
     auth_redirect_uri = f"{API_HOST}{API_V2_STR}/auth"
     auth_url = f"{auth_base}/keycloak/realms/{auth_realm}/protocol/openid-connect/auth?client_id={auth_client_id}&response_type=code"
     oauth2_scheme_auth_url = f"{auth_base}/auth/realms/{auth_realm}/protocol/openid-connect/auth?client_id={auth_client_id}&response_type=code"
@@ -0,0 +1,234 @@
+import hashlib
+import json
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from app.models.datasets import DatasetChange, DatasetChangeType, DatasetFreezeDB
+from app.models.files import FileDB, FileFreezeDB
+from app.models.folders import FolderDB, FolderFreezeDB
+from app.models.metadata import MetadataDB, MetadataFreezeDB
+from beanie import Document, PydanticObjectId
+from beanie.operators import In
+from pydantic import BaseModel, Field
+
+# fields in which a released copy differs from its origin, and counters that change without the content changing
+UNHASHED_FIELDS = {
+    "id",
+    "origin_id",
+    "frozen",
+    "dataset_id",
+    "release_ids",
+    "content_hash",
+    "views",
+    "downloads",
+}
+
+# files whose metadata is compared together
+DIFF_BATCH_SIZE = 1000
+
+
+def _content_hash(document: BaseModel) -> str:
+    """
+    Hash of what a current document holds. It is stored with the released copy when the document is released, so
+    comparing versions never needs to read or hash released documents again. References to other documents are by
+    current ID, a document moved to another folder hashes differently.
+    """
+    data = document.dict(exclude=UNHASHED_FIELDS)
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class _Released(BaseModel):
+    # the fields of a released document a diff needs
+    id: PydanticObjectId = Field(alias="_id")
+    origin_id: PydanticObjectId
+    name: Optional[str]
+    content_hash: Optional[str]
+
+
+class _Entry(NamedTuple):
+    origin_id: PydanticObjectId
+    # of the document on its side of the diff, the same as origin_id in the draft
+    id: PydanticObjectId
+    name: Optional[str]
+    content_hash: Optional[str]
+
+
+async def _entries(
+    current: Type[Document],
+    released: Type[Document],
+    dataset_id: PydanticObjectId,
+    release: Optional[DatasetFreezeDB],
+) -> AsyncIterator[_Entry]:
+    """Files or folders of a release or the working draft, ordered by origin."""
+    if release is None:
+        async for document in current.find(current.dataset_id == dataset_id).sort(
+            "_id"
+        ):
+            yield _Entry(
+                document.id, document.id, document.name, _content_hash(document)
+            )
+    else:
+        async for document in (
+            released.find(released.release_ids == release.id)
+            .sort("origin_id")
+            .project(_Released)
+        ):
+            yield _Entry(
+                document.origin_id, document.id, document.name, document.content_hash
+            )
+
+
+async def _next(entries: AsyncIterator[_Entry]) -> Optional[_Entry]:
+    try:
+        return await entries.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _merge(
+    base: AsyncIterator[_Entry], target: AsyncIterator[_Entry]
+) -> AsyncIterator[Tuple[Optional[_Entry], Optional[_Entry]]]:
+    """Pair up the entries of two streams ordered by origin, None where one side has no such document."""
+    left, right = await _next(base), await _next(target)
+    while left is not None or right is not None:
+        if right is None or (left is not None and left.origin_id < right.origin_id):
+            yield left, None
+            left = await _next(base)
+        elif left is None or right.origin_id < left.origin_id:
+            yield None, right
+            right = await _next(target)
+        else:
+            yield left, right
+            left, right = await _next(base), await _next(target)
+
+
+def _change(
+    object_type: str,
+    base: Optional[_Entry],
+    target: Optional[_Entry],
+    resource_id: Optional[PydanticObjectId] = None,
+) -> Optional[DatasetChange]:
+    """The change from `base` to `target`, if any. Documents released before content hashes were recorded are always
+    reported as modified."""
+    if base is None:
+        change, entry = DatasetChangeType.ADDED, target
+    elif target is None:
+        change, entry = DatasetChangeType.REMOVED, base
+    elif base.content_hash is None or base.content_hash != target.content_hash:
+        change, entry = DatasetChangeType.MODIFIED, target
+    else:
+        return None
+    return DatasetChange(
+        change=change,
+        object_type=object_type,
+        origin_id=entry.origin_id,
+        name=entry.name,
+        resource_id=resource_id,
+    )
+
+
+async def _metadata_entries(
+    collection: str, resource_ids: List[PydanticObjectId], released: bool
+) -> Dict[PydanticObjectId, Tuple[_Entry, PydanticObjectId]]:
+    """Metadata attached to a batch of files or datasets of one side, with the resource each is attached to."""
+    entries = {}
+    if released:
+        async for md in MetadataFreezeDB.find(
+            In(MetadataFreezeDB.resource.resource_id, resource_ids),
+            MetadataFreezeDB.resource.collection == collection,
+        ):
+            entries[md.origin_id] = (
+                _Entry(md.origin_id, md.id, md.definition, md.content_hash),
+                md.resource.resource_id,
+            )
+    else:
+        async for md in MetadataDB.find(
+            In(MetadataDB.resource.resource_id, resource_ids),
+            MetadataDB.resource.collection == collection,
+        ):
+            entries[md.id] = (
+                _Entry(md.id, md.id, md.definition, _content_hash(md)),
+                md.resource.resource_id,
+            )
+    return entries
+
+
+async def _metadata_changes(
+    collection: str,
+    pairs: List[Tuple[_Entry, _Entry]],
+    base: Optional[DatasetFreezeDB],
+    target: Optional[DatasetFreezeDB],
+) -> List[DatasetChange]:
+    """Changes to the metadata of files or datasets present in both versions."""
+    origins = {}
+    for left, right in pairs:
+        origins[left.id] = left.origin_id
+        origins[right.id] = right.origin_id
+    before = await _metadata_entries(
+        collection, [left.id for left, _ in pairs], base is not None
+    )
+    after = await _metadata_entries(
+        collection, [right.id for _, right in pairs], target is not None
+    )
+    changes = []
+    for origin_id in sorted(before.keys() | after.keys()):
+        left, left_resource = before.get(origin_id, (None, None))
+        right, right_resource = after.get(origin_id, (None, None))
+        resource_id = origins[right_resource if right is not None else left_resource]
+        if (change := _change("metadata", left, right, resource_id)) is not None:
+            changes.append(change)
+    return changes
+
+
+async def _diff_dataset(
+    dataset_id: PydanticObjectId,
+    base: Optional[DatasetFreezeDB],
+    target: Optional[DatasetFreezeDB],
+) -> AsyncIterator[DatasetChange]:
+    """
+    Differences between two versions of a dataset: folders first, then files with the metadata of files present in both
+    versions, then the metadata of the dataset itself.
+
+    Both versions are read as streams ordered by origin and compared by content hash, so memory use does not depend on
+    the size of the dataset.
+
+    Args:
+        dataset_id (PydanticObjectId): The dataset, not one of its releases.
+        base (Optional[DatasetFreezeDB]): The release to compare from, the working draft if None.
+        target (Optional[DatasetFreezeDB]): The release to compare to, the working draft if None.
+    """
+    async for left, right in _merge(
+        _entries(FolderDB, FolderFreezeDB, dataset_id, base),
+        _entries(FolderDB, FolderFreezeDB, dataset_id, target),
+    ):
+        if (change := _change("folder", left, right)) is not None:
+            yield change
+
+    pairs: List[Tuple[_Entry, _Entry]] = []
+    async for left, right in _merge(
+        _entries(FileDB, FileFreezeDB, dataset_id, base),
+        _entries(FileDB, FileFreezeDB, dataset_id, target),
+    ):
+        if (change := _change("file", left, right)) is not None:
+            yield change
+        if left is not None and right is not None:
+            pairs.append((left, right))
+        if len(pairs) >= DIFF_BATCH_SIZE:
+            for change in await _metadata_changes("files", pairs, base, target):
+                yield change
+            pairs = []
+    if len(pairs) > 0:
+        for change in await _metadata_changes("files", pairs, base, target):
+            yield change
+
+    datasets = [
+        _Entry(
+            dataset_id, release.id if release is not None else dataset_id, None, None
+        )
+        for release in (base, target)
+    ]
+    for change in await _metadata_changes(
+        "datasets", [(datasets[0], datasets[1])], base, target
+    ):
+        yield change
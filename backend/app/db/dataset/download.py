@@ -1,6 +1,42 @@
-from app.models.datasets import DatasetDB, DatasetFreezeDB
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type, Union
+
+from app.config import settings
+from app.db.folder.hierarchy import _get_folder_paths
+from app.models.datasets import DatasetDB, DatasetDBViewList, DatasetFreezeDB
+from app.models.files import FileDBViewList
+from app.models.metadata import MetadataDB, MetadataDBViewList
+from app.models.users import UserOut
+from app.storage.backend import (
+    ObjectNotFoundError,
+    StorageBackend,
+    StoredObject,
+    UploadedPart,
+)
+from app.storage.prefetch import prefetch_streams
+from app.storage.responses import object_response
+from app.storage.zipstream import ZipStream
 from beanie import PydanticObjectId
 from beanie.odm.operators.update.general import Inc
+from beanie.operators import In
+from bson import ObjectId, json_util
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from rocrate.model.person import Person
+from rocrate.rocrate import ROCrate
+
+logger = logging.getLogger(__name__)
+
+# metadata of this many files is fetched with one query while packaging a dataset
+METADATA_BATCH_SIZE = 1000
+
+# frozen dataset id -> archive build running in this process
+_archive_builds: Dict[str, asyncio.Task] = {}
 
 
 async def _increment_data_downloads(dataset_id: str):
@@ -19,3 +55,303 @@ async def _increment_data_downloads(dataset_id: str):
         )
     ) is not None:
         await dataset.update(Inc({DatasetFreezeDB.downloads: 1}))
+
+
+async def _files_with_metadata(
+    dataset_id: Union[str, ObjectId],
+    metadata_model: Type[Union[MetadataDB, MetadataDBViewList]],
+) -> AsyncIterator[Tuple[FileDBViewList, List]]:
+    """
+    Every file of a dataset together with its own metadata. Metadata is fetched with one query per
+    METADATA_BATCH_SIZE files instead of one query per file.
+
+    Args:
+        dataset_id (Union[str, ObjectId]): The dataset whose files to list.
+        metadata_model (Type[Union[MetadataDB, MetadataDBViewList]]): Collection or view to read metadata from.
+    Returns:
+        AsyncIterator[Tuple[FileDBViewList, List]]: Each file and the metadata documents attached to it.
+    """
+
+    async def with_metadata(batch: List[FileDBViewList]):
+        by_resource: Dict[PydanticObjectId, List] = {}
+        async for metadata in metadata_model.find(
+            In(metadata_model.resource.resource_id, [file.id for file in batch])
+        ):
+            by_resource.setdefault(metadata.resource.resource_id, []).append(metadata)
+        return [(file, by_resource.get(file.id, [])) for file in batch]
+
+    batch = []
+    async for file in FileDBViewList.find(
+        FileDBViewList.dataset_id == ObjectId(dataset_id)
+    ):
+        batch.append(file)
+        if len(batch) == METADATA_BATCH_SIZE:
+            for item in await with_metadata(batch):
+                yield item
+            batch = []
+    if len(batch) > 0:
+        for item in await with_metadata(batch):
+            yield item
+
+
+def _archive_name(dataset: DatasetDBViewList) -> str:
+    """Name of the zip a dataset (or one of its released versions) is downloaded as."""
+    version_name = (
+        f"-v{dataset.frozen_version_num}"
+        if dataset.frozen and dataset.frozen_version_num > 0
+        else ""
+    )
+    return dataset.name + version_name + ".zip"
+
+
+async def _stream_dataset_archive(
+    dataset: DatasetDBViewList,
+    fs: StorageBackend,
+    metadata_model: Type[Union[MetadataDB, MetadataDBViewList]] = MetadataDB,
+    user: Optional[UserOut] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream a dataset as a BagIt/RO-Crate zip. Files are read from storage and written into the archive one chunk at a
+    time, their MD5 for manifest-md5.txt is computed on the way through, and the tag files and ro-crate-metadata.json
+    are written at the end once everything has been seen.
+
+    Args:
+        dataset (DatasetDBViewList): The dataset to package.
+        fs (StorageBackend): The storage backend holding the file bytes.
+        metadata_model (Type[Union[MetadataDB, MetadataDBViewList]]): Collection or view to read metadata from.
+        user (Optional[UserOut]): The user downloading, recorded as contact of the bag if given.
+    Returns:
+        AsyncIterator[bytes]: The archive bytes.
+    """
+    dataset_id = str(dataset.id)
+    archive = ZipStream()
+    crate = ROCrate()
+    if user is not None:
+        user_full_name = user.first_name + " " + user.last_name
+        crate.add(Person(crate, str(user.id), properties={"name": user_full_name}))
+
+    bagit = (
+        "Bag-Software-Agent: clowder.ncsa.illinois.edu\n"
+        + "Bagging-Date: "
+        + str(datetime.datetime.now())
+        + "\n"
+    )
+    bag_info = "BagIt-Version: 0.97\nTag-File-Character-Encoding: UTF-8\n"
+    manifest = ""
+
+    def add_entry(dest_path: str, content: str) -> bytes:
+        crate.add_file(
+            dest_path=dest_path, properties={"name": os.path.basename(dest_path)}
+        )
+        return archive.write_bytes(dest_path, content.encode())
+
+    # Write dataset metadata if found
+    metadata = await metadata_model.find(
+        metadata_model.resource.resource_id == ObjectId(dataset_id)
+    ).to_list()
+    if len(metadata) > 0:
+        yield add_entry("metadata/_dataset_metadata.json", json_util.dumps(metadata))
+
+    bag_size = 0  # bytes
+    file_count = 0
+
+    # one query for the whole folder tree instead of walking up from every file
+    folder_paths = await _get_folder_paths(dataset_id)
+
+    async def open_file(item: Tuple[FileDBViewList, List]) -> AsyncIterator[bytes]:
+        file = item[0]
+        # find the bytes id
+        # if it's working draft file_id == origin_id
+        # if it's published origin_id points to the raw bytes
+        bytes_file_id = str(file.origin_id) if file.origin_id else str(file.id)
+        return await fs.get_stream(bytes_file_id)
+
+    # upcoming files are downloaded while earlier ones are being compressed and sent
+    async for (file, file_metadata), chunks in prefetch_streams(
+        _files_with_metadata(dataset_id, metadata_model),
+        open_file,
+        lambda item: item[0].bytes or None,
+        settings.ARCHIVE_PREFETCH_PARALLELISM,
+        settings.ARCHIVE_PREFETCH_BYTE_BUDGET,
+    ):
+        file_count += 1
+        file_name = folder_paths.get(file.folder_id, "") + file.name
+
+        md5 = hashlib.md5()
+
+        async def hashed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+            nonlocal bag_size
+            async for chunk in chunks:
+                md5.update(chunk)
+                bag_size += len(chunk)
+                yield chunk
+
+        dest_path = "data/" + file_name
+        crate.add_file(dest_path=dest_path, properties={"name": file_name})
+        async for data in archive.write_stream(dest_path, hashed(chunks)):
+            yield data
+        manifest += md5.hexdigest() + " " + file_name + "\n"
+
+        if len(file_metadata) > 0:
+            yield add_entry(
+                "metadata/" + file_name + "_metadata.json",
+                json_util.dumps(file_metadata),
+            )
+
+    bag_size_kb = bag_size / 1024
+    bagit += "Bag-Size: " + str(bag_size_kb) + " kB" + "\n"
+    bagit += "Payload-Oxum: " + str(bag_size) + "." + str(file_count) + "\n"
+    bagit += "Internal-Sender-Identifier: " + dataset_id + "\n"
+    bagit += "Internal-Sender-Description: " + dataset.description + "\n"
+    if user is not None:
+        bagit += "Contact-Name: " + user_full_name + "\n"
+        bagit += "Contact-Email: " + user.email + "\n"
+    yield add_entry("bagit.txt", bagit)
+    yield add_entry("manifest-md5.txt", manifest)
+    yield add_entry("bag-info.txt", bag_info)
+
+    # Generate tag manifest file
+    tagmanifest = ""
+    for name, content in [
+        ("bagit.txt", bagit),
+        ("manifest-md5.txt", manifest),
+        ("bag-info.txt", bag_info),
+    ]:
+        tagmanifest += hashlib.md5(content.encode()).hexdigest() + " " + name + "\n"
+    yield add_entry("tagmanifest-md5.txt", tagmanifest)
+
+    yield archive.write_bytes(
+        "ro-crate-metadata.json",
+        json.dumps(crate.metadata.generate(), indent=4, sort_keys=True).encode(),
+    )
+    yield archive.close()
+
+
+def _frozen_archive_key(frozen_dataset_id: Union[str, ObjectId]) -> str:
+    """Storage key of the prebuilt archive of a released dataset version."""
+    return f"{frozen_dataset_id}.zip"
+
+
+async def _frozen_archive_ready(
+    frozen_dataset_id: Union[str, ObjectId], fs: StorageBackend
+) -> bool:
+    """Whether the archive of a released dataset version has been built and can be served from storage."""
+    try:
+        await fs.stat(_frozen_archive_key(frozen_dataset_id))
+        return True
+    except ObjectNotFoundError:
+        return False
+
+
+async def _build_frozen_archive(
+    frozen_dataset: Union[DatasetDBViewList, DatasetFreezeDB], fs: StorageBackend
+) -> StoredObject:
+    """
+    Assemble the archive of a released dataset version and store it under its archive key. The archive is uploaded in
+    parts as it is produced, so only one part is held in memory, and it only becomes visible once complete.
+
+    Args:
+        frozen_dataset (Union[DatasetDBViewList, DatasetFreezeDB]): The released dataset version.
+        fs (StorageBackend): The storage backend holding the file bytes and the archive.
+    Returns:
+        StoredObject: The stored archive.
+    """
+    key = _frozen_archive_key(frozen_dataset.id)
+    upload_id = await fs.create_multipart(key, "application/zip")
+    parts = []
+    buffer = bytearray()
+
+    async def upload_buffer():
+        part_number = len(parts) + 1
+        etag = await fs.upload_part(key, upload_id, part_number, bytes(buffer))
+        parts.append(UploadedPart(part_number=part_number, etag=etag, size=len(buffer)))
+        buffer.clear()
+
+    try:
+        # not tied to the downloading user, so there is no contact in the bag
+        async for data in _stream_dataset_archive(
+            frozen_dataset, fs, MetadataDBViewList
+        ):
+            buffer += data
+            if len(buffer) >= settings.MINIO_UPLOAD_CHUNK_SIZE:
+                await upload_buffer()
+        if len(buffer) > 0 or len(parts) == 0:
+            await upload_buffer()
+        return await fs.complete_multipart(key, upload_id, parts)
+    except (Exception, asyncio.CancelledError):
+        await fs.abort_multipart(key, upload_id)
+        raise
+
+
+def _schedule_frozen_archive(
+    frozen_dataset: Union[DatasetDBViewList, DatasetFreezeDB], fs: StorageBackend
+):
+    """Start building the archive of a released dataset version in the background unless it is already being built."""
+    dataset_id = str(frozen_dataset.id)
+    if not settings.CACHE_FROZEN_ARCHIVES or dataset_id in _archive_builds:
+        return
+
+    def done(task: asyncio.Task):
+        _archive_builds.pop(dataset_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                f"Building archive of dataset {dataset_id} failed: {task.exception()}"
+            )
+
+    task = asyncio.create_task(_build_frozen_archive(frozen_dataset, fs))
+    _archive_builds[dataset_id] = task
+    task.add_done_callback(done)
+
+
+async def _delete_frozen_archive(
+    frozen_dataset_id: Union[str, ObjectId], fs: StorageBackend
+):
+    """Stop a running build and remove the prebuilt archive of a released dataset version."""
+    if (task := _archive_builds.pop(str(frozen_dataset_id), None)) is not None:
+        task.cancel()
+        try:
+            await task
+        except (Exception, asyncio.CancelledError):
+            pass
+    await fs.delete_many([_frozen_archive_key(frozen_dataset_id)])
+
+
+async def _dataset_archive_response(
+    request: Request,
+    dataset: DatasetDBViewList,
+    fs: StorageBackend,
+    metadata_model: Type[Union[MetadataDB, MetadataDBViewList]] = MetadataDB,
+    user: Optional[UserOut] = None,
+) -> Response:
+    """
+    Response sending the archive of a dataset. Released versions are served from their prebuilt archive, with Range
+    support, once it exists; until then the archive is streamed as it is assembled and a build is started.
+
+    Args:
+        request (Request): The download request.
+        dataset (DatasetDBViewList): The dataset or released version to download.
+        fs (StorageBackend): The storage backend.
+        metadata_model (Type[Union[MetadataDB, MetadataDBViewList]]): Collection or view to read metadata from.
+        user (Optional[UserOut]): The user downloading, recorded as contact of a streamed bag if given.
+    Returns:
+        Response: The archive response.
+    """
+    zip_name = _archive_name(dataset)
+    if dataset.frozen and settings.CACHE_FROZEN_ARCHIVES:
+        if await _frozen_archive_ready(dataset.id, fs):
+            return await object_response(
+                request,
+                fs,
+                _frozen_archive_key(dataset.id),
+                filename=zip_name,
+                media_type="application/x-zip-compressed",
+            )
+        _schedule_frozen_archive(dataset, fs)
+
+    # Bytes are sent as the archive is assembled
+    response = StreamingResponse(
+        _stream_dataset_archive(dataset, fs, metadata_model, user),
+        media_type="application/x-zip-compressed",
+    )
+    response.headers["Content-Disposition"] = "attachment; filename=%s" % zip_name
+    return response
@@ -0,0 +1,594 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+
+from app import dependencies
+from app.config import settings
+from app.db import role_cache
+from app.db.dataset.diff import _content_hash
+from app.db.dataset.download import _schedule_frozen_archive
+from app.db.dataset.version import _delete_frozen_dataset
+from app.models.authorization import AuthorizationDB, RoleType
+from app.models.datasets import DatasetDB, DatasetFreezeDB
+from app.models.files import FileDB, FileFreezeDB
+from app.models.folders import FolderDB, FolderFreezeDB
+from app.models.freeze_jobs import FreezeJobDB, FreezeJobStatus
+from app.models.metadata import MetadataDB, MetadataFreezeDB
+from app.models.thumbnails import ThumbnailDB, ThumbnailFreezeDB
+from app.models.users import UserOut
+from app.models.visualization_config import (
+    VisualizationConfigDB,
+    VisualizationConfigFreezeDB,
+)
+from app.models.visualization_data import VisualizationDataDB, VisualizationDataFreezeDB
+from app.storage.backend import StorageBackend
+from beanie import Document, PydanticObjectId
+from beanie.operators import LT, And, Exists, In, Or
+from pymongo import DESCENDING
+
+logger = logging.getLogger(__name__)
+
+# documents per insert_many, and files whose metadata and visualizations are looked up together
+FREEZE_BATCH_SIZE = 1000
+
+IdMap = Dict[PydanticObjectId, PydanticObjectId]
+
+
+def _frozen_copy(document: Document, model: Type[Document], **changes) -> Document:
+    """Released copy of a document. `changes` must include the new `id`, references to other released documents are
+    passed the same way. The content hash is recorded for the models that keep one."""
+    data = document.dict()
+    data["origin_id"] = data.pop("id")
+    data["frozen"] = True
+    if "content_hash" in model.__fields__:
+        data["content_hash"] = _content_hash(document)
+    data.update(changes)
+    return model(**data)
+
+
+class _FreezeWriter:
+    """Writes released documents in ordered `insert_many` batches and remembers every ID it tried to write, so a failed
+    release can be removed again. Documents shared with the previous release are tracked the same way.
+    """
+
+    def __init__(self, job: FreezeJobDB):
+        self.job = job
+        self.written: Dict[Type[Document], List[PydanticObjectId]] = defaultdict(list)
+        self.shared: Dict[Type[Document], List[PydanticObjectId]] = defaultdict(list)
+
+    async def write(self, model: Type[Document], documents: List[Document]):
+        for start in range(0, len(documents), FREEZE_BATCH_SIZE):
+            batch = documents[start : start + FREEZE_BATCH_SIZE]
+            # recorded before inserting, a batch that fails halfway has still written its first documents
+            self.written[model].extend(document.id for document in batch)
+            await model.insert_many(batch, ordered=True)
+            _count(self.job.written, model, len(batch))
+
+    async def share(self, model: Type[Document], ids: List[PydanticObjectId]):
+        """Add the release to released documents that did not change since they were written."""
+        for start in range(0, len(ids), FREEZE_BATCH_SIZE):
+            batch = ids[start : start + FREEZE_BATCH_SIZE]
+            self.shared[model].extend(batch)
+            await model.find(In(model.id, batch)).update(
+                {"$addToSet": {"release_ids": self.job.frozen_dataset_id}}
+            )
+            _count(self.job.shared, model, len(batch))
+
+    async def rollback(self):
+        # the dataset and its authorization are written last, remove them first so the release disappears at once
+        for model in reversed(list(self.written)):
+            ids = self.written[model]
+            for start in range(0, len(ids), FREEZE_BATCH_SIZE):
+                await model.find(
+                    In(model.id, ids[start : start + FREEZE_BATCH_SIZE])
+                ).delete()
+        for model, ids in self.shared.items():
+            for start in range(0, len(ids), FREEZE_BATCH_SIZE):
+                await model.find(
+                    In(model.id, ids[start : start + FREEZE_BATCH_SIZE])
+                ).update({"$pull": {"release_ids": self.job.frozen_dataset_id}})
+        # insert_many fires no hooks, drop what was read while the release was half written
+        role_cache.invalidate_dataset(self.job.frozen_dataset_id)
+
+
+def _count(counts: Dict[str, int], model: Type[Document], documents: int):
+    collection = model.get_settings().name
+    counts[collection] = counts.get(collection, 0) + documents
+
+
+async def _batches(query, size: int = FREEZE_BATCH_SIZE) -> AsyncIterator[List]:
+    batch = []
+    async for document in query:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+async def _next_version_num(dataset_id: PydanticObjectId) -> int:
+    """Version number of the next release, counting releases that are still being written."""
+    latest = 0
+    if (
+        frozen_dataset := await DatasetFreezeDB.find(
+            DatasetFreezeDB.origin_id == dataset_id
+        )
+        .sort(("frozen_version_num", DESCENDING))
+        .first_or_none()
+    ) is not None:
+        latest = frozen_dataset.frozen_version_num
+    if (
+        job := await FreezeJobDB.find(
+            FreezeJobDB.dataset_id == dataset_id,
+            In(
+                FreezeJobDB.status,
+                [FreezeJobStatus.CREATED, FreezeJobStatus.PROCESSING],
+            ),
+        )
+        .sort(("frozen_version_num", DESCENDING))
+        .first_or_none()
+    ) is not None:
+        latest = max(latest, job.frozen_version_num)
+    return latest + 1
+
+
+async def _previous_release(dataset_id: PydanticObjectId) -> Optional[DatasetFreezeDB]:
+    """Latest release whose files and folders the next one can share, if `FREEZE_SNAPSHOTS` is enabled."""
+    if not settings.FREEZE_SNAPSHOTS:
+        return None
+    return (
+        await DatasetFreezeDB.find(
+            DatasetFreezeDB.origin_id == dataset_id,
+            DatasetFreezeDB.deleted == False,  # noqa: E712
+        )
+        .sort(("frozen_version_num", DESCENDING))
+        .first_or_none()
+    )
+
+
+def _unchanged(current: Document, released: Document, **references) -> bool:
+    """Whether a released document still matches the current one, by content hash. `references` are the released
+    documents the copy would have to point at in the new release."""
+    return (
+        released.content_hash is not None
+        and released.content_hash == _content_hash(current)
+        and all(
+            getattr(released, field) == value for field, value in references.items()
+        )
+    )
+
+
+def _all_unchanged(
+    current: List[Document],
+    released: List[Document],
+    references: Callable[[Document, Document], dict] = lambda document, copy: {},
+) -> bool:
+    released_by_origin = {document.origin_id: document for document in released}
+    if len(current) != len(released):
+        return False
+    for document in current:
+        copy = released_by_origin.get(document.id)
+        if copy is None or not _unchanged(document, copy, **references(document, copy)):
+            return False
+    return True
+
+
+async def _create_freeze_job(
+    dataset: DatasetDB, user: UserOut
+) -> Tuple[FreezeJobDB, DatasetFreezeDB]:
+    """
+    Reserve the next version of a dataset for a release.
+
+    Returns:
+        Tuple[FreezeJobDB, DatasetFreezeDB]: The job and the released dataset it will write. IDs of the released
+            dataset and its thumbnail are assigned up front so the release can be returned before it is written.
+    """
+    job = FreezeJobDB(
+        dataset_id=dataset.id,
+        frozen_dataset_id=PydanticObjectId(),
+        frozen_version_num=await _next_version_num(dataset.id),
+        creator=user,
+    )
+    await job.insert()
+    frozen_dataset = _frozen_copy(
+        dataset,
+        DatasetFreezeDB,
+        id=job.frozen_dataset_id,
+        frozen_version_num=job.frozen_version_num,
+        thumbnail_id=PydanticObjectId() if dataset.thumbnail_id else None,
+    )
+    return job, frozen_dataset
+
+
+async def _freeze_thumbnails(writer: _FreezeWriter, thumbnail_ids: IdMap):
+    if len(thumbnail_ids) == 0:
+        return
+    thumbnails = await ThumbnailDB.find(
+        In(ThumbnailDB.id, list(thumbnail_ids))
+    ).to_list()
+    await writer.write(
+        ThumbnailFreezeDB,
+        [
+            _frozen_copy(thumbnail, ThumbnailFreezeDB, id=thumbnail_ids[thumbnail.id])
+            for thumbnail in thumbnails
+        ],
+    )
+
+
+class _Attached(NamedTuple):
+    """Metadata and visualizations of one dataset or file."""
+
+    metadata: List[Document]
+    vis_configs: List[Document]
+    vis_data: List[Document]
+
+
+async def _load_attached(
+    collection: str, resource_ids: List[PydanticObjectId], frozen: bool = False
+) -> Dict[PydanticObjectId, _Attached]:
+    """Metadata and visualizations of a batch of datasets or files by their ID, from the released collections if
+    `frozen` is set."""
+    metadata_model, vis_config_model, vis_data_model = (
+        (MetadataFreezeDB, VisualizationConfigFreezeDB, VisualizationDataFreezeDB)
+        if frozen
+        else (MetadataDB, VisualizationConfigDB, VisualizationDataDB)
+    )
+    attached = {resource_id: _Attached([], [], []) for resource_id in resource_ids}
+    if len(resource_ids) == 0:
+        return attached
+    async for md in metadata_model.find(
+        In(metadata_model.resource.resource_id, resource_ids),
+        metadata_model.resource.collection == collection,
+    ):
+        attached[md.resource.resource_id].metadata.append(md)
+    vis_config_resources = {}
+    async for vis_config in vis_config_model.find(
+        In(vis_config_model.resource.resource_id, resource_ids),
+        vis_config_model.resource.collection == collection,
+    ):
+        attached[vis_config.resource.resource_id].vis_configs.append(vis_config)
+        vis_config_resources[vis_config.id] = vis_config.resource.resource_id
+    if len(vis_config_resources) > 0:
+        async for vd in vis_data_model.find(
+            In(vis_data_model.visualization_config_id, list(vis_config_resources))
+        ):
+            attached[vis_config_resources[vd.visualization_config_id]].vis_data.append(
+                vd
+            )
+    return attached
+
+
+def _attached_unchanged(current: _Attached, released: _Attached) -> bool:
+    vis_config_ids = {vc.origin_id: vc.id for vc in released.vis_configs}
+    return (
+        _all_unchanged(current.metadata, released.metadata)
+        and _all_unchanged(current.vis_configs, released.vis_configs)
+        and _all_unchanged(
+            current.vis_data,
+            released.vis_data,
+            lambda vd, copy: {
+                "visualization_config_id": vis_config_ids.get(
+                    vd.visualization_config_id
+                )
+            },
+        )
+    )
+
+
+async def _write_attached(
+    writer: _FreezeWriter,
+    attached: Dict[PydanticObjectId, _Attached],
+    resource_ids: IdMap,
+):
+    """Release metadata and visualizations, attached to the released resources in `resource_ids`."""
+    metadata, vis_configs, vis_data = [], [], []
+    for resource_id, documents in attached.items():
+        released_id = resource_ids[resource_id]
+        metadata += [
+            _frozen_copy(
+                md,
+                MetadataFreezeDB,
+                id=PydanticObjectId(),
+                resource={**md.resource.dict(), "resource_id": released_id},
+            )
+            for md in documents.metadata
+        ]
+        vis_config_ids = {vc.id: PydanticObjectId() for vc in documents.vis_configs}
+        vis_configs += [
+            _frozen_copy(
+                vc,
+                VisualizationConfigFreezeDB,
+                id=vis_config_ids[vc.id],
+                resource={**vc.resource.dict(), "resource_id": released_id},
+            )
+            for vc in documents.vis_configs
+        ]
+        vis_data += [
+            _frozen_copy(
+                vd,
+                VisualizationDataFreezeDB,
+                id=PydanticObjectId(),
+                visualization_config_id=vis_config_ids[vd.visualization_config_id],
+            )
+            for vd in documents.vis_data
+        ]
+    await writer.write(MetadataFreezeDB, metadata)
+    await writer.write(VisualizationConfigFreezeDB, vis_configs)
+    await writer.write(VisualizationDataFreezeDB, vis_data)
+
+
+async def _freeze_folders(
+    writer: _FreezeWriter, dataset: DatasetDB, previous: Optional[DatasetFreezeDB]
+) -> IdMap:
+    """Release the whole folder tree of a dataset, read with a single query. Folders of the previous release are shared
+    if neither they nor any enclosing folder changed."""
+    folders = {
+        folder.id: folder
+        async for folder in FolderDB.find(FolderDB.dataset_id == dataset.id)
+    }
+    released = {}
+    if previous is not None:
+        released = {
+            folder.origin_id: folder
+            async for folder in FolderFreezeDB.find(
+                FolderFreezeDB.release_ids == previous.id
+            )
+        }
+    folder_ids: IdMap = {}
+    copies: List[Document] = []
+    shared: List[PydanticObjectId] = []
+
+    visiting = set()
+
+    def assign(folder: FolderDB):
+        # enclosing folders first, a folder is only shared if its parent is. A broken tree is cut where a cycle closes.
+        visiting.add(folder.id)
+        parent = folder.parent_folder
+        if parent in folders and parent not in folder_ids and parent not in visiting:
+            assign(folders[parent])
+        references = {
+            "parent_folder": folder_ids.get(folder.parent_folder, folder.parent_folder),
+            "ancestors": [folder_ids.get(a, a) for a in folder.ancestors],
+        }
+        copy = released.get(folder.id)
+        if copy is not None and _unchanged(folder, copy, **references):
+            folder_ids[folder.id] = copy.id
+            shared.append(copy.id)
+        else:
+            folder_ids[folder.id] = PydanticObjectId()
+            copies.append(
+                _frozen_copy(
+                    folder,
+                    FolderFreezeDB,
+                    id=folder_ids[folder.id],
+                    dataset_id=writer.job.frozen_dataset_id,
+                    release_ids=[writer.job.frozen_dataset_id],
+                    **references,
+                )
+            )
+
+    for folder in folders.values():
+        if folder.id not in folder_ids:
+            assign(folder)
+    await writer.write(FolderFreezeDB, copies)
+    await writer.share(FolderFreezeDB, shared)
+    return folder_ids
+
+
+async def _freeze_files(
+    writer: _FreezeWriter,
+    files: List[FileDB],
+    folder_ids: IdMap,
+    previous: Optional[DatasetFreezeDB],
+):
+    """Release a batch of files. Files of the previous release are shared, along with their metadata and
+    visualizations, if none of these changed and the file is still in the same folder.
+    """
+    attached = await _load_attached("files", [file.id for file in files])
+    released: Dict[PydanticObjectId, FileFreezeDB] = {}
+    released_attached: Dict[PydanticObjectId, _Attached] = {}
+    if previous is not None:
+        released = {
+            file.origin_id: file
+            async for file in FileFreezeDB.find(
+                In(FileFreezeDB.origin_id, [file.id for file in files]),
+                FileFreezeDB.release_ids == previous.id,
+            )
+        }
+        released_attached = await _load_attached(
+            "files", [file.id for file in released.values()], frozen=True
+        )
+
+    file_ids: IdMap = {}
+    thumbnail_ids: IdMap = {}
+    copies: List[Document] = []
+    shared: List[PydanticObjectId] = []
+    for file in files:
+        folder_id = folder_ids.get(file.folder_id, file.folder_id)
+        copy = released.get(file.id)
+        if (
+            copy is not None
+            # the hash covers the thumbnail by its current ID
+            and _unchanged(file, copy, folder_id=folder_id)
+            and _attached_unchanged(attached[file.id], released_attached[copy.id])
+        ):
+            shared.append(copy.id)
+            continue
+        file_ids[file.id] = PydanticObjectId()
+        if file.thumbnail_id is not None:
+            thumbnail_ids[file.thumbnail_id] = PydanticObjectId()
+        copies.append(
+            _frozen_copy(
+                file,
+                FileFreezeDB,
+                id=file_ids[file.id],
+                dataset_id=writer.job.frozen_dataset_id,
+                release_ids=[writer.job.frozen_dataset_id],
+                folder_id=folder_id,
+                thumbnail_id=thumbnail_ids.get(file.thumbnail_id),
+            )
+        )
+
+    await _freeze_thumbnails(writer, thumbnail_ids)
+    await writer.write(FileFreezeDB, copies)
+    await _write_attached(
+        writer, {file_id: attached[file_id] for file_id in file_ids}, file_ids
+    )
+    await writer.share(FileFreezeDB, shared)
+
+
+async def _freeze_dataset(
+    job: FreezeJobDB,
+    dataset: DatasetDB,
+    frozen_dataset: DatasetFreezeDB,
+    user: UserOut,
+    fs: StorageBackend,
+):
+    """
+    Copy a dataset with its folders, files, metadata, thumbnails and visualizations into a released version.
+
+    Released IDs are assigned here rather than by the database, so references between released documents are known
+    before anything is written and every collection is written in batches. The released dataset and its authorization
+    are inserted last: until then the release is invisible, and if anything fails all documents written so far are
+    deleted and the job is marked as failed.
+
+    With `FREEZE_SNAPSHOTS` only what changed since the previous release is copied. Files and folders that did not
+    change, with everything attached to them, get the new release added to their `release_ids` instead.
+
+    Args:
+        job (FreezeJobDB): The job reserving the version, updated with progress as the release is written.
+        dataset (DatasetDB): The dataset to release.
+        frozen_dataset (DatasetFreezeDB): The released dataset created with the job.
+        user (UserOut): Owner of the release.
+        fs (StorageBackend): The storage backend, used to prebuild the archive of the release.
+    """
+    writer = _FreezeWriter(job)
+    try:
+        await job.set(
+            {
+                FreezeJobDB.status: FreezeJobStatus.PROCESSING,
+                FreezeJobDB.started: datetime.utcnow(),
+                FreezeJobDB.heartbeat: datetime.utcnow(),
+                FreezeJobDB.stage: "folders",
+                FreezeJobDB.total_files: await FileDB.find(
+                    FileDB.dataset_id == dataset.id
+                ).count(),
+                FreezeJobDB.total_folders: await FolderDB.find(
+                    FolderDB.dataset_id == dataset.id
+                ).count(),
+            }
+        )
+        previous = await _previous_release(dataset.id)
+        if previous is not None:
+            job.previous_frozen_dataset_id = previous.id
+        folder_ids = await _freeze_folders(writer, dataset, previous)
+        job.frozen_folders = len(folder_ids)
+        job.stage = "files"
+        await job.save()
+
+        async for files in _batches(
+            FileDB.find(FileDB.dataset_id == dataset.id).sort("_id")
+        ):
+            await _freeze_files(writer, files, folder_ids, previous)
+            job.frozen_files += len(files)
+            await job.save()
+
+        job.stage = "dataset"
+        await job.save()
+        if dataset.thumbnail_id is not None:
+            await _freeze_thumbnails(
+                writer, {dataset.thumbnail_id: frozen_dataset.thumbnail_id}
+            )
+        await _write_attached(
+            writer,
+            await _load_attached("datasets", [dataset.id]),
+            {dataset.id: frozen_dataset.id},
+        )
+        await writer.write(DatasetFreezeDB, [frozen_dataset])
+        await writer.write(
+            AuthorizationDB,
+            [
+                AuthorizationDB(
+                    id=PydanticObjectId(),
+                    dataset_id=frozen_dataset.id,
+                    role=RoleType.OWNER,
+                    creator=user.email,
+                )
+            ],
+        )
+        # insert_many fires no hooks, a missing role or status read before now must not stay cached
+        role_cache.invalidate_dataset(frozen_dataset.id)
+    except Exception as e:
+        logger.error(f"Releasing dataset {dataset.id} failed: {e}")
+        await writer.rollback()
+        job.status = FreezeJobStatus.ERROR
+        job.error = str(e)
+        job.finished = datetime.utcnow()
+        await job.save()
+        return
+
+    job.status = FreezeJobStatus.SUCCEEDED
+    job.stage = None
+    job.finished = datetime.utcnow()
+    await job.save()
+
+    # the release never changes, zip it once for all later downloads
+    _schedule_frozen_archive(frozen_dataset, fs)
+
+
+async def _remove_interrupted_releases(fs: StorageBackend) -> int:
+    """
+    Remove the releases of jobs that stopped making progress for `FREEZE_JOB_TIMEOUT` seconds and mark the jobs as
+    failed. What a job wrote is found by its reserved release ID: documents copied for the release are deleted and the
+    release is pulled from the `release_ids` of documents it shared, as when a release is deleted. The version number
+    is free again afterwards.
+
+    Returns:
+        int: The number of interrupted jobs.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.FREEZE_JOB_TIMEOUT)
+    interrupted = 0
+    async for job in FreezeJobDB.find(
+        In(FreezeJobDB.status, [FreezeJobStatus.CREATED, FreezeJobStatus.PROCESSING]),
+        Or(
+            LT(FreezeJobDB.heartbeat, cutoff),
+            # jobs created before heartbeats were recorded
+            And(Exists(FreezeJobDB.heartbeat, False), LT(FreezeJobDB.created, cutoff)),
+        ),
+    ):
+        frozen_dataset = await DatasetFreezeDB.get(job.frozen_dataset_id)
+        if frozen_dataset is None:
+            # not written yet, the reserved ID finds everything else the job wrote
+            frozen_dataset = DatasetFreezeDB.construct(id=job.frozen_dataset_id)
+        await _delete_frozen_dataset(frozen_dataset, fs, hard_delete=True)
+        job.status = FreezeJobStatus.ERROR
+        job.error = "Interrupted before the release was written"
+        job.finished = datetime.utcnow()
+        await job.save()
+        interrupted += 1
+    return interrupted
+
+
+async def freeze_job_sweeper():
+    """Periodically remove releases whose job was interrupted, see `_remove_interrupted_releases`. Runs for the
+    lifetime of the app."""
+    while True:
+        try:
+            async for fs in dependencies.get_fs():
+                if (interrupted := await _remove_interrupted_releases(fs)) > 0:
+                    logger.info(f"Removed {interrupted} interrupted releases")
+        except Exception as e:
+            logger.error(f"Could not remove interrupted releases: {e}")
+        await asyncio.sleep(settings.FREEZE_JOB_SWEEP_INTERVAL)
@@ -0,0 +1,462 @@
+import asyncio
+import io
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterable, Optional, Tuple
+
+from anyio import from_thread
+from app.config import settings
+from app.db.dataset.version import remove_file_entry
+from app.models.authorization import AuthorizationDB, RoleType
+from app.models.datasets import DatasetDB, DatasetOut
+from app.models.files import FileDB
+from app.models.folders import FolderDB
+from app.models.ingestion import IngestionJobDB, IngestionJobStatus
+from app.models.users import UserOut
+from app.routers.files import add_file_entry
+from app.search.index import index_dataset
+from app.storage.backend import StorageBackend
+from beanie import PydanticObjectId
+from elasticsearch import Elasticsearch
+from pika.adapters.blocking_connection import BlockingChannel
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# how many error messages a job keeps
+MAX_JOB_ERRORS = 100
+
+# tar members up to this size are buffered in memory while waiting to be uploaded, larger ones in a temporary file
+TAR_SPOOL_SIZE = 1024 * 1024
+
+# archive suffix -> compression of a tar stream ("*" lets tarfile detect gzip, bzip2 and xz)
+TAR_SUFFIXES = {
+    ".tar": "*",
+    ".tar.gz": "*",
+    ".tgz": "*",
+    ".tar.bz2": "*",
+    ".tar.xz": "*",
+    ".tar.zst": "zst",
+    ".tzst": "zst",
+}
+
+# (path inside the archive, size in bytes, opens the member for reading or None for a folder)
+ArchiveMember = Tuple[str, int, Optional[Callable[[], BinaryIO]]]
+
+
+def _archive_suffix(filename: str) -> Optional[str]:
+    """Suffix identifying the archive format (".zip" or one of TAR_SUFFIXES), None if it is not supported."""
+    for suffix in [".zip"] + sorted(TAR_SUFFIXES, key=len, reverse=True):
+        if filename.lower().endswith(suffix):
+            return suffix
+    return None
+
+
+def _skip_member(path: str) -> bool:
+    # TODO: These are not visible in OSX 10.3+ and hard to delete. Leaving this in to minimize user frustration.
+    return "__MACOSX" in path or path.endswith(".DS_Store")
+
+
+def _normalize_member_path(path: str) -> str:
+    """Archive paths always use "/"; drop leading slashes and "." or empty parts so they map onto folder names."""
+    parts = [part for part in path.split("/") if part not in ("", ".")]
+    return "/".join(parts)
+
+
+async def _create_archive_dataset(
+    filename: str, suffix: str, user: UserOut, es: Elasticsearch
+) -> Tuple[DatasetDB, IngestionJobDB]:
+    """Create the dataset an archive is unpacked into, owned by the uploader, and the job tracking it."""
+    dataset = DatasetDB(
+        name=filename[: -len(suffix)],
+        description="Uploaded as %s" % filename,
+        creator=user,
+    )
+    await dataset.insert()
+    await AuthorizationDB(
+        dataset_id=dataset.id,
+        role=RoleType.OWNER,
+        creator=user.email,
+    ).save()
+    await index_dataset(es, DatasetOut(**dataset.dict()), [user.email])
+
+    job = IngestionJobDB(dataset_id=dataset.id, filename=filename, creator=user)
+    await job.insert()
+    return dataset, job
+
+
+async def _create_folders(
+    dataset_id: PydanticObjectId,
+    folder_paths: Iterable[str],
+    user: UserOut,
+    folder_lookup: Dict[str, PydanticObjectId],
+) -> int:
+    """
+    Create the folders at `folder_paths`, and any of their ancestors, that are not in `folder_lookup` yet with a single
+    bulk insert. IDs are assigned up front so children can reference their parents before anything is written.
+
+    Args:
+        dataset_id (PydanticObjectId): Dataset receiving the folders.
+        folder_paths (Iterable[str]): Paths of the folders, e.g. "outer/inner".
+        user (UserOut): Creator of the folders.
+        folder_lookup (Dict[str, PydanticObjectId]): Folder ID by path of the folders created so far, updated in place.
+    Returns:
+        int: Number of folders created.
+    """
+    paths = set()
+    for path in folder_paths:
+        while path != "" and path not in paths and path not in folder_lookup:
+            paths.add(path)
+            path = posixpath.dirname(path)
+
+    folders = []
+    # parents sort before their children
+    for path in sorted(paths, key=lambda p: p.count("/")):
+        parents = [path[:i] for i, c in enumerate(path) if c == "/"]
+        folder = FolderDB(
+            id=PydanticObjectId(),
+            dataset_id=dataset_id,
+            name=posixpath.basename(path),
+            parent_folder=folder_lookup.get(posixpath.dirname(path)),
+            creator=user,
+            ancestors=[folder_lookup[parent] for parent in parents],
+            path=f"{path}/",
+        )
+        folder_lookup[path] = folder.id
+        folders.append(folder)
+    if len(folders) > 0:
+        await FolderDB.insert_many(folders)
+    return len(folders)
+
+
+async def _ingest_members(
+    job: IngestionJobDB,
+    dataset: DatasetDB,
+    members: AsyncIterator[ArchiveMember],
+    folder_lookup: Dict[str, PydanticObjectId],
+    user: UserOut,
+    fs: StorageBackend,
+    es: Elasticsearch,
+    rabbitmq_client: BlockingChannel,
+    count_files: bool = False,
+):
+    """
+    Store the members of an archive as files of a dataset as they arrive, ZIP_INGEST_PARALLELISM at a time, counting
+    progress on the job as each one finishes. Folders missing from `folder_lookup` are created on the way. A member
+    that fails is recorded on the job and does not stop the others.
+
+    Args:
+        count_files (bool): Add every member to the job's total, for archives that cannot be listed up front.
+    """
+    parallelism = max(settings.ZIP_INGEST_PARALLELISM, 1)
+    # bounded so reading the archive pauses while all uploads are busy
+    queue: asyncio.Queue = asyncio.Queue(maxsize=parallelism)
+
+    async def ingest_member(path: str, size: int, open_member: Callable):
+        new_file = FileDB(
+            name=posixpath.basename(path),
+            creator=user,
+            dataset_id=dataset.id,
+            folder_id=folder_lookup.get(posixpath.dirname(path)),
+        )
+        try:
+            # read straight out of the archive, nothing is extracted
+            reader = await run_in_threadpool(open_member)
+            try:
+                await add_file_entry(new_file, user, fs, es, rabbitmq_client, reader)
+            finally:
+                await run_in_threadpool(reader.close)
+        except Exception as e:
+            logger.error(f"Ingesting {path} into dataset {dataset.id} failed: {e}")
+            if new_file.id is not None:
+                # inserted before its bytes were stored, do not leave it listed without them
+                try:
+                    await remove_file_entry(new_file.id, fs, es)
+                except Exception as cleanup_error:
+                    logger.error(
+                        f"Removing file {new_file.id} of {path} failed: {cleanup_error}"
+                    )
+            await IngestionJobDB.find_one(IngestionJobDB.id == job.id).update(
+                {
+                    "$inc": {"failed_files": 1},
+                    "$push": {
+                        "errors": {"$each": [f"{path}: {e}"], "$slice": -MAX_JOB_ERRORS}
+                    },
+                }
+            )
+            return
+        await IngestionJobDB.find_one(IngestionJobDB.id == job.id).update(
+            {"$inc": {"processed_files": 1, "bytes": size}}
+        )
+
+    async def worker():
+        while (member := await queue.get()) is not None:
+            await ingest_member(*member)
+
+    workers = [asyncio.create_task(worker()) for _ in range(parallelism)]
+    try:
+        async for path, size, open_member in members:
+            if (
+                created := await _create_folders(
+                    dataset.id,
+                    [path if open_member is None else posixpath.dirname(path)],
+                    user,
+                    folder_lookup,
+                )
+            ) > 0:
+                await IngestionJobDB.find_one(IngestionJobDB.id == job.id).update(
+                    {"$inc": {"total_folders": created}}
+                )
+            if open_member is None:
+                continue
+            if count_files:
+                await IngestionJobDB.find_one(IngestionJobDB.id == job.id).update(
+                    {"$inc": {"total_files": 1}}
+                )
+            await queue.put((path, size, open_member))
+    finally:
+        # let the uploads already queued finish
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+
+async def _start_job(job: IngestionJobDB, total_files: int = 0, total_folders: int = 0):
+    await job.set(
+        {
+            IngestionJobDB.status: IngestionJobStatus.PROCESSING,
+            IngestionJobDB.started: datetime.utcnow(),
+            IngestionJobDB.total_files: total_files,
+            IngestionJobDB.total_folders: total_folders,
+        }
+    )
+
+
+async def _finish_job(job: IngestionJobDB, error: Optional[str] = None):
+    await job.sync()
+    if error is not None:
+        job.errors = (job.errors + [error])[-MAX_JOB_ERRORS:]
+    job.status = (
+        IngestionJobStatus.ERROR
+        if error is not None or job.failed_files > 0
+        else IngestionJobStatus.SUCCEEDED
+    )
+    job.finished = datetime.utcnow()
+    await job.save()
+
+
+async def _ingest_zip(
+    job: IngestionJobDB,
+    dataset: DatasetDB,
+    archive_path: str,
+    user: UserOut,
+    fs: StorageBackend,
+    es: Elasticsearch,
+    rabbitmq_client: BlockingChannel,
+):
+    """
+    Create the folders and files of a dataset from a zip archive on disk, then remove the archive. All folders are
+    created with one bulk insert before the files are uploaded.
+
+    Args:
+        job (IngestionJobDB): Job to report progress on.
+        dataset (DatasetDB): Dataset receiving the contents.
+        archive_path (str): Temporary copy of the uploaded zip, deleted when done.
+        user (UserOut): Creator of the new folders and files.
+        fs (StorageBackend): Storage for the file bytes.
+        es (Elasticsearch): Search index for the new files.
+        rabbitmq_client (BlockingChannel): Channel to submit new files to feeds.
+    """
+    try:
+        with zipfile.ZipFile(archive_path, "r") as zip_file:
+            files = []
+            folder_paths = []
+            for info in zip_file.infolist():
+                path = _normalize_member_path(info.filename)
+                if path == "" or _skip_member(path):
+                    continue
+                if info.is_dir():
+                    folder_paths.append(path)
+                else:
+                    files.append(
+                        (
+                            path,
+                            info.file_size,
+                            lambda info=info: zip_file.open(info, "r"),
+                        )
+                    )
+            folder_lookup = {}
+            await _create_folders(
+                dataset.id,
+                folder_paths + [posixpath.dirname(path) for path, _, _ in files],
+                user,
+                folder_lookup,
+            )
+            await _start_job(job, len(files), len(folder_lookup))
+
+            async def members() -> AsyncIterator[ArchiveMember]:
+                for member in files:
+                    yield member
+
+            await _ingest_members(
+                job, dataset, members(), folder_lookup, user, fs, es, rabbitmq_client
+            )
+        await _finish_job(job)
+    except Exception as e:
+        logger.error(f"Ingesting {job.filename} into dataset {dataset.id} failed: {e}")
+        await _finish_job(job, str(e))
+    finally:
+        os.remove(archive_path)
+
+
+class _ThreadStreamReader(io.RawIOBase):
+    """Blocking file object over an async iterator of bytes, for reading the request body from a worker thread."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+
+    async def _next_chunk(self) -> Optional[bytes]:
+        try:
+            return await self.chunks.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.buffer) == 0:
+            if (chunk := from_thread.run(self._next_chunk)) is None:
+                return 0
+            self.buffer = chunk
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+async def _tar_members(
+    chunks: AsyncIterator[bytes], compression: str
+) -> AsyncIterator[ArchiveMember]:
+    """
+    Read a tar stream front to back and yield its folders and files as they arrive. Nothing is seeked and only the
+    members waiting to be uploaded are buffered, each in memory up to TAR_SPOOL_SIZE and in a temporary file beyond.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The archive bytes, e.g. the request body.
+        compression (str): "zst" for zstd, "*" for uncompressed, gzip, bzip2 or xz.
+    """
+    loop_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def hand_over(member: ArchiveMember):
+        if stop.is_set():
+            raise RuntimeError("Ingestion was stopped")
+        from_thread.run(loop_queue.put, member)
+
+    def read_tar():
+        reader = io.BufferedReader(
+            _ThreadStreamReader(chunks), settings.MINIO_UPLOAD_CHUNK_SIZE
+        )
+        if compression == "zst":
+            reader = zstandard.ZstdDecompressor().stream_reader(reader)
+        mode = "r|" if compression == "zst" else f"r|{compression}"
+        with tarfile.open(fileobj=reader, mode=mode) as tar:
+            for info in tar:
+                path = _normalize_member_path(info.name)
+                if path == "" or _skip_member(path):
+                    continue
+                if info.isdir():
+                    hand_over((path, 0, None))
+                elif info.isfile():
+                    # the member can only be read now, before the stream moves on
+                    spooled = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_SIZE)
+                    shutil.copyfileobj(
+                        tar.extractfile(info), spooled, settings.MINIO_UPLOAD_CHUNK_SIZE
+                    )
+                    spooled.seek(0)
+                    hand_over((path, info.size, lambda spooled=spooled: spooled))
+
+    async def read_and_close():
+        try:
+            await run_in_threadpool(read_tar)
+        finally:
+            await loop_queue.put(None)
+
+    reading = asyncio.create_task(read_and_close())
+    try:
+        while (member := await loop_queue.get()) is not None:
+            yield member
+        # surface errors from reading the archive
+        await reading
+    finally:
+        # the reader thread cannot be cancelled, stop it and take what it is still handing over until it returns
+        stop.set()
+        while not reading.done():
+            getter = asyncio.ensure_future(loop_queue.get())
+            await asyncio.wait({getter, reading}, return_when=asyncio.FIRST_COMPLETED)
+            getter.cancel()
+        if not reading.cancelled():
+            # the reader failing because it was stopped is expected
+            reading.exception()
+
+
+async def _ingest_tar(
+    job: IngestionJobDB,
+    dataset: DatasetDB,
+    chunks: AsyncIterator[bytes],
+    compression: str,
+    user: UserOut,
+    fs: StorageBackend,
+    es: Elasticsearch,
+    rabbitmq_client: BlockingChannel,
+):
+    """
+    Create the folders and files of a dataset from a tar stream as its entries arrive. Folders are bulk inserted as
+    soon as an entry needs them and files are uploaded in parallel while the rest of the stream is read.
+
+    Args:
+        job (IngestionJobDB): Job to report progress on.
+        dataset (DatasetDB): Dataset receiving the contents.
+        chunks (AsyncIterator[bytes]): The archive bytes, e.g. the request body.
+        compression (str): Compression of the tar stream, see TAR_SUFFIXES.
+        user (UserOut): Creator of the new folders and files.
+        fs (StorageBackend): Storage for the file bytes.
+        es (Elasticsearch): Search index for the new files.
+        rabbitmq_client (BlockingChannel): Channel to submit new files to feeds.
+
+    Raises:
+        Exception: Whatever stopped reading the archive, e.g. a corrupt stream or the client disconnecting, after it
+            was recorded on the job. Members that fail on their own are only recorded.
+    """
+    try:
+        await _start_job(job)
+        await _ingest_members(
+            job,
+            dataset,
+            _tar_members(chunks, compression),
+            {},
+            user,
+            fs,
+            es,
+            rabbitmq_client,
+            count_files=True,
+        )
+        await _finish_job(job)
+    except Exception as e:
+        logger.error(f"Ingesting {job.filename} into dataset {dataset.id} failed: {e}")
+        await _finish_job(job, str(e))
+        raise
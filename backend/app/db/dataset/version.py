@@ -1,11 +1,12 @@
 from typing import Optional, Union
 
 from app.config import settings
-from app.db.folder.version import _freeze_folder
+from app.db import role_cache
+from app.db.dataset.download import _delete_frozen_archive
 from app.models.authorization import AuthorizationDB
 from app.models.datasets import DatasetDB, DatasetFreezeDB
 from app.models.files import FileDB, FileFreezeDB, FileVersionDB, StorageType
-from app.models.folders import FolderDB, FolderFreezeDB
+from app.models.folders import FolderFreezeDB
 from app.models.metadata import MetadataDB, MetadataFreezeDB
 from app.models.thumbnails import ThumbnailDB, ThumbnailFreezeDB
 from app.models.visualization_config import (
@@ -14,221 +15,23 @@ from app.models.visualization_config import (
 )
 from app.models.visualization_data import VisualizationDataDB, VisualizationDataFreezeDB
 from app.search.connect import delete_document_by_id
+from app.storage.backend import StorageBackend
 from beanie import PydanticObjectId
-from beanie.odm.operators.find.logical import And
+from beanie.operators import And, Exists, Or
 from bson import ObjectId
 from elasticsearch import Elasticsearch
 from fastapi import HTTPException
-from minio import Minio
-
-
-async def _freeze_file_metadata(file, new_frozen_file_id: PydanticObjectId):
-    """
-    Release metadata associated with a file.
-    Args:
-        file (FileDB): The file whose metadata needs to be released.
-        new_frozen_file_id (PydanticObjectId): The ID of the new released file.
-    """
-    file_metadata = await MetadataDB.find(
-        And(
-            MetadataDB.resource.resource_id == ObjectId(file.id),
-            MetadataDB.resource.collection == "files",
-        )
-    ).to_list()
-    for fm in file_metadata:
-        fm_data = fm.dict()
-        fm_data["origin_id"] = fm_data.pop("id")
-        fm_data["resource"]["resource_id"] = new_frozen_file_id
-        fm_data["frozen"] = True
-        frozen_metadata = MetadataFreezeDB(**fm_data)
-        await frozen_metadata.insert()
-
-
-async def _freeze_file_thumbnail(thumbnail_id):
-    """
-    Release a file's thumbnail.
-    Args:
-        thumbnail_id (str): The ID of the thumbnail to be released.
-    Returns:
-        str: The ID of the newly created released thumbnail.
-    """
-    file_thumbnail = await ThumbnailDB.get(PydanticObjectId(thumbnail_id))
-    file_thumbnail_data = file_thumbnail.dict()
-    file_thumbnail_data["origin_id"] = file_thumbnail_data.pop("id")
-    file_thumbnail_data["frozen"] = True
-    frozen_file_thumbnail = ThumbnailFreezeDB(**file_thumbnail_data)
-    await frozen_file_thumbnail.insert()
-
-    return frozen_file_thumbnail.id
-
-
-async def _freeze_file_visualization(file, new_frozen_file_id: PydanticObjectId):
-    """
-    Release visualizations associated with a file.
-    Args:
-        file (FileDB): The file whose visualizations need to be released.
-        new_frozen_file_id (PydanticObjectId): The ID of the new released file.
-    """
-    file_vis_config = await VisualizationConfigDB.find(
-        And(
-            VisualizationConfigDB.resource.resource_id == ObjectId(file.id),
-            VisualizationConfigDB.resource.collection == "files",
-        )
-    ).to_list()
-    for fvc in file_vis_config:
-        fvc_data = fvc.dict()
-        fvc_data["origin_id"] = fvc_data.pop("id")
-        fvc_data["resource"]["resource_id"] = new_frozen_file_id
-        fvc_data["frozen"] = True
-        frozen_vis_config = VisualizationConfigFreezeDB(**fvc_data)
-        await frozen_vis_config.insert()
-
-        # freeze the associate visualization data
-        file_vis_data = await VisualizationDataDB.find(
-            VisualizationDataDB.visualization_config_id == fvc_data["origin_id"]
-        ).to_list()
-        for fvd in file_vis_data:
-            fvd_data = fvd.dict()
-            fvd_data["origin_id"] = fvd_data.pop("id")
-            # update the visualization config id to the new frozen visualization config id
-            fvd_data["visualization_config_id"] = frozen_vis_config.id
-            fvd_data["frozen"] = True
-            frozen_vis_data = VisualizationDataFreezeDB(**fvd_data)
-            await frozen_vis_data.insert()
-
-
-async def _freeze_files_folders_w_metadata_vis(
-    dataset_id: str, new_frozen_dataset_id: PydanticObjectId
-):
-    """
-    Release files and folders along with their metadata and visualizations for a dataset.
-    Args:
-        dataset_id (str): The ID of the dataset to be released.
-        new_frozen_dataset_id (PydanticObjectId): The ID of the new released dataset.
-    """
-    # freeze folders first and save frozen folder id to a hashmap
-    folders = await FolderDB.find(FolderDB.dataset_id == ObjectId(dataset_id)).to_list()
-    parent_id_map = {}
-    for folder in folders:
-        await _freeze_folder(folder, new_frozen_dataset_id, parent_id_map)
-
-    # then freeze file
-    files = await FileDB.find(FileDB.dataset_id == ObjectId(dataset_id)).to_list()
-    for file in files:
-        file_data = file.dict()
-        file_data["origin_id"] = file_data.pop("id")
-        file_data["dataset_id"] = new_frozen_dataset_id
-        file_data["frozen"] = True
-
-        # if file belongs to a folder
-        if file_data["folder_id"] and file_data["folder_id"] in parent_id_map:
-            file_data["folder_id"] = parent_id_map[file_data["folder_id"]]
-
-        # if file has thumbnail
-        if file_data["thumbnail_id"]:
-            frozen_file_thumbnail_id = await _freeze_file_thumbnail(
-                file_data["thumbnail_id"]
-            )
-            file_data["thumbnail_id"] = frozen_file_thumbnail_id
-
-        frozen_file = FileFreezeDB(**file_data)
-        await frozen_file.insert()
-
-        # if there are associate metadata on the file
-        await _freeze_file_metadata(file, frozen_file.id)
-
-        # if there are associate visualization on the file
-        await _freeze_file_visualization(file, frozen_file.id)
-
-
-async def _freeze_dataset_metadata(
-    dataset_id: str, new_frozen_dataset_id: PydanticObjectId
-):
-    """
-    Release metadata associated with a dataset.
-    Args:
-        dataset_id (str): The ID of the dataset whose metadata needs to be released.
-        new_frozen_dataset_id (PydanticObjectId): The ID of the new released dataset.
-    """
-    dataset_metadata = await MetadataDB.find(
-        And(
-            MetadataDB.resource.resource_id == ObjectId(dataset_id),
-            MetadataDB.resource.collection == "datasets",
-        )
-    ).to_list()
-    for dm in dataset_metadata:
-        dm_data = dm.dict()
-        dm_data["origin_id"] = dm_data.pop("id")
-        dm_data["resource"]["resource_id"] = new_frozen_dataset_id
-        dm_data["frozen"] = True
-        frozen_metadata = MetadataFreezeDB(**dm_data)
-        await frozen_metadata.insert()
-
-
-async def _freeze_dataset_thumbnail(thumbnail_id: PydanticObjectId):
-    """
-    Release a dataset's thumbnail.
-    Args:
-        thumbnail_id (PydanticObjectId): The ID of the thumbnail to be released.
-    Returns:
-        str: The ID of the newly created released thumbnail.
-    """
-    dataset_thumbnail = await ThumbnailDB.get(thumbnail_id)
-    dataset_thumbnail_data = dataset_thumbnail.dict()
-    dataset_thumbnail_data["origin_id"] = dataset_thumbnail_data.pop("id")
-    dataset_thumbnail_data["frozen"] = True
-    frozen_dataset_thumbnail = ThumbnailFreezeDB(**dataset_thumbnail_data)
-    await frozen_dataset_thumbnail.insert()
-
-    return frozen_dataset_thumbnail.id
-
-
-async def _freeze_dataset_visualization(
-    dataset_id: str, new_frozen_dataset_id: PydanticObjectId
-):
-    """
-    Release visualizations associated with a dataset.
-    Args:
-        dataset_id (str): The ID of the dataset whose visualizations need to be released.
-        new_frozen_dataset_id (PydanticObjectId): The ID of the new released dataset.
-    """
-    dataset_vis_config = await VisualizationConfigDB.find(
-        And(
-            VisualizationConfigDB.resource.resource_id == ObjectId(dataset_id),
-            VisualizationConfigDB.resource.collection == "datasets",
-        )
-    ).to_list()
-    for dvc in dataset_vis_config:
-        dvc_data = dvc.dict()
-        dvc_data["origin_id"] = dvc_data.pop("id")
-        dvc_data["resource"]["resource_id"] = new_frozen_dataset_id
-        dvc_data["frozen"] = True
-        frozen_vis_config = VisualizationConfigFreezeDB(**dvc_data)
-        await frozen_vis_config.insert()
-
-        # freeze the associate visualization data
-        dataset_vis_data = await VisualizationDataDB.find(
-            VisualizationDataDB.visualization_config_id == dvc_data["origin_id"]
-        ).to_list()
-        for dvd in dataset_vis_data:
-            dvd_data = dvd.dict()
-            dvd_data["origin_id"] = dvd_data.pop("id")
-            # update the visualization config id to the new frozen visualization config id
-            dvd_data["visualization_config_id"] = frozen_vis_config.id
-            dvd_data["frozen"] = True
-            frozen_vis_data = VisualizationDataFreezeDB(**dvd_data)
-            await frozen_vis_data.insert()
 
 
 async def _delete_frozen_visualizations(
-    resource: Union[DatasetFreezeDB, FileFreezeDB], fs: Optional[Minio]
+    resource: Union[DatasetFreezeDB, FileFreezeDB], fs: Optional[StorageBackend]
 ):
     """
     Delete the visualizations associated with a released resource.
 
     Args:
         resource(Union[DatasetFreezeDB, FileFreezeDB]): file or dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
     async for frozen_vis_config in VisualizationConfigFreezeDB.find(
         VisualizationConfigFreezeDB.resource.resource_id
@@ -259,22 +62,20 @@ async def _delete_frozen_visualizations(
                     )
                     is None
                 ):
-                    fs.remove_object(
-                        settings.MINIO_BUCKET_NAME, str(frozen_vis_data.origin_id)
-                    )
+                    await fs.delete(str(frozen_vis_data.origin_id))
 
         return frozen_vis_config.dict()
 
 
 async def _delete_visualizations(
-    resource: Union[DatasetDB, FileDB], fs: Optional[Minio]
+    resource: Union[DatasetDB, FileDB], fs: Optional[StorageBackend]
 ):
     """
     Delete the visualizations associated with a current/latest resource.
 
     Args:
         resource (Union[DatasetDB, FileDB]): file or dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
     async for vis_config in VisualizationConfigDB.find(
         VisualizationConfigDB.resource.resource_id == PydanticObjectId(resource.id),
@@ -299,20 +100,20 @@ async def _delete_visualizations(
                     )
                     is None
                 ):
-                    fs.remove_object(settings.MINIO_BUCKET_NAME, str(vis_data.id))
+                    await fs.delete(str(vis_data.id))
 
         return vis_config.dict()
 
 
 async def _delete_frozen_thumbnail(
-    resource: Union[DatasetFreezeDB, FileFreezeDB], fs: Optional[Minio]
+    resource: Union[DatasetFreezeDB, FileFreezeDB], fs: Optional[StorageBackend]
 ):
     """
     Delete the thumbnail associated with a released resource.
 
     Args:
         resource (Union[DatasetFreezeDB, FileFreezeDB]): file or dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
     async for frozen_thumbnail in ThumbnailFreezeDB.find(
         ThumbnailFreezeDB.id == resource.thumbnail_id,
@@ -332,20 +133,20 @@ async def _delete_frozen_thumbnail(
                 await ThumbnailDB.find_one(ThumbnailDB.id != frozen_thumbnail.origin_id)
                 is None
             ):
-                fs.remove_object(
-                    settings.MINIO_BUCKET_NAME, str(frozen_thumbnail.origin_id)
-                )
+                await fs.delete(str(frozen_thumbnail.origin_id))
 
         return frozen_thumbnail.dict()
 
 
-async def _delete_thumbnail(resource: Union[DatasetDB, FileDB], fs: Optional[Minio]):
+async def _delete_thumbnail(
+    resource: Union[DatasetDB, FileDB], fs: Optional[StorageBackend]
+):
     """
     Delete the thumbnail associated with a current/latest resource.
 
     Args:
         resource (Union[DatasetDB, FileDB]): file or dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
     async for thumbnail in ThumbnailDB.find(
         ThumbnailDB.id == resource.thumbnail_id,
@@ -361,18 +162,18 @@ async def _delete_thumbnail(resource: Union[DatasetDB, FileDB], fs: Optional[Min
                 )
                 is None
             ):
-                fs.remove_object(settings.MINIO_BUCKET_NAME, str(thumbnail.id))
+                await fs.delete(str(thumbnail.id))
 
         return thumbnail.dict()
 
 
-async def _delete_file(file: FileDB, fs: Optional[Minio]):
+async def _delete_file(file: FileDB, fs: Optional[StorageBackend]):
     """
     Delete the file mongo document and raw bytes if applicable
 
     Args:
         file (FileDB): file .
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
     # delete mongo
     await file.delete()
@@ -385,18 +186,18 @@ async def _delete_file(file: FileDB, fs: Optional[Minio]):
             )
             is None
         ):
-            fs.remove_object(settings.MINIO_BUCKET_NAME, str(file.id))
+            await fs.delete(str(file.id))
 
     return file.dict()
 
 
-async def _delete_frozen_file(frozen_file: FileFreezeDB, fs: Optional[Minio]):
+async def _delete_frozen_file(frozen_file: FileFreezeDB, fs: Optional[StorageBackend]):
     """
     Delete the file associated with a released dataset including mongo document and raw bytes if applicable
 
     Args:
         frozen_file (FileFreezeDB): file associated with a released dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
     """
 
     # delete mongo
@@ -412,20 +213,31 @@ async def _delete_frozen_file(frozen_file: FileFreezeDB, fs: Optional[Minio]):
         ) and (
             await FileDB.find_one(FileDB.id == PydanticObjectId(frozen_file.origin_id))
         ) is None:
-            fs.remove_object(settings.MINIO_BUCKET_NAME, str(frozen_file.origin_id))
+            await fs.delete(str(frozen_file.origin_id))
 
     return frozen_file.dict()
 
 
+def _only_in_release(model, release_id: PydanticObjectId):
+    """Query for released folders or files of no other release than `release_id`, including those written before
+    `release_ids` was added and not migrated yet."""
+    return Or(
+        model.release_ids == [release_id],
+        And(model.dataset_id == release_id, Exists(model.release_ids, False)),
+    )
+
+
 async def _delete_frozen_dataset(
-    frozen_dataset: DatasetFreezeDB, fs: Optional[Minio], hard_delete: bool = False
+    frozen_dataset: DatasetFreezeDB,
+    fs: Optional[StorageBackend],
+    hard_delete: bool = False,
 ):
     """
     Delete a released dataset, including metadata, folders, thumbnails, visualizations, and authorizations.
 
     Args:
         frozen_dataset (DatasetFreezeDB): Released dataset.
-        fs (Optional[Minio]): The Minio file system client.
+        fs (Optional[StorageBackend]): The storage backend.
         hard_delete: Flag indicating delete bytes in minio or not.
     """
     # delete metadata
@@ -434,10 +246,13 @@ async def _delete_frozen_dataset(
         MetadataFreezeDB.resource.collection == "datasets",
     ).delete()
 
-    # delete folders
+    # delete folders, those shared with other releases only leave this one
     await FolderFreezeDB.find(
-        FolderFreezeDB.dataset_id == PydanticObjectId(frozen_dataset.id)
+        _only_in_release(FolderFreezeDB, PydanticObjectId(frozen_dataset.id))
     ).delete()
+    await FolderFreezeDB.find(
+        FolderFreezeDB.release_ids == PydanticObjectId(frozen_dataset.id)
+    ).update({"$pull": {"release_ids": PydanticObjectId(frozen_dataset.id)}})
 
     # delete dataset thumbnails
     await _delete_frozen_thumbnail(frozen_dataset, fs)
@@ -445,19 +260,27 @@ async def _delete_frozen_dataset(
     # delete dataset visualization
     await _delete_frozen_visualizations(frozen_dataset, fs)
 
-    # delete files and file associate resources
+    # delete files and file associate resources, files shared with other releases only leave this one
     async for frozen_file in FileFreezeDB.find(
-        FileFreezeDB.dataset_id == PydanticObjectId(frozen_dataset.id)
+        _only_in_release(FileFreezeDB, PydanticObjectId(frozen_dataset.id))
     ):
         if frozen_file.storage_type == StorageType.LOCAL:
             await remove_frozen_local_file_entry(frozen_file.id)
         else:
             await remove_frozen_file_entry(frozen_file.id, fs)
+    await FileFreezeDB.find(
+        FileFreezeDB.release_ids == PydanticObjectId(frozen_dataset.id)
+    ).update({"$pull": {"release_ids": PydanticObjectId(frozen_dataset.id)}})
 
     # delete authorizations
     await AuthorizationDB.find(
         AuthorizationDB.dataset_id == PydanticObjectId(frozen_dataset.id)
     ).delete()
+    role_cache.invalidate_roles(frozen_dataset.id)
+
+    # the prebuilt archive would otherwise keep serving the deleted release
+    if fs is not None:
+        await _delete_frozen_archive(frozen_dataset.id, fs)
 
     # If all above succeeded
     if hard_delete:
@@ -472,7 +295,7 @@ async def _delete_frozen_dataset(
 # TODO: Move this to MongoDB middle layer
 async def remove_file_entry(
     file_id: Union[str, ObjectId],
-    fs: Minio,
+    fs: StorageBackend,
     es: Elasticsearch,
 ):
     """
@@ -481,7 +304,7 @@ async def remove_file_entry(
 
     Args:
         file_id (Union[str, ObjectId]): The ID of the file to be removed.
-        fs (Minio): The Minio file system client.
+        fs (StorageBackend): The storage backend.
         es (Elasticsearch): The Elasticsearch client.
     """
 
@@ -512,7 +335,7 @@ async def remove_file_entry(
 
 
 async def remove_frozen_file_entry(
-    frozen_file_id: Union[str, ObjectId], fs: Optional[Minio]
+    frozen_file_id: Union[str, ObjectId], fs: Optional[StorageBackend]
 ):
     """
     Remove a file belongs to a released dataset; remove it from MongoDB, Minio, and associated metadata
@@ -520,7 +343,7 @@ async def remove_frozen_file_entry(
 
     Args:
         frozen_file_id (Union[str, ObjectId]): The ID of the file to be removed.
-        fs (Minio): The Minio file system client.
+        fs (StorageBackend): The storage backend.
     """
     if (
         frozen_file := await FileFreezeDB.get(PydanticObjectId(frozen_file_id))
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from app import dependencies
+from app.config import settings
+from app.models.uploads import UploadSessionDB
+from app.storage.backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+async def _delete_upload_session(session: UploadSessionDB, fs: StorageBackend):
+    """
+    Abort the multipart upload behind a session and remove the session document.
+
+    Args:
+        session (UploadSessionDB): The upload session to discard.
+        fs (StorageBackend): The storage backend.
+    """
+    if session.upload_id is None:
+        # single presigned PUT, the client may already have written the object
+        await fs.delete(str(session.file_id))
+    else:
+        await fs.abort_multipart(str(session.file_id), session.upload_id)
+    await session.delete()
+
+
+async def _delete_expired_upload_sessions(fs: StorageBackend) -> int:
+    """
+    Garbage-collect upload sessions that were abandoned before being committed.
+
+    Args:
+        fs (StorageBackend): The storage backend.
+    Returns:
+        int: The number of sessions removed.
+    """
+    removed = 0
+    single_put_sessions = []
+    async for session in UploadSessionDB.find(
+        UploadSessionDB.expires < datetime.utcnow()
+    ):
+        if session.upload_id is None:
+            single_put_sessions.append(session)
+        else:
+            await _delete_upload_session(session, fs)
+        removed += 1
+
+    # objects written by single presigned PUTs can be removed in one request
+    await fs.delete_many([str(session.file_id) for session in single_put_sessions])
+    for session in single_put_sessions:
+        await session.delete()
+    return removed
+
+
+async def upload_session_sweeper():
+    """Periodically remove expired upload sessions. Runs for the lifetime of the app."""
+    while True:
+        try:
+            async for fs in dependencies.get_fs():
+                removed = await _delete_expired_upload_sessions(fs)
+                if removed > 0:
+                    logger.info(f"Removed {removed} expired upload sessions")
+        except Exception as e:
+            logger.error(f"Could not remove expired upload sessions: {e}")
+        await asyncio.sleep(settings.UPLOAD_SESSION_SWEEP_INTERVAL)
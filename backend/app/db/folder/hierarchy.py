@@ -1,18 +1,144 @@
-import os
+from typing import Dict, List, Optional, Tuple, Union
 
-from app.models.folders import FolderDBViewList
+from app.models.folders import FolderDB, FolderDBViewList, FolderFreezeDB
 from beanie import PydanticObjectId
+from beanie.operators import In, Or
+from bson import ObjectId
+from pydantic import BaseModel, Field
 
 
-async def _get_folder_hierarchy(
-    folder_id: str,
-    hierarchy: str,
-):
-    """Generate a string of nested path to folder for use in zip file creation."""
-    folder = await FolderDBViewList.find_one(
-        FolderDBViewList.id == PydanticObjectId(folder_id)
+class _FolderNode(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    parent_folder: Optional[PydanticObjectId] = None
+    path: str = ""
+
+
+async def _get_folder_paths(
+    dataset_id: Union[str, ObjectId]
+) -> Dict[PydanticObjectId, str]:
+    """
+    Nested path of every folder in a dataset for use in zip file creation, e.g. "outer/inner/", loaded with a single
+    query instead of one query per ancestor of every file.
+
+    Args:
+        dataset_id (Union[str, ObjectId]): The dataset (or released version) whose folders to load.
+    Returns:
+        Dict[PydanticObjectId, str]: Path ending in "/" by folder ID.
+    """
+    folders = {
+        folder.id: folder
+        async for folder in FolderDBViewList.find(
+            FolderDBViewList.dataset_id == PydanticObjectId(dataset_id)
+        ).project(_FolderNode)
+    }
+    # stored paths are used as they are, only folders that predate them are resolved through their parents
+    paths = {folder.id: folder.path for folder in folders.values() if folder.path}
+
+    for folder_id in folders:
+        # walk up to the closest folder whose path is known, then fill in the paths on the way back down
+        chain = []
+        while folder_id not in paths and folder_id in folders:
+            if folder_id in chain:
+                break  # a broken tree with a cycle is cut where the cycle closes
+            chain.append(folder_id)
+            folder_id = folders[folder_id].parent_folder
+        path = paths.get(folder_id, "")
+        for current in reversed(chain):
+            path = path + folders[current].name + "/"
+            paths[current] = path
+    return paths
+
+
+def _child_lineage(
+    parent: Optional[FolderDB], name: str
+) -> Tuple[List[PydanticObjectId], str]:
+    """
+    Ancestors and path of a folder called `name` created in `parent`.
+
+    Args:
+        parent (Optional[FolderDB]): The enclosing folder, None at the top of the dataset.
+        name (str): Name of the folder.
+    Returns:
+        Tuple[List[PydanticObjectId], str]: Enclosing folder IDs from the outermost one down and the path, e.g.
+            "outer/inner/".
+    """
+    if parent is None:
+        return [], f"{name}/"
+    return parent.ancestors + [parent.id], f"{parent.path}{name}/"
+
+
+async def _move_folder(folder: FolderDB, parent: Optional[FolderDB], name: str):
+    """
+    Rename a folder or move it to another parent and rewrite the ancestors and paths of every folder below it with a
+    single update.
+
+    Args:
+        folder (FolderDB): The folder to move.
+        parent (Optional[FolderDB]): The new enclosing folder, None at the top of the dataset.
+        name (str): The new name of the folder.
+    """
+    old_depth = len(folder.ancestors) + 1
+    old_path = folder.path
+    folder.name = name
+    folder.parent_folder = None if parent is None else parent.id
+    folder.ancestors, folder.path = _child_lineage(parent, name)
+    await folder.save()
+    await FolderDB.get_motor_collection().update_many(
+        {"ancestors": folder.id},
+        [
+            {
+                "$set": {
+                    # replace the part of the lineage above and including the moved folder
+                    "ancestors": {
+                        "$concatArrays": [
+                            folder.ancestors + [folder.id],
+                            {
+                                "$slice": [
+                                    "$ancestors",
+                                    old_depth,
+                                    {"$size": "$ancestors"},
+                                ]
+                            },
+                        ]
+                    },
+                    "path": {
+                        "$concat": [
+                            folder.path,
+                            {
+                                "$substrCP": [
+                                    "$path",
+                                    len(old_path),
+                                    {"$strLenCP": "$path"},
+                                ]
+                            },
+                        ]
+                    },
+                }
+            }
+        ],
     )
-    hierarchy = os.path.join(folder.name, hierarchy)
-    if folder.parent_folder is not None:
-        hierarchy = await _get_folder_hierarchy(folder.parent_folder, hierarchy)
-    return hierarchy
+
+
+def _subtree_query(folder_id: PydanticObjectId):
+    """Query for a folder and every folder nested in it, served by the `_id` and `ancestors` indexes."""
+    return Or(FolderDB.id == folder_id, FolderDB.ancestors == folder_id)
+
+
+async def _get_ancestors(folder: FolderDBViewList) -> List[_FolderNode]:
+    """
+    The folders enclosing a current or released folder from the outermost one down, loaded with one query.
+
+    Args:
+        folder (FolderDBViewList): The folder whose breadcrumbs to load.
+    Returns:
+        List[_FolderNode]: The enclosing folders.
+    """
+    model = FolderFreezeDB if folder.frozen else FolderDB
+    found = {
+        ancestor.id: ancestor
+        async for ancestor in model.find(In(model.id, folder.ancestors)).project(
+            _FolderNode
+        )
+    }
+    return [found[ancestor] for ancestor in folder.ancestors if ancestor in found]
@@ -0,0 +1,197 @@
+from typing import Any, List, NamedTuple, Optional, Tuple, Type
+
+from app.models.authorization import AuthorizationDB
+from app.models.datasets import DatasetFreezeDB
+from app.models.files import FileDB, FileFreezeDB, FileVersionDB
+from app.models.folders import FolderDB, FolderFreezeDB
+from app.models.listeners import EventListenerJobDB, EventListenerJobUpdateDB
+from app.models.metadata import MetadataDB, MetadataFreezeDB
+from app.models.status import (
+    CollectionIndexStatus,
+    IndexStatus,
+    IndexUsage,
+    ProfiledCollscan,
+    QueryPlanStatus,
+)
+from app.models.thumbnails import ThumbnailFreezeDB
+from app.models.users import ListenerAPIKeyDB, UserAPIKeyDB
+from app.models.visualization_config import VisualizationConfigDB
+from app.models.visualization_data import VisualizationDataDB
+from beanie import Document
+from bson import ObjectId
+
+PROFILED_COLLSCAN_LIMIT = 50
+
+
+class _QueryShape(NamedTuple):
+    model: Type[Document]
+    filter: dict
+    sort: Optional[dict] = None
+
+
+# The planner only looks at which fields are filtered and sorted on, so any value stands in for the real ones.
+_ID = ObjectId()
+HOT_QUERY_SHAPES = [
+    _QueryShape(FileDB, {"dataset_id": _ID, "folder_id": None}, {"created": -1}),
+    _QueryShape(FileDB, {"folder_id": _ID}),
+    _QueryShape(FileFreezeDB, {"dataset_id": _ID, "folder_id": None}, {"created": -1}),
+    _QueryShape(FileFreezeDB, {"origin_id": _ID}),
+    _QueryShape(FileVersionDB, {"file_id": _ID, "version_num": 1}),
+    _QueryShape(FileVersionDB, {"file_id": _ID}, {"version_num": -1}),
+    _QueryShape(FolderDB, {"dataset_id": _ID, "parent_folder": None}),
+    _QueryShape(FolderDB, {"ancestors": _ID}),
+    _QueryShape(FolderFreezeDB, {"dataset_id": _ID}),
+    _QueryShape(
+        MetadataDB, {"resource.resource_id": _ID, "resource.collection": "files"}
+    ),
+    _QueryShape(MetadataDB, {"definition": ""}),
+    _QueryShape(
+        MetadataFreezeDB,
+        {"resource.resource_id": _ID, "resource.collection": "files"},
+    ),
+    _QueryShape(AuthorizationDB, {"dataset_id": _ID, "user_ids": ""}),
+    _QueryShape(AuthorizationDB, {"group_ids": _ID}),
+    _QueryShape(DatasetFreezeDB, {"origin_id": _ID}, {"frozen_version_num": -1}),
+    _QueryShape(
+        EventListenerJobDB,
+        {"resource_ref.resource_id": _ID, "resource_ref.version": 1},
+    ),
+    _QueryShape(EventListenerJobUpdateDB, {"job_id": ""}, {"timestamp": 1}),
+    _QueryShape(ThumbnailFreezeDB, {"origin_id": _ID}),
+    _QueryShape(UserAPIKeyDB, {"user": "", "key": ""}),
+    _QueryShape(ListenerAPIKeyDB, {"user": "", "key": ""}),
+    _QueryShape(
+        VisualizationConfigDB,
+        {"resource.resource_id": _ID, "resource.collection": "files"},
+    ),
+    _QueryShape(VisualizationDataDB, {"visualization_config_id": _ID}),
+]
+
+
+def _plan_stages(plan: Any) -> Tuple[List[str], List[str]]:
+    """Stage names and index names of a query plan tree, outermost stage first."""
+    stages: List[str] = []
+    indexes: List[str] = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        if "indexName" in plan:
+            indexes.append(plan["indexName"])
+        children = list(plan.values())
+    elif isinstance(plan, list):
+        children = plan
+    else:
+        children = []
+    for child in children:
+        child_stages, child_indexes = _plan_stages(child)
+        stages += child_stages
+        indexes += child_indexes
+    return stages, indexes
+
+
+async def _get_index_usage(database) -> List[CollectionIndexStatus]:
+    collections = []
+    for name in sorted(
+        await database.list_collection_names(filter={"type": "collection"})
+    ):
+        if name.startswith("system."):
+            continue
+        indexes = [
+            IndexUsage(
+                name=stats["name"],
+                key=dict(stats["key"]),
+                ops=stats["accesses"]["ops"],
+                since=stats["accesses"].get("since"),
+            )
+            async for stats in database[name].aggregate([{"$indexStats": {}}])
+        ]
+        collections.append(
+            CollectionIndexStatus(
+                collection=name, indexes=sorted(indexes, key=lambda i: i.name)
+            )
+        )
+    return collections
+
+
+async def _get_query_plans(database) -> List[QueryPlanStatus]:
+    plans = []
+    for shape in HOT_QUERY_SHAPES:
+        find = {"find": shape.model.get_settings().name, "filter": shape.filter}
+        if shape.sort:
+            find["sort"] = shape.sort
+        explained = await database.command(
+            {"explain": find, "verbosity": "queryPlanner"}
+        )
+        stages, indexes = _plan_stages(explained["queryPlanner"]["winningPlan"])
+        plans.append(
+            QueryPlanStatus(
+                collection=find["find"],
+                filter=list(shape.filter),
+                sort=list(shape.sort or {}),
+                stages=stages,
+                indexes=indexes,
+                collscan="COLLSCAN" in stages,
+            )
+        )
+    return plans
+
+
+async def _get_profiled_collscans(database) -> List[ProfiledCollscan]:
+    """Collection scans recorded in `system.profile`. Empty unless profiling is enabled on the database, e.g. with
+    `db.setProfilingLevel(1)` to record slow operations."""
+    pipeline = [
+        {
+            "$match": {
+                "planSummary": "COLLSCAN",
+                "ns": {"$not": {"$regex": r"\.system\."}},
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "ns": "$ns",
+                    "op": "$op",
+                    "filter": {
+                        "$map": {
+                            "input": {
+                                "$objectToArray": {"$ifNull": ["$command.filter", {}]}
+                            },
+                            "in": "$$this.k",
+                        }
+                    },
+                },
+                "count": {"$sum": 1},
+                "max_millis": {"$max": "$millis"},
+                "last_seen": {"$max": "$ts"},
+            }
+        },
+        {"$sort": {"count": -1}},
+        {"$limit": PROFILED_COLLSCAN_LIMIT},
+    ]
+    return [
+        ProfiledCollscan(
+            collection=group["_id"]["ns"].split(".", 1)[-1],
+            op=group["_id"]["op"],
+            filter=group["_id"]["filter"],
+            count=group["count"],
+            max_millis=group["max_millis"] or 0,
+            last_seen=group["last_seen"],
+        )
+        async for group in database["system.profile"].aggregate(pipeline)
+    ]
+
+
+async def _get_index_status() -> IndexStatus:
+    """
+    Index usage of every collection and how the hot query shapes of the routers are planned.
+
+    Returns:
+        IndexStatus: `$indexStats` per collection, the winning plan of each shape in `HOT_QUERY_SHAPES` and any
+        collection scans the database profiler recorded.
+    """
+    database = FileDB.get_motor_collection().database
+    return IndexStatus(
+        collections=await _get_index_usage(database),
+        query_plans=await _get_query_plans(database),
+        profiled_collscans=await _get_profiled_collscans(database),
+    )
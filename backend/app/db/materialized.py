@@ -0,0 +1,354 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Set, Tuple, Type
+
+import pymongo
+from app.config import settings
+from app.db.resolver import _view_branches
+from app.models.datasets import DatasetDBViewList
+from app.models.files import FileDBViewList
+from app.models.folder_and_file import FolderFileViewList
+from app.models.folders import FolderDBViewList
+from app.models.metadata import MetadataDBViewList
+from beanie import View
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# marks the documents written by one refresh so the ones it did not write can be removed afterwards
+REFRESH_FIELD = "_refresh"
+# changes are applied in batches of at most this many
+CHANGE_BATCH_SIZE = 1000
+# the process maintaining the materialized collections, and which of them it has built
+LEASE_COLLECTION = "materialized_views_lease"
+LEASE_ID = "maintainer"
+
+
+def _index(*keys: Tuple[str, int]) -> pymongo.IndexModel:
+    return pymongo.IndexModel(list(keys), background=True)
+
+
+# Views that can be served from a materialized collection, with the indexes of the fields they are filtered and
+# sorted by. `settings.MATERIALIZED_VIEWS` lists the names of the ones to materialize.
+MATERIALIZABLE_VIEWS: Dict[Type[View], List[pymongo.IndexModel]] = {
+    DatasetDBViewList: [
+        _index(("auth.user_ids", 1), ("created", -1)),
+        _index(("creator.email", 1), ("created", -1)),
+        _index(("status", 1), ("created", -1)),
+        _index(("origin_id", 1), ("frozen_version_num", -1)),
+    ],
+    FileDBViewList: [
+        _index(("dataset_id", 1), ("folder_id", 1), ("created", -1)),
+        _index(("origin_id", 1)),
+        _index(("auth.user_ids", 1)),
+    ],
+    FolderDBViewList: [
+        _index(("dataset_id", 1), ("parent_folder", 1)),
+        _index(("origin_id", 1)),
+        _index(("auth.user_ids", 1)),
+    ],
+    FolderFileViewList: [
+        _index(("dataset_id", 1), ("object_type", -1), ("created", -1)),
+        _index(("dataset_id", 1), ("folder_id", 1)),
+        _index(("dataset_id", 1), ("parent_folder", 1)),
+        _index(("auth.user_ids", 1)),
+    ],
+    MetadataDBViewList: [
+        _index(("resource.resource_id", 1), ("resource.collection", 1)),
+        _index(("origin_id", 1)),
+        _index(("definition", 1)),
+    ],
+}
+
+
+def _materialized_name(view: Type[View]) -> str:
+    return f"{view.get_settings().name}_materialized"
+
+
+def _view_sources(view: Type[View]) -> Tuple[Set[str], List[dict]]:
+    """Collections whose documents appear in a view and the `$lookup` stages joining other collections into them."""
+    view_settings = view.get_settings()
+    own = {view_settings.source}
+    lookups = []
+    for stage in view_settings.pipeline:
+        if "$unionWith" in stage:
+            union = stage["$unionWith"]
+            own.add(union if isinstance(union, str) else union["coll"])
+        elif "$lookup" in stage:
+            lookups.append(stage["$lookup"])
+    return own, lookups
+
+
+def _scoped_pipeline(pipeline: List[dict], match: dict) -> List[dict]:
+    """The pipeline of a view restricted to the source documents matching `match`, including the ones added by
+    `$unionWith`. `match` may only use fields the source documents have before any stage of the view ran.
+    """
+    scoped = [{"$match": match}]
+    for stage in pipeline:
+        if "$unionWith" in stage:
+            union = stage["$unionWith"]
+            if isinstance(union, str):
+                union = {"coll": union, "pipeline": []}
+            stage = {
+                "$unionWith": {
+                    **union,
+                    "pipeline": [{"$match": match}] + union.get("pipeline", []),
+                }
+            }
+        scoped.append(stage)
+    return scoped
+
+
+def _unwinds(view: Type[View]) -> bool:
+    return any(
+        "$unwind" in stage for _, stages in _view_branches(view)[0] for stage in stages
+    )
+
+
+class MaterializedViews:
+    """Keeps materialized copies of views up to date from a change stream of their source collections and points the
+    view classes at them once they are built.
+
+    Documents are recomputed with the view's own pipeline and written with `$merge`, so a materialized document is
+    exactly what the view would return. Change streams require MongoDB to run as a replica set; without one the views
+    stay live. Only the process holding the lease writes the materialized collections, a refresh removes what it did
+    not write itself and would remove the documents of another process refreshing at the same time.
+    """
+
+    def __init__(self, database, views: List[Type[View]]):
+        self.database = database
+        self.views = views
+        self._lock = asyncio.Lock()
+        # identifies this process in the lease
+        self.owner = ObjectId()
+
+    def _watched_collections(self) -> Set[str]:
+        collections = set()
+        for view in self.views:
+            own, lookups = _view_sources(view)
+            collections |= own | {lookup["from"] for lookup in lookups}
+        return collections
+
+    async def refresh(self, view: Type[View], match: dict):
+        """Recompute the materialized documents of a view whose sources match `match` and remove the ones that are
+        gone from the view."""
+        view_settings = view.get_settings()
+        target = _materialized_name(view)
+        token = ObjectId()
+        pipeline = _scoped_pipeline(view_settings.pipeline, match) + [
+            {"$addFields": {REFRESH_FIELD: token}},
+            {
+                "$merge": {
+                    "into": target,
+                    "on": "_id",
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert",
+                }
+            },
+        ]
+        async with self._lock:
+            await self.database[view_settings.source].aggregate(pipeline).to_list(None)
+            await self.database[target].delete_many(
+                {"$and": [match, {REFRESH_FIELD: {"$ne": token}}]}
+            )
+
+    async def rebuild(self, view: Type[View]):
+        await self.database[_materialized_name(view)].create_indexes(
+            MATERIALIZABLE_VIEWS[view]
+        )
+        await self.refresh(view, {})
+
+    def switch(self, view: Type[View], materialized: bool):
+        name = _materialized_name(view) if materialized else view.get_settings().name
+        view.get_settings().motor_collection = self.database[name]
+
+    async def _changed_matches(self, changes: List[dict]) -> Dict[Type[View], dict]:
+        """Source documents to recompute per view for a batch of change events. None means rebuild everything."""
+        matches = {}
+        for view in self.views:
+            own, lookups = _view_sources(view)
+            ids = set()
+            keys: Dict[str, set] = defaultdict(set)
+            for change in changes:
+                collection = change.get("ns", {}).get("coll")
+                if "documentKey" not in change:
+                    # drop, rename or invalidate, nothing to map back to single documents
+                    if collection in own or any(
+                        collection == lookup["from"] for lookup in lookups
+                    ):
+                        matches[view] = None
+                    continue
+                doc_id = change["documentKey"]["_id"]
+                if collection in own:
+                    ids.add(doc_id)
+                for lookup in lookups:
+                    if collection != lookup["from"]:
+                        continue
+                    document = change.get("fullDocument") or {}
+                    if lookup["foreignField"] in document:
+                        keys[lookup["localField"]].add(document[lookup["foreignField"]])
+                    # documents that embedded the changed one, which may have moved or been deleted since
+                    keys[lookup["localField"]] |= set(
+                        await self.database[_materialized_name(view)].distinct(
+                            lookup["localField"], {f"{lookup['as']}._id": doc_id}
+                        )
+                    )
+            if view in matches:
+                continue
+            clauses = [{"_id": {"$in": list(ids)}}] if ids else []
+            clauses += [
+                {field: {"$in": list(values)}} for field, values in keys.items()
+            ]
+            if clauses:
+                matches[view] = {"$or": clauses}
+        return matches
+
+    async def _apply(self, changes: List[dict]):
+        for view, match in (await self._changed_matches(changes)).items():
+            if match is None:
+                await self.rebuild(view)
+            else:
+                await self.refresh(view, match)
+
+    async def acquire(self) -> bool:
+        """Become the one process maintaining the materialized collections, until the lease runs out."""
+        now = datetime.utcnow()
+        try:
+            await self.database[LEASE_COLLECTION].find_one_and_update(
+                {
+                    "_id": LEASE_ID,
+                    "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}],
+                },
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "expires": now
+                        + timedelta(seconds=settings.MATERIALIZED_VIEW_LEASE),
+                        "ready": [],
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # held by another process, the upsert collided with its document
+            return False
+        return True
+
+    async def _keep_lease(self):
+        """Extend the lease every third of its length, also while a rebuild runs. Returns once another process took it
+        over, which only happens if this one stalled."""
+        while True:
+            await asyncio.sleep(settings.MATERIALIZED_VIEW_LEASE / 3)
+            result = await self.database[LEASE_COLLECTION].update_one(
+                {"_id": LEASE_ID, "owner": self.owner},
+                {
+                    "$set": {
+                        "expires": datetime.utcnow()
+                        + timedelta(seconds=settings.MATERIALIZED_VIEW_LEASE)
+                    }
+                },
+            )
+            if result.matched_count == 0:
+                logger.warning("Lost the lease on the materialized views")
+                return
+
+    async def _mark_ready(self, view: Type[View]):
+        await self.database[LEASE_COLLECTION].update_one(
+            {"_id": LEASE_ID, "owner": self.owner},
+            {"$addToSet": {"ready": view.get_settings().name}},
+        )
+
+    async def release(self):
+        await self.database[LEASE_COLLECTION].update_one(
+            {"_id": LEASE_ID, "owner": self.owner},
+            {"$set": {"expires": datetime.utcnow(), "ready": []}},
+        )
+
+    async def follow(self):
+        """Serve the views the maintaining process has finished building from their materialized collections, and the
+        others live."""
+        lease = await self.database[LEASE_COLLECTION].find_one({"_id": LEASE_ID})
+        ready = []
+        if lease is not None and lease["expires"] > datetime.utcnow():
+            ready = lease.get("ready", [])
+        for view in self.views:
+            self.switch(view, materialized=view.get_settings().name in ready)
+
+    async def run(self) -> bool:
+        """Build the materialized collections, serve the views from them and follow changes while this process holds
+        the lease. The views are switched back to live queries if the change stream fails. False if there is no change
+        stream at all."""
+        stream = self.database.watch(
+            [{"$match": {"ns.coll": {"$in": list(self._watched_collections())}}}],
+            full_document="updateLookup",
+            max_await_time_ms=500,
+        )
+        try:
+            # opens the stream before building so no change made during the build is missed
+            first = await stream.try_next()
+        except PyMongoError as e:
+            logger.warning(f"Views are not materialized, no change stream: {e}")
+            await stream.close()
+            return False
+        keeper = asyncio.create_task(self._keep_lease())
+        try:
+            for view in self.views:
+                if keeper.done():
+                    return True
+                await self.rebuild(view)
+                self.switch(view, materialized=True)
+                await self._mark_ready(view)
+                logger.info(f"Serving {view.__name__} from {_materialized_name(view)}")
+            changes = [first] if first is not None else []
+            while stream.alive and not keeper.done():
+                while len(changes) < CHANGE_BATCH_SIZE:
+                    if (change := await stream.try_next()) is None:
+                        break
+                    changes.append(change)
+                if changes:
+                    await self._apply(changes)
+                changes = []
+        except Exception as e:
+            logger.error(f"Materialized views stopped, serving live views: {e}")
+        finally:
+            keeper.cancel()
+            for view in self.views:
+                self.switch(view, materialized=False)
+            await stream.close()
+            await self.release()
+        return True
+
+
+async def materialized_view_maintainer():
+    """Materialize the views listed in `settings.MATERIALIZED_VIEWS`. Runs for the lifetime of the app.
+
+    Every process runs this, but only the one holding the lease in `materialized_views_lease` builds and updates the
+    materialized collections. The others serve a view from its collection once the maintainer has built it, and take
+    over when its lease runs out.
+    """
+    views = [
+        view
+        for view in MATERIALIZABLE_VIEWS
+        if view.get_settings().name in settings.MATERIALIZED_VIEWS
+    ]
+    if settings.FREEZE_SNAPSHOTS:
+        # a released document shared by several releases has one row per release, all with the same _id
+        for view in [view for view in views if _unwinds(view)]:
+            logger.warning(f"{view.__name__} is not materialized with FREEZE_SNAPSHOTS")
+            views.remove(view)
+    if not views:
+        return
+    materialized = MaterializedViews(views[0].get_settings().motor_db, views)
+    while True:
+        try:
+            if await materialized.acquire():
+                if not await materialized.run():
+                    return
+            else:
+                await materialized.follow()
+        except Exception as e:
+            logger.error(f"Could not maintain materialized views: {e}")
+        await asyncio.sleep(settings.MATERIALIZED_VIEW_LEASE / 3)
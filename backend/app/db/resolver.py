@@ -0,0 +1,86 @@
+from typing import Any, List, Optional, Tuple, Type, TypeVar, Union
+
+from beanie import PydanticObjectId, View
+from bson import ObjectId
+
+ViewType = TypeVar("ViewType", bound=View)
+
+
+def _add_fields(document: dict, stages: List[dict]) -> dict:
+    """Apply the `$addFields` stages of a view to a single document. Only constants and plain `$field` references are
+    supported, which is all the views use. An `$unwind` keeps the last element, so a document shared by several
+    releases resolves to the latest of them."""
+    for stage in stages:
+        if "$unwind" in stage:
+            field = stage["$unwind"][1:]
+            if document.get(field):
+                document[field] = document[field][-1]
+        for field, value in stage.get("$addFields", {}).items():
+            if isinstance(value, str) and value.startswith("$"):
+                value = document.get(value[1:])
+            document[field] = value
+    return document
+
+
+def _view_branches(view: Type[View]) -> Tuple[List[Tuple[str, List[dict]]], List[dict]]:
+    """Collections a view reads from in the order it unions them, each with the stages applied to its documents, and
+    the `$lookup` stages run on the result."""
+    view_settings = view.get_settings()
+    branches = [(view_settings.source, [])]
+    shared: List[dict] = []
+    lookups = []
+    for stage in view_settings.pipeline:
+        if "$unionWith" in stage:
+            union = stage["$unionWith"]
+            if isinstance(union, str):
+                union = {"coll": union}
+            branches.append((union["coll"], list(union.get("pipeline", []))))
+        elif "$lookup" in stage:
+            lookups.append(stage["$lookup"])
+        elif len(branches) == 1:
+            # stages before the first union only apply to the source collection
+            branches[0][1].append(stage)
+        else:
+            shared.append(stage)
+    return [(name, stages + shared) for name, stages in branches], lookups
+
+
+async def _get_by_id(
+    view: Type[ViewType],
+    resource_id: Union[str, ObjectId],
+    with_auth: bool = False,
+) -> Optional[ViewType]:
+    """
+    Fetch one document of a union view by ID without running the view's aggregation pipeline. The source collection is
+    tried first and the collections of released versions after it, each with a single `_id` lookup.
+
+    Args:
+        view (Type[View]): The view to resolve, e.g. DatasetDBViewList.
+        resource_id (Union[str, ObjectId]): ID of the current or released resource.
+        with_auth (bool): Attach the joined authorizations as the view would. Left empty otherwise, as most callers
+            only need the resource itself.
+    Returns:
+        Optional[View]: The document as the view would return it, or None if no collection has it.
+    """
+    if resource_id is None or not ObjectId.is_valid(resource_id):
+        return None
+    resource_id = PydanticObjectId(resource_id)
+    database = view.get_settings().motor_db
+    branches, lookups = _view_branches(view)
+    for collection, stages in branches:
+        if (
+            document := await database[collection].find_one({"_id": resource_id})
+        ) is None:
+            continue
+        _add_fields(document, stages)
+        for lookup in lookups:
+            joined: List[Any] = []
+            if with_auth:
+                joined = (
+                    await database[lookup["from"]]
+                    .find({lookup["foreignField"]: document.get(lookup["localField"])})
+                    .to_list(None)
+                )
+            document[lookup["as"]] = joined
+        return view.parse_obj(document)
+    return None
@@ -0,0 +1,128 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple
+
+from app.config import settings
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# collections whose changes are shared between workers, see `role_cache_invalidator`
+WATCHED_COLLECTIONS = ("authorization", "datasets", "datasets_freeze", "files")
+
+# returned by `get` when there is no entry, None is a value that can be cached
+MISSING = object()
+
+
+class _TTLCache:
+    """Entries expire after `settings.ROLE_CACHE_TTL` seconds, the least recently used ones are dropped beyond
+    `settings.ROLE_CACHE_SIZE`. A TTL of 0 disables caching."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        # bumped by every invalidation, a value read from the database before it is not cached
+        self.generation = 0
+
+    def get(self, key: Hashable):
+        if (entry := self._entries.get(key)) is None:
+            return MISSING
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value, generation: int):
+        if settings.ROLE_CACHE_TTL <= 0 or generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + settings.ROLE_CACHE_TTL, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.ROLE_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]):
+        self.generation += 1
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+
+# role of a user on a dataset by (email, dataset ID), None if the user has no authorization on it
+roles = _TTLCache()
+# (dataset ID, status) of a file by file ID
+files = _TTLCache()
+# status of a current or released dataset by dataset ID
+dataset_statuses = _TTLCache()
+
+
+def invalidate_roles(dataset_id):
+    """Drop the roles of all users on a dataset, after one of its authorizations changed."""
+    dataset_id = str(dataset_id)
+    roles.discard_where(lambda key: key[1] == dataset_id)
+
+
+def invalidate_dataset_status(dataset_id):
+    dataset_statuses.discard(str(dataset_id))
+
+
+def invalidate_dataset(dataset_id):
+    """Drop everything cached about a deleted dataset."""
+    invalidate_roles(dataset_id)
+    invalidate_dataset_status(dataset_id)
+
+
+def invalidate_user(email: str):
+    """Drop the roles of a user, after they were added to or removed from the authorizations of a group."""
+    roles.discard_where(lambda key: key[0] == email)
+
+
+def invalidate_file(file_id):
+    files.discard(str(file_id))
+
+
+def _apply_change(change: dict):
+    collection = change["ns"]["coll"]
+    document_id = change["documentKey"]["_id"]
+    if collection == "authorization":
+        if (document := change.get("fullDocument")) is not None:
+            invalidate_roles(document["dataset_id"])
+        else:
+            # deleted, which dataset it was about is gone with it
+            roles.clear()
+    elif collection in ("datasets", "datasets_freeze"):
+        if change["operationType"] == "delete":
+            invalidate_dataset(document_id)
+        else:
+            invalidate_dataset_status(document_id)
+    elif collection == "files":
+        invalidate_file(document_id)
+
+
+async def role_cache_invalidator(database):
+    """Apply authorization, dataset and file writes of other workers to the caches of this one when
+    `settings.ROLE_CACHE_CHANGE_STREAM` is set. Needs MongoDB to run as a replica set, without one only the writes of
+    this worker invalidate the caches and the others catch up within `settings.ROLE_CACHE_TTL`.
+    """
+    if not settings.ROLE_CACHE_CHANGE_STREAM:
+        return
+    try:
+        async with database.watch(
+            [{"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}}}],
+            full_document="updateLookup",
+        ) as stream:
+            async for change in stream:
+                _apply_change(change)
+    except PyMongoError as e:
+        logger.warning(f"Role caches are not shared between workers: {e}")
+        roles.clear()
+        files.clear()
+        dataset_statuses.clear()
@@ -1,41 +1,118 @@
-from typing import Generator
+import os
+from typing import Dict, Generator, List, Optional
 
+import certifi
 import pika
+import urllib3
 from app.config import settings
 from app.search.connect import connect_elasticsearch
+from app.storage.backend import StorageBackend
+from app.storage.local_storage import LocalStorage
+from app.storage.minio_storage import MinioStorage
 from minio import Minio
 from minio.commonconfig import ENABLED
 from minio.versioningconfig import VersioningConfig
 from pika.adapters.blocking_connection import BlockingChannel
 
+# Storage backends shared by every request, created once by init_fs()
+_fs: Optional[StorageBackend] = None
+_external_fs: Optional[StorageBackend] = None
+_fs_pools: Dict[str, urllib3.PoolManager] = {}
 
-async def get_fs() -> Generator:
-    file_system = Minio(
+
+def _create_pool() -> urllib3.PoolManager:
+    return urllib3.PoolManager(
+        timeout=urllib3.Timeout(
+            connect=settings.MINIO_CONNECT_TIMEOUT, read=settings.MINIO_READ_TIMEOUT
+        ),
+        maxsize=settings.MINIO_POOL_MAXSIZE,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=settings.MINIO_RETRIES,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+    )
+
+
+def init_fs():
+    """Create the shared storage backends. For Minio also make sure the Clowder bucket exists with versioning enabled.
+
+    The external backend is the one that signs URLs handed out to clients, so it uses the public Minio address.
+    """
+    global _fs, _external_fs
+    if settings.STORAGE_BACKEND == "local":
+        _fs = _external_fs = LocalStorage(settings.LOCAL_STORAGE_PATH)
+        return
+
+    _fs_pools["internal"] = _create_pool()
+    client = Minio(
         settings.MINIO_SERVER_URL,
         access_key=settings.MINIO_ACCESS_KEY,
         secret_key=settings.MINIO_SECRET_KEY,
         secure=False,
+        http_client=_fs_pools["internal"],
     )
-    clowder_bucket = settings.MINIO_BUCKET_NAME
-    if not file_system.bucket_exists(clowder_bucket):
-        file_system.make_bucket(clowder_bucket)
-    file_system.set_bucket_versioning(clowder_bucket, VersioningConfig(ENABLED))
-    yield file_system
-
-
-# This will be needed for generating presigned URL for sharing
-async def get_external_fs() -> Generator:
-    file_system = Minio(
+    _fs_pools["external"] = _create_pool()
+    external_client = Minio(
         settings.MINIO_EXTERNAL_SERVER_URL,
         access_key=settings.MINIO_ACCESS_KEY,
         secret_key=settings.MINIO_SECRET_KEY,
         secure=settings.MINIO_SECURE.lower() == "true",
+        http_client=_fs_pools["external"],
     )
     clowder_bucket = settings.MINIO_BUCKET_NAME
-    if not file_system.bucket_exists(clowder_bucket):
-        file_system.make_bucket(clowder_bucket)
-    file_system.set_bucket_versioning(clowder_bucket, VersioningConfig(ENABLED))
-    yield file_system
+    if not client.bucket_exists(clowder_bucket):
+        client.make_bucket(clowder_bucket)
+    client.set_bucket_versioning(clowder_bucket, VersioningConfig(ENABLED))
+    _fs = MinioStorage(client, clowder_bucket)
+    _external_fs = MinioStorage(external_client, clowder_bucket)
+
+
+def close_fs():
+    """Close all pooled connections to storage."""
+    global _fs, _external_fs
+    for pool in _fs_pools.values():
+        pool.clear()
+    _fs_pools.clear()
+    _fs = None
+    _external_fs = None
+
+
+def get_fs_pool_stats() -> List[dict]:
+    """Usage of each per-host connection pool, to help size MINIO_POOL_MAXSIZE."""
+    stats = []
+    for client, pool_manager in _fs_pools.items():
+        for key in pool_manager.pools.keys():
+            if (pool := pool_manager.pools.get(key)) is None:
+                continue
+            stats.append(
+                {
+                    "client": client,
+                    "host": pool.host,
+                    "port": pool.port,
+                    "maxsize": pool.pool.maxsize if pool.pool else 0,
+                    # the pool queue holds idle connections and unused slots
+                    "in_use": pool.pool.maxsize - pool.pool.qsize() if pool.pool else 0,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                }
+            )
+    return stats
+
+
+async def get_fs() -> Generator:
+    if _fs is None:
+        init_fs()
+    yield _fs
+
+
+# This will be needed for generating presigned URL for sharing
+async def get_external_fs() -> Generator:
+    if _external_fs is None:
+        init_fs()
+    yield _external_fs
 
 
 def get_rabbitmq() -> BlockingChannel:
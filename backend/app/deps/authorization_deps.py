@@ -1,15 +1,208 @@
+from typing import Dict, List, Optional, Set
+
+from app.db import role_cache
+from app.db.resolver import _get_by_id
+from app.db.role_cache import MISSING
 from app.keycloak_auth import get_current_username, get_read_only_user
 from app.models.authorization import AuthorizationDB, RoleType
-from app.models.datasets import DatasetDBViewList, DatasetStatus
+from app.models.datasets import (
+    DatasetDB,
+    DatasetDBViewList,
+    DatasetFreezeDB,
+    DatasetStatus,
+)
 from app.models.feeds import FeedDB
 from app.models.files import FileDB, FileStatus
 from app.models.groups import GroupDB
 from app.models.listeners import EventListenerDB
 from app.models.metadata import MetadataDB
+from app.models.mongomodel import MongoDBRef
 from app.routers.authentication import get_admin, get_admin_mode
 from beanie import PydanticObjectId
-from beanie.operators import Or
+from beanie.operators import In, Or
+from bson import ObjectId
 from fastapi import Depends, HTTPException
+from pydantic import BaseModel, Field
+
+
+class _CachedFile(BaseModel):
+    # the fields of a file its role depends on
+    id: PydanticObjectId = Field(alias="_id")
+    dataset_id: PydanticObjectId
+    status: str
+
+
+class _DatasetStatus(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    status: str
+
+
+class _MetadataResource(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    resource: MongoDBRef
+
+
+def _valid_ids(resource_ids: List) -> Set[str]:
+    """Distinct IDs as strings. Anything that is not an ObjectId cannot match a document and is left out."""
+    return {
+        str(resource_id)
+        for resource_id in resource_ids
+        if ObjectId.is_valid(str(resource_id))
+    }
+
+
+async def _get_dataset_roles(
+    current_user: str, dataset_ids: List
+) -> Dict[str, Optional[RoleType]]:
+    """Roles of a user on datasets by dataset ID, None where they have no authorization. Cached, see
+    `app.db.role_cache`, the ones that are not are read with a single query."""
+    roles: Dict[str, Optional[RoleType]] = {
+        str(dataset_id): None for dataset_id in dataset_ids
+    }
+    generation = role_cache.roles.generation
+    missing = []
+    for dataset_id in _valid_ids(dataset_ids):
+        if (role := role_cache.roles.get((current_user, dataset_id))) is not MISSING:
+            roles[dataset_id] = role
+        else:
+            missing.append(PydanticObjectId(dataset_id))
+    if missing:
+        found: Dict[str, RoleType] = {}
+        async for authorization in AuthorizationDB.find(
+            In(AuthorizationDB.dataset_id, missing),
+            Or(
+                AuthorizationDB.creator == current_user,
+                AuthorizationDB.user_ids == current_user,
+            ),
+        ):
+            found.setdefault(str(authorization.dataset_id), authorization.role)
+        for dataset_id in missing:
+            role = found.get(str(dataset_id))
+            roles[str(dataset_id)] = role
+            role_cache.roles.set((current_user, str(dataset_id)), role, generation)
+    return roles
+
+
+async def _get_dataset_statuses(dataset_ids: List) -> Dict[str, Optional[str]]:
+    """Statuses of current or released datasets by dataset ID, None where there is no such dataset. Cached."""
+    statuses: Dict[str, Optional[str]] = {
+        str(dataset_id): None for dataset_id in dataset_ids
+    }
+    generation = role_cache.dataset_statuses.generation
+    missing = set()
+    for dataset_id in _valid_ids(dataset_ids):
+        if (status := role_cache.dataset_statuses.get(dataset_id)) is not MISSING:
+            statuses[dataset_id] = status
+        else:
+            missing.add(PydanticObjectId(dataset_id))
+    # current datasets first, then releases
+    for model in (DatasetDB, DatasetFreezeDB):
+        if not missing:
+            break
+        async for dataset in model.find(In(model.id, list(missing))).project(
+            _DatasetStatus
+        ):
+            statuses[str(dataset.id)] = dataset.status
+            role_cache.dataset_statuses.set(str(dataset.id), dataset.status, generation)
+            missing.discard(dataset.id)
+    return statuses
+
+
+async def _get_files(file_ids: List) -> Dict[str, Optional[_CachedFile]]:
+    """Dataset and status of files by file ID, None where there is no such file. Cached."""
+    files: Dict[str, Optional[_CachedFile]] = {
+        str(file_id): None for file_id in file_ids
+    }
+    generation = role_cache.files.generation
+    missing = []
+    for file_id in _valid_ids(file_ids):
+        if (file := role_cache.files.get(file_id)) is not MISSING:
+            files[file_id] = file
+        else:
+            missing.append(PydanticObjectId(file_id))
+    if missing:
+        async for file in FileDB.find(In(FileDB.id, missing)).project(_CachedFile):
+            files[str(file.id)] = file
+            role_cache.files.set(str(file.id), file, generation)
+    return files
+
+
+async def _get_dataset_role(current_user: str, dataset_id) -> Optional[RoleType]:
+    """Role of a user on a dataset, None if they have no authorization on it."""
+    return (await _get_dataset_roles(current_user, [dataset_id]))[str(dataset_id)]
+
+
+async def _get_dataset_status(dataset_id) -> Optional[str]:
+    """Status of a current or released dataset, None if there is no such dataset."""
+    return (await _get_dataset_statuses([dataset_id]))[str(dataset_id)]
+
+
+async def _get_file(file_id) -> Optional[_CachedFile]:
+    """Dataset and status of a file, None if there is no such file."""
+    return (await _get_files([file_id]))[str(file_id)]
+
+
+async def _resolve_dataset_roles(
+    current_user: str, dataset_ids: List
+) -> Dict[str, Optional[RoleType]]:
+    """What `get_role` answers for each dataset: the user's role, viewer on public and authenticated datasets they
+    have no role on, None otherwise."""
+    roles = await _get_dataset_roles(current_user, dataset_ids)
+    statuses = await _get_dataset_statuses(
+        [dataset_id for dataset_id, role in roles.items() if role is None]
+    )
+    for dataset_id, status in statuses.items():
+        if (
+            status == DatasetStatus.PUBLIC.name
+            or status == DatasetStatus.AUTHENTICATED.name
+        ):
+            roles[dataset_id] = RoleType.VIEWER
+    return roles
+
+
+async def _resolve_file_roles(
+    current_user: str, file_ids: List
+) -> Dict[str, Optional[RoleType]]:
+    """What `get_role_by_file` answers for each file: the role on the dataset the file is in, None if it has none.
+    Files that do not exist are left out."""
+    files = {
+        file_id: file
+        for file_id, file in (await _get_files(file_ids)).items()
+        if file is not None
+    }
+    roles = await _resolve_dataset_roles(
+        current_user, [file.dataset_id for file in files.values()]
+    )
+    return {file_id: roles[str(file.dataset_id)] for file_id, file in files.items()}
+
+
+async def _resolve_metadata_roles(
+    current_user: str, metadata_ids: List
+) -> Dict[str, Optional[RoleType]]:
+    """The role on the file or dataset each metadata document is attached to, None if there is none or no such
+    metadata."""
+    resources: Dict[str, MongoDBRef] = {}
+    async for metadata in MetadataDB.find(
+        In(MetadataDB.id, [PydanticObjectId(i) for i in _valid_ids(metadata_ids)])
+    ).project(_MetadataResource):
+        resources[str(metadata.id)] = metadata.resource
+    file_roles = await _resolve_file_roles(
+        current_user,
+        [r.resource_id for r in resources.values() if r.collection == "files"],
+    )
+    dataset_roles = await _resolve_dataset_roles(
+        current_user,
+        [r.resource_id for r in resources.values() if r.collection == "datasets"],
+    )
+    roles: Dict[str, Optional[RoleType]] = {
+        str(metadata_id): None for metadata_id in metadata_ids
+    }
+    for metadata_id, resource in resources.items():
+        if resource.collection == "files":
+            roles[metadata_id] = file_roles.get(str(resource.resource_id))
+        elif resource.collection == "datasets":
+            roles[metadata_id] = dataset_roles.get(str(resource.resource_id))
+    return roles
 
 
 async def check_public_access(
@@ -21,18 +214,14 @@ async def check_public_access(
     has_public_access = False
     if role == RoleType.VIEWER:
         if resource_type == "dataset":
-            if (
-                dataset := await DatasetDBViewList.find_one(
-                    DatasetDBViewList.id == PydanticObjectId(resource_id)
-                )
-            ) is not None:
+            if (status := await _get_dataset_status(resource_id)) is not None:
                 if (
-                    dataset.status == DatasetStatus.PUBLIC.name
-                    or dataset.status == DatasetStatus.AUTHENTICATED.name
+                    status == DatasetStatus.PUBLIC.name
+                    or status == DatasetStatus.AUTHENTICATED.name
                 ):
                     has_public_access = True
         elif resource_type == "file":
-            if (file := await FileDB.get(PydanticObjectId(resource_id))) is not None:
+            if (file := await _get_file(resource_id)) is not None:
                 if (
                     file.status == FileStatus.PUBLIC.name
                     or file.status == FileStatus.AUTHENTICATED.name
@@ -53,19 +242,7 @@ async def get_role(
     if admin and admin_mode:
         return RoleType.OWNER
 
-    authorization = await AuthorizationDB.find_one(
-        AuthorizationDB.dataset_id == PydanticObjectId(dataset_id),
-        Or(
-            AuthorizationDB.creator == current_user,
-            AuthorizationDB.user_ids == current_user,
-        ),
-    )
-    public_access = await check_public_access(
-        dataset_id, "dataset", RoleType.VIEWER, current_user
-    )
-    if authorization is None and public_access:
-        return RoleType.VIEWER
-    return authorization.role
+    return (await _resolve_dataset_roles(current_user, [dataset_id]))[str(dataset_id)]
 
 
 async def get_role_by_file(
@@ -78,32 +255,15 @@ async def get_role_by_file(
     if admin and admin_mode:
         return RoleType.OWNER
 
-    if (file := await FileDB.get(PydanticObjectId(file_id))) is not None:
-        authorization = await AuthorizationDB.find_one(
-            AuthorizationDB.dataset_id == file.dataset_id,
-            Or(
-                AuthorizationDB.creator == current_user,
-                AuthorizationDB.user_ids == current_user,
-            ),
+    roles = await _resolve_file_roles(current_user, [file_id])
+    if file_id not in roles:
+        raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    if (role := roles[file_id]) is None:
+        raise HTTPException(
+            status_code=403,
+            detail=f"User `{current_user} does not have role on file {file_id}",
         )
-        if authorization is None:
-            if (
-                dataset := await DatasetDBViewList.find_one(
-                    DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-                )
-            ) is not None:
-                if (
-                    dataset.status == DatasetStatus.AUTHENTICATED.name
-                    or dataset.status == DatasetStatus.PUBLIC.name
-                ):
-                    return RoleType.VIEWER
-                else:
-                    raise HTTPException(
-                        status_code=403,
-                        detail=f"User `{current_user} does not have role on file {file_id}",
-                    )
-        return authorization.role
-    raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    return role
 
 
 async def get_role_by_metadata(
@@ -116,33 +276,9 @@ async def get_role_by_metadata(
     if admin and admin_mode:
         return RoleType.OWNER
 
-    if (md_out := await MetadataDB.get(PydanticObjectId(metadata_id))) is not None:
-        resource_type = md_out.resource.collection
-        resource_id = md_out.resource.resource_id
-        if resource_type == "files":
-            if (file := await FileDB.get(PydanticObjectId(resource_id))) is not None:
-                authorization = await AuthorizationDB.find_one(
-                    AuthorizationDB.dataset_id == file.dataset_id,
-                    Or(
-                        AuthorizationDB.creator == current_user,
-                        AuthorizationDB.user_ids == current_user,
-                    ),
-                )
-                return authorization.role
-        elif resource_type == "datasets":
-            if (
-                dataset := await DatasetDBViewList.find_one(
-                    DatasetDBViewList.id == PydanticObjectId(resource_id)
-                )
-            ) is not None:
-                authorization = await AuthorizationDB.find_one(
-                    AuthorizationDB.dataset_id == dataset.id,
-                    Or(
-                        AuthorizationDB.creator == current_user,
-                        AuthorizationDB.user_ids == current_user,
-                    ),
-                )
-                return authorization.role
+    return (await _resolve_metadata_roles(current_user, [metadata_id]))[
+        str(metadata_id)
+    ]
 
 
 async def get_role_by_group(
@@ -176,11 +312,7 @@ async def is_public_dataset(
     dataset_id: str,
 ) -> bool:
     """Checks if a dataset is public."""
-    if (
-        dataset_out := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (dataset_out := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if dataset_out.status == DatasetStatus.PUBLIC:
             return True
     else:
@@ -191,11 +323,7 @@ async def is_authenticated_dataset(
     dataset_id: str,
 ) -> bool:
     """Checks if a dataset is authenticated."""
-    if (
-        dataset_out := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (dataset_out := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if dataset_out.status == DatasetStatus.AUTHENTICATED:
             return True
     else:
@@ -225,15 +353,8 @@ class Authorization:
             return True
 
         # Else check role assigned to the user
-        authorization = await AuthorizationDB.find_one(
-            AuthorizationDB.dataset_id == PydanticObjectId(dataset_id),
-            Or(
-                AuthorizationDB.creator == current_user,
-                AuthorizationDB.user_ids == current_user,
-            ),
-        )
-        if authorization is not None:
-            if access(authorization.role, self.role):
+        if (role := await _get_dataset_role(current_user, dataset_id)) is not None:
+            if access(role, self.role):
                 return True
             else:
                 raise HTTPException(
@@ -241,14 +362,10 @@ class Authorization:
                     detail=f"User `{current_user} does not have `{self.role}` permission on dataset {dataset_id}",
                 )
         else:
-            if (
-                current_dataset := await DatasetDBViewList.find_one(
-                    DatasetDBViewList.id == PydanticObjectId(dataset_id)
-                )
-            ) is not None:
+            if (status := await _get_dataset_status(dataset_id)) is not None:
                 if (
-                    current_dataset.status == DatasetStatus.AUTHENTICATED.name
-                    or current_dataset.status == DatasetStatus.PUBLIC.name
+                    status == DatasetStatus.AUTHENTICATED.name
+                    or status == DatasetStatus.PUBLIC.name
                     and self.role == "viewer"
                 ):
                     return True
@@ -284,16 +401,11 @@ class FileAuthorization:
             return True
 
         # Else check role assigned to the user
-        if (file := await FileDB.get(PydanticObjectId(file_id))) is not None:
-            authorization = await AuthorizationDB.find_one(
-                AuthorizationDB.dataset_id == file.dataset_id,
-                Or(
-                    AuthorizationDB.creator == current_user,
-                    AuthorizationDB.user_ids == current_user,
-                ),
-            )
-            if authorization is not None:
-                if access(authorization.role, self.role):
+        if (file := await _get_file(file_id)) is not None:
+            if (
+                role := await _get_dataset_role(current_user, file.dataset_id)
+            ) is not None:
+                if access(role, self.role):
                     return True
                 raise HTTPException(
                     status_code=403,
@@ -335,18 +447,10 @@ class MetadataAuthorization:
             resource_type = md_out.resource.collection
             resource_id = md_out.resource.resource_id
             if resource_type == "files":
-                if (
-                    file := await FileDB.get(PydanticObjectId(resource_id))
-                ) is not None:
-                    authorization = await AuthorizationDB.find_one(
-                        AuthorizationDB.dataset_id == file.dataset_id,
-                        Or(
-                            AuthorizationDB.creator == current_user,
-                            AuthorizationDB.user_ids == current_user,
-                        ),
-                    )
-                    if authorization is not None:
-                        if access(authorization.role, self.role):
+                if (file := await _get_file(resource_id)) is not None:
+                    role = await _get_dataset_role(current_user, file.dataset_id)
+                    if role is not None:
+                        if access(role, self.role):
                             return True
                         raise HTTPException(
                             status_code=403,
@@ -357,20 +461,10 @@ class MetadataAuthorization:
                             status_code=404, detail=f"Metadata {metadata_id} not found"
                         )
             elif resource_type == "datasets":
-                if (
-                    dataset := await DatasetDBViewList.find_one(
-                        DatasetDBViewList.id == PydanticObjectId(resource_id)
-                    )
-                ) is not None:
-                    authorization = await AuthorizationDB.find_one(
-                        AuthorizationDB.dataset_id == dataset.id,
-                        Or(
-                            AuthorizationDB.creator == current_user,
-                            AuthorizationDB.user_ids == current_user,
-                        ),
-                    )
-                    if authorization is not None:
-                        if access(authorization.role, self.role):
+                if await _get_dataset_status(resource_id) is not None:
+                    role = await _get_dataset_role(current_user, resource_id)
+                    if role is not None:
+                        if access(role, self.role):
                             return True
                         raise HTTPException(
                             status_code=403,
@@ -497,17 +591,7 @@ class CheckStatus:
         self,
         dataset_id: str,
     ):
-        if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id)
-            )
-        ) is not None:
-            if dataset.status == self.status:
-                return True
-            else:
-                return False
-        else:
-            return False
+        return await _get_dataset_status(dataset_id) == self.status
 
 
 class CheckFileStatus:
@@ -521,19 +605,8 @@ class CheckFileStatus:
         self,
         file_id: str,
     ):
-        if (file_out := await FileDB.get(PydanticObjectId(file_id))) is not None:
-            dataset_id = file_out.dataset_id
-            if (
-                dataset := await DatasetDBViewList.find_one(
-                    DatasetDBViewList.id == PydanticObjectId(dataset_id)
-                )
-            ) is not None:
-                if dataset.status == self.status:
-                    return True
-                else:
-                    return False
-            else:
-                return False
+        if (file := await _get_file(file_id)) is not None:
+            return await _get_dataset_status(file.dataset_id) == self.status
         else:
             return False
 
@@ -1,17 +1,23 @@
 # Based on https://github.com/tiangolo/fastapi/issues/1428
-import json
+import asyncio
+import hashlib
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import APIKeyCookie, APIKeyHeader, OAuth2AuthorizationCodeBearer
 from itsdangerous.exc import BadSignature
 from itsdangerous.url_safe import URLSafeSerializer
-from jose import ExpiredSignatureError
-from keycloak.exceptions import KeycloakAuthenticationError, KeycloakGetError
+from jose import JWTError, jwt
+from keycloak.exceptions import KeycloakError, KeycloakGetError
 from keycloak.keycloak_admin import KeycloakAdmin
 from keycloak.keycloak_openid import KeycloakOpenID
 from pydantic import Json
+from requests import RequestException
+from starlette.concurrency import run_in_threadpool
 
 from .config import settings
 from .models.tokens import TokenDB
@@ -39,6 +45,92 @@ async def get_idp_public_key():
     )
 
 
+class _JWKS:
+    """Signing keys of the realm by `kid`. Fetched once and refreshed by `jwks_refresher`, and again when a token is
+    signed with a key that is not known yet, so rotated keys are picked up without waiting for the next refresh.
+    """
+
+    def __init__(self):
+        self.keys: Dict[str, dict] = {}
+        self.fetched = float("-inf")
+
+    async def refresh(self):
+        # set first, concurrent requests with an unknown key do not fetch again
+        self.fetched = time.monotonic()
+        certs = await run_in_threadpool(keycloak_openid.certs)
+        self.keys = {
+            key["kid"]: key
+            for key in certs.get("keys", [])
+            if key.get("use", "sig") == "sig"
+        }
+
+    async def get(self, kid: Optional[str]) -> Optional[dict]:
+        if (
+            kid not in self.keys
+            and time.monotonic() - self.fetched >= settings.JWKS_MIN_REFRESH_INTERVAL
+        ):
+            await self.refresh()
+        return self.keys.get(kid)
+
+
+jwks = _JWKS()
+
+# claims of verified access tokens by token hash, until the token expires
+_verified_tokens: "OrderedDict[str, dict]" = OrderedDict()
+
+
+async def jwks_refresher():
+    """Keep the signing keys of the realm current. Runs for the lifetime of the app."""
+    while True:
+        try:
+            await jwks.refresh()
+        except Exception as e:
+            logger.error(f"Could not fetch the signing keys of the realm: {e}")
+        await asyncio.sleep(settings.JWKS_REFRESH_INTERVAL)
+
+
+async def verify_token(token: str) -> dict:
+    """
+    Claims of a Keycloak access token. The signature is checked locally against the realm's JWKS, Keycloak is only
+    contacted to fetch keys. Verified tokens are remembered until they expire, so repeated requests with the same token
+    only hash it. Fails with 503 if the keys are needed and Keycloak cannot be reached.
+    """
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    if (claims := _verified_tokens.get(token_hash)) is not None:
+        if claims.get("exp", 0) > time.time():
+            _verified_tokens.move_to_end(token_hash)
+            return claims
+        del _verified_tokens[token_hash]
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if (key := await jwks.get(kid)) is None:
+            raise JWTError(f"Token signed with unknown key {kid}")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[key.get("alg", "RS256")],
+            options={"verify_aud": False},
+        )
+    except JWTError as e:
+        # also ExpiredSignatureError
+        raise HTTPException(
+            status_code=401,
+            detail={"error": str(e)},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except (KeycloakError, RequestException) as e:
+        logger.error(f"Could not fetch the signing keys of the realm: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "Signing keys of the realm are not available"},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    _verified_tokens[token_hash] = claims
+    if len(_verified_tokens) > settings.VERIFIED_TOKEN_CACHE_SIZE:
+        _verified_tokens.popitem(last=False)
+    return claims
+
+
 # oauth2 config used by fastapi security scheme below
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl=settings.oauth2_scheme_auth_url,
@@ -53,79 +145,111 @@ api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False)
 jwt_header = APIKeyCookie(name="Authorization", auto_error=False)
 
 
+# API keys found in the database by (user, key): when the entry stops being used and when the key expires, if ever
+_verified_api_keys: "OrderedDict[Tuple[str, str], Tuple[float, Optional[datetime]]]" = (
+    OrderedDict()
+)
+
+
+def forget_api_key(user: str, key: str):
+    """Stop accepting a deleted API key without waiting for `settings.API_KEY_CACHE_TTL`."""
+    _verified_api_keys.pop((user, key), None)
+
+
+async def _find_api_key(user: str, key: str) -> Optional[dict]:
+    """Listener or user key, in one round trip. Only its expiration date is returned."""
+    keys = (
+        await ListenerAPIKeyDB.find(
+            ListenerAPIKeyDB.user == user, ListenerAPIKeyDB.key == key
+        )
+        .aggregate(
+            [
+                {"$project": {"expires": 1}},
+                {
+                    "$unionWith": {
+                        "coll": "user_keys",
+                        "pipeline": [
+                            {"$match": {"user": user, "key": key}},
+                            {"$project": {"expires": 1}},
+                        ],
+                    }
+                },
+                {"$limit": 1},
+            ]
+        )
+        .to_list()
+    )
+    return keys[0] if keys else None
+
+
+async def _verify_api_key(api_key: str) -> str:
+    """Email of the user an API key was issued to. Keys found in the database are remembered for
+    `settings.API_KEY_CACHE_TTL` seconds, expired keys are removed by `api_key_sweeper`.
+    """
+    serializer = URLSafeSerializer(settings.local_auth_secret, salt="api_key")
+    try:
+        payload = serializer.loads(api_key)
+    except BadSignature:
+        raise HTTPException(
+            status_code=401,
+            detail={"error": "Key is invalid."},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    cache_key = (payload["user"], payload["key"])
+    cached = _verified_api_keys.get(cache_key)
+    if cached is not None and cached[0] > time.monotonic():
+        expires = cached[1]
+    elif (key := await _find_api_key(*cache_key)) is not None:
+        expires = key.get("expires")
+        _verified_api_keys[cache_key] = (
+            time.monotonic() + settings.API_KEY_CACHE_TTL,
+            expires,
+        )
+        _verified_api_keys.move_to_end(cache_key)
+        if len(_verified_api_keys) > settings.API_KEY_CACHE_SIZE:
+            _verified_api_keys.popitem(last=False)
+    else:
+        forget_api_key(*cache_key)
+        raise HTTPException(
+            status_code=401,
+            detail={"error": "Key is invalid."},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Key is valid, check expiration date
+    if expires is not None and datetime.utcnow() >= expires:
+        raise HTTPException(
+            status_code=401,
+            detail={"error": "Key is expired."},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload["user"]
+
+
+async def api_key_sweeper():
+    """Periodically remove expired API keys. Runs for the lifetime of the app."""
+    while True:
+        try:
+            for model in (UserAPIKeyDB, ListenerAPIKeyDB):
+                result = await model.find(model.expires < datetime.utcnow()).delete()
+                if result is not None and result.deleted_count > 0:
+                    logger.info(
+                        f"Removed {result.deleted_count} expired keys from {model.get_settings().name}"
+                    )
+        except Exception as e:
+            logger.error(f"Could not remove expired API keys: {e}")
+        await asyncio.sleep(settings.API_KEY_SWEEP_INTERVAL)
+
+
 async def get_token(
     token: str = Security(oauth2_scheme),
     api_key: str = Security(api_key_header),
 ) -> Json:
     """Decode token. Use to secure endpoints."""
     if token:
-        try:
-            # See https://github.com/marcospereirampj/python-keycloak/issues/89
-            return keycloak_openid.decode_token(
-                token,
-                key=await get_idp_public_key(),
-                options={"verify_aud": False},
-            )
-        except ExpiredSignatureError as e:
-            raise HTTPException(
-                status_code=401,
-                detail=str(e),  # "token expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        except KeycloakGetError as e:
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=str(e),  # "Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        except KeycloakAuthenticationError as e:
-            raise HTTPException(
-                status_code=401,
-                detail=str(e),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        return await verify_token(token)
 
     if api_key:
-        serializer = URLSafeSerializer(settings.local_auth_secret, salt="api_key")
-        try:
-            payload = serializer.loads(api_key)
-            # Key is valid, check expiration date in database
-            if (
-                await ListenerAPIKeyDB.find_one(
-                    ListenerAPIKeyDB.user == payload["user"],
-                    ListenerAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                return {"email": payload["user"]}
-            elif (
-                key := await UserAPIKeyDB.find_one(
-                    UserAPIKeyDB.user == payload["user"],
-                    UserAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                current_time = datetime.utcnow()
-                if key.expires is not None and current_time >= key.expires:
-                    # Expired key, delete it first
-                    await key.delete()
-                    raise HTTPException(
-                        status_code=401,
-                        detail={"error": "Key is expired."},
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-                else:
-                    return {"email": payload["user"]}
-            else:
-                raise HTTPException(
-                    status_code=401,
-                    detail={"error": "Key is invalid."},
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except BadSignature:
-            raise HTTPException(
-                status_code=401,
-                detail={"error": "Key is invalid."},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        return {"email": await _verify_api_key(api_key)}
 
     raise HTTPException(
         status_code=401,
@@ -134,176 +258,49 @@ async def get_token(
     )
 
 
-async def get_user(identity: Json = Depends(get_token)):
-    """Retrieve the user email from keycloak token."""
-    return identity["email"]
-
-
-async def get_current_user(
-    token: str = Security(oauth2_scheme),
-    api_key: str = Security(api_key_header),
-    token_cookie: str = Security(jwt_header),
-) -> UserOut:
-    """Retrieve the user object from Mongo by first getting user id from JWT and then querying Mongo.
-    Potentially expensive. Use `get_current_username` if all you need is user name.
+class RequestIdentity:
+    """
+    Who made a request. Built once per request by `get_identity`, every authentication dependency of the request
+    resolves from the same instance, so the token or API key is verified once and the user is looked up at most once.
     """
 
-    if token:
-        try:
-            userinfo = keycloak_openid.userinfo(token)
-            user = await UserDB.find_one(UserDB.email == userinfo["email"])
-            return UserOut(**user.dict())
-        except KeycloakAuthenticationError as e:
-            if not e.error_message:
-                if e.response_code == 401:
-                    e.error_message = '{"error": "Unauthenticated"}'
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    if token_cookie:
-        try:
-            userinfo = keycloak_openid.userinfo(token_cookie.removeprefix("Bearer%20"))
-            user = await UserDB.find_one(UserDB.email == userinfo["email"])
-            return UserOut(**user.dict())
-        # expired token
-        except KeycloakAuthenticationError as e:
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    def __init__(self, email: str):
+        self.email = email
+        self._user: Optional[UserDB] = None
+        self._loaded = False
 
-    if api_key:
-        serializer = URLSafeSerializer(settings.local_auth_secret, salt="api_key")
-        try:
-            payload = serializer.loads(api_key)
-            # Key is valid, check expiration date in database
-            if (
-                key := await ListenerAPIKeyDB.find_one(
-                    ListenerAPIKeyDB.user == payload["user"],
-                    ListenerAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                user = await UserDB.find_one(UserDB.email == key.user)
-                return UserOut(**user.dict())
-            elif (
-                key := await UserAPIKeyDB.find_one(
-                    UserAPIKeyDB.user == payload["user"],
-                    UserAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                current_time = datetime.utcnow()
-
-                if key.expires is not None and current_time >= key.expires:
-                    # Expired key, delete it first
-                    await key.delete()
-                    raise HTTPException(
-                        status_code=401,
-                        detail={"error": "Key is expired."},
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-                else:
-                    user = await UserDB.find_one(UserDB.email == key.user)
-                    return UserOut(**user.dict())
-            else:
-                raise HTTPException(
-                    status_code=401,
-                    detail={"error": "Key is invalid."},
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except BadSignature:
-            raise HTTPException(
-                status_code=401,
-                detail={"error": "Key is invalid."},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    async def get_user(self) -> Optional[UserDB]:
+        """The user document, queried on first use."""
+        if not self._loaded:
+            self._user = await UserDB.find_one(UserDB.email == self.email)
+            self._loaded = True
+        return self._user
 
-    raise HTTPException(
-        status_code=401,
-        detail="Not authenticated.",  # "token expired",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
 
+def _token_identity(claims: dict) -> RequestIdentity:
+    if (email := claims.get("email")) is None:
+        raise HTTPException(
+            status_code=401,
+            detail={"error": "Token has no email claim"},
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return RequestIdentity(email)
 
-async def get_current_username(
+
+async def get_identity(
     token: str = Security(oauth2_scheme),
     api_key: str = Security(api_key_header),
     token_cookie: str = Security(jwt_header),
-) -> str:
-    """Retrieve the user id from the JWT token. Does not query MongoDB."""
+) -> RequestIdentity:
+    """Verify the JWT, cookie or API key of the request. FastAPI caches the result for the rest of the request."""
     if token:
-        try:
-            userinfo = keycloak_openid.userinfo(token)
-            return userinfo["email"]
-        # expired token
-        except KeycloakAuthenticationError as e:
-            if not e.error_message:
-                if e.response_code == 401:
-                    e.error_message = '{"error": "Unauthenticated"}'
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
+        return _token_identity(await verify_token(token))
     if token_cookie:
-        try:
-            userinfo = keycloak_openid.userinfo(token_cookie.removeprefix("Bearer%20"))
-            return userinfo["email"]
-        # expired token
-        except KeycloakAuthenticationError as e:
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
+        return _token_identity(
+            await verify_token(token_cookie.removeprefix("Bearer%20"))
+        )
     if api_key:
-        serializer = URLSafeSerializer(settings.local_auth_secret, salt="api_key")
-        try:
-            payload = serializer.loads(api_key)
-            # Key is valid, check expiration date in database
-            if (
-                key := await ListenerAPIKeyDB.find_one(
-                    ListenerAPIKeyDB.user == payload["user"],
-                    ListenerAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                # Key is coming from a listener job
-                return key.user
-            elif (
-                key := await UserAPIKeyDB.find_one(
-                    UserAPIKeyDB.user == payload["user"],
-                    UserAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                # Key is coming from a user request
-                current_time = datetime.utcnow()
-
-                if key.expires is not None and current_time >= key.expires:
-                    # Expired key, delete it first
-                    await key.delete()
-                    raise HTTPException(
-                        status_code=401,
-                        detail={"error": "Key is expired."},
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-                else:
-                    return key.user
-            else:
-                raise HTTPException(
-                    status_code=401,
-                    detail={"error": "Key is invalid."},
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except BadSignature:
-            raise HTTPException(
-                status_code=401,
-                detail={"error": "Key is invalid."},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        return RequestIdentity(await _verify_api_key(api_key))
 
     raise HTTPException(
         status_code=401,
@@ -312,89 +309,44 @@ async def get_current_username(
     )
 
 
-async def get_read_only_user(
-    token: str = Security(oauth2_scheme),
-    api_key: str = Security(api_key_header),
-    token_cookie: str = Security(jwt_header),
-) -> bool:
+async def get_user(identity: RequestIdentity = Depends(get_identity)):
+    """Retrieve the user email from keycloak token."""
+    return identity.email
+
+
+async def get_current_user(
+    identity: RequestIdentity = Depends(get_identity),
+) -> UserOut:
     """Retrieve the user object from Mongo by first getting user id from JWT and then querying Mongo.
-    Potentially expensive. Use `get_current_username` if all you need is user name.
+    Queried once per request. Use `get_current_username` if all you need is user name.
     """
+    if (user := await identity.get_user()) is None:
+        raise HTTPException(
+            status_code=404,
+            detail="User doesn't exist.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return UserOut(**user.dict())
 
-    if token:
-        try:
-            userinfo = keycloak_openid.userinfo(token)
-            user = await UserDB.find_one(UserDB.email == userinfo["email"])
-            return user.read_only_user
-        except KeycloakAuthenticationError as e:
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    if token_cookie:
-        try:
-            userinfo = keycloak_openid.userinfo(token_cookie.removeprefix("Bearer%20"))
-            user = await UserDB.find_one(UserDB.email == userinfo["email"])
-            return user.read_only_user
-        # expired token
-        except KeycloakAuthenticationError as e:
-            raise HTTPException(
-                status_code=e.response_code,
-                detail=json.loads(e.error_message),
-                headers={"WWW-Authenticate": "Bearer"},
-            )
 
-    if api_key:
-        serializer = URLSafeSerializer(settings.local_auth_secret, salt="api_key")
-        try:
-            payload = serializer.loads(api_key)
-            # Key is valid, check expiration date in database
-            if (
-                key := await ListenerAPIKeyDB.find_one(
-                    ListenerAPIKeyDB.user == payload["user"],
-                    ListenerAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                user = await UserDB.find_one(UserDB.email == key.user)
-                return user.read_only_user
-            elif (
-                key := await UserAPIKeyDB.find_one(
-                    UserAPIKeyDB.user == payload["user"],
-                    UserAPIKeyDB.key == payload["key"],
-                )
-            ) is not None:
-                current_time = datetime.utcnow()
-
-                if key.expires is not None and current_time >= key.expires:
-                    # Expired key, delete it first
-                    await key.delete()
-                    raise HTTPException(
-                        status_code=401,
-                        detail={"error": "Key is expired."},
-                        headers={"WWW-Authenticate": "Bearer"},
-                    )
-                else:
-                    user = await UserDB.find_one(UserDB.email == key.user)
-                    return user.read_only_user
-            else:
-                raise HTTPException(
-                    status_code=401,
-                    detail={"error": "Key is invalid."},
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except BadSignature:
-            raise HTTPException(
-                status_code=401,
-                detail={"error": "Key is invalid."},
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+async def get_current_username(
+    identity: RequestIdentity = Depends(get_identity),
+) -> str:
+    """Retrieve the user id from the JWT token. Does not query MongoDB."""
+    return identity.email
 
-    raise HTTPException(
-        status_code=401,
-        detail="Not authenticated.",  # "token expired",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+
+async def get_read_only_user(
+    identity: RequestIdentity = Depends(get_identity),
+) -> bool:
+    """Whether the user may only read. Shares the user lookup of the request with `get_current_user`."""
+    if (user := await identity.get_user()) is None:
+        raise HTTPException(
+            status_code=404,
+            detail="User doesn't exist.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user.read_only_user
 
 
 async def get_current_user_id(identity: Json = Depends(get_token)) -> str:
@@ -1,8 +1,14 @@
+import asyncio
 import logging
 
 import uvicorn
+from app import dependencies
 from app.config import settings
-from app.keycloak_auth import get_current_username
+from app.db.dataset.freeze import freeze_job_sweeper
+from app.db.file.upload import upload_session_sweeper
+from app.db.materialized import materialized_view_maintainer
+from app.db.role_cache import role_cache_invalidator
+from app.keycloak_auth import api_key_sweeper, get_current_username, jwks_refresher
 from app.models.authorization import AuthorizationDB
 from app.models.config import ConfigEntryDB
 from app.models.datasets import DatasetDB, DatasetDBViewList, DatasetFreezeDB
@@ -11,7 +17,9 @@ from app.models.feeds import FeedDB
 from app.models.files import FileDB, FileDBViewList, FileFreezeDB, FileVersionDB
 from app.models.folder_and_file import FolderFileViewList
 from app.models.folders import FolderDB, FolderDBViewList, FolderFreezeDB
+from app.models.freeze_jobs import FreezeJobDB
 from app.models.groups import GroupDB
+from app.models.ingestion import IngestionJobDB
 from app.models.licenses import LicenseDB
 from app.models.listeners import (
     EventListenerDB,
@@ -28,6 +36,7 @@ from app.models.metadata import (
 )
 from app.models.thumbnails import ThumbnailDB, ThumbnailDBViewList, ThumbnailFreezeDB
 from app.models.tokens import TokenDB
+from app.models.uploads import UploadSessionDB
 from app.models.users import ListenerAPIKeyDB, UserAPIKeyDB, UserDB
 from app.models.visualization_config import (
     VisualizationConfigDB,
@@ -64,6 +73,7 @@ from app.routers import (
     public_visualization,
     status,
     thumbnails,
+    uploads,
     users,
     visualization,
 )
@@ -165,6 +175,12 @@ api_router.include_router(
     tags=["datasets"],
     dependencies=[Depends(get_current_username)],
 )
+api_router.include_router(
+    uploads.router,
+    prefix="/datasets",
+    tags=["uploads"],
+    dependencies=[Depends(get_current_username)],
+)
 api_router.include_router(
     public_datasets.router,
     prefix="/public_datasets",
@@ -292,6 +308,9 @@ async def startup_beanie():
             FileFreezeDB,
             FileVersionDB,
             FileDBViewList,
+            UploadSessionDB,
+            IngestionJobDB,
+            FreezeJobDB,
             FolderFileViewList,
             FeedDB,
             EventListenerDB,
@@ -320,6 +339,48 @@ async def startup_beanie():
     )
 
 
+@app.on_event("startup")
+async def startup_materialized_views():
+    """Build the materialized views in the background, the views are served live until they are ready."""
+    asyncio.create_task(materialized_view_maintainer())
+
+
+@app.on_event("startup")
+async def startup_role_cache_invalidator():
+    """Share the invalidations of the role caches between workers, see ROLE_CACHE_CHANGE_STREAM."""
+    asyncio.create_task(role_cache_invalidator(AuthorizationDB.get_settings().motor_db))
+
+
+@app.on_event("startup")
+async def startup_storage():
+    """Create the shared storage backends and check the bucket once instead of on every request."""
+    dependencies.init_fs()
+
+
+@app.on_event("startup")
+async def startup_upload_session_sweeper():
+    """Garbage-collect abandoned resumable upload sessions in the background."""
+    asyncio.create_task(upload_session_sweeper())
+
+
+@app.on_event("startup")
+async def startup_freeze_job_sweeper():
+    """Remove releases left half written by a worker that stopped, and mark their jobs as failed."""
+    asyncio.create_task(freeze_job_sweeper())
+
+
+@app.on_event("startup")
+async def startup_jwks_refresher():
+    """Fetch the realm's signing keys used to verify access tokens, and keep them current."""
+    asyncio.create_task(jwks_refresher())
+
+
+@app.on_event("startup")
+async def startup_api_key_sweeper():
+    """Remove expired API keys in the background instead of on the request that presents them."""
+    asyncio.create_task(api_key_sweeper())
+
+
 @app.on_event("startup")
 async def startup_elasticsearch():
     # create elasticsearch indices
@@ -337,6 +398,11 @@ async def shutdown_db_client():
     pass
 
 
+@app.on_event("shutdown")
+async def shutdown_storage():
+    dependencies.close_fs()
+
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
@@ -1,8 +1,19 @@
 from datetime import datetime
 from enum import Enum
-
-from beanie import Document, PydanticObjectId
-from charset_normalizer.md import List
+from typing import Dict, List, Optional
+
+import pymongo
+from app.db import role_cache
+from beanie import (
+    Delete,
+    Document,
+    Insert,
+    PydanticObjectId,
+    Replace,
+    Save,
+    SaveChanges,
+    after_event,
+)
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -48,6 +59,15 @@ class AuthorizationDB(Document, AuthorizationBase, Provenance):
 
     class Settings:
         name = "authorization"
+        indexes = [
+            pymongo.IndexModel([("dataset_id", pymongo.ASCENDING)], background=True),
+            pymongo.IndexModel([("user_ids", pymongo.ASCENDING)], background=True),
+            pymongo.IndexModel([("group_ids", pymongo.ASCENDING)], background=True),
+        ]
+
+    @after_event(Insert, Replace, Save, SaveChanges, Delete)
+    def invalidate_cached_roles(self):
+        role_cache.invalidate_roles(self.dataset_id)
 
 
 class AuthorizationOut(AuthorizationDB):
@@ -68,6 +88,30 @@ class AuthorizationFile(BaseModel):
         use_enum_values = True
 
 
+# IDs of each kind one batch request can look up
+MAX_BATCH_IDS = 1000
+
+
+class AuthorizationBatchIn(BaseModel):
+    """Resources to look up the current user's role on in one request."""
+
+    dataset_ids: List[PydanticObjectId] = Field([], max_items=MAX_BATCH_IDS)
+    file_ids: List[PydanticObjectId] = Field([], max_items=MAX_BATCH_IDS)
+    metadata_ids: List[PydanticObjectId] = Field([], max_items=MAX_BATCH_IDS)
+
+
+class AuthorizationBatchOut(BaseModel):
+    """Roles by resource ID, None where the user has no role on the resource or it does not exist."""
+
+    datasets: Dict[str, Optional[RoleType]] = {}
+    files: Dict[str, Optional[RoleType]] = {}
+    metadata: Dict[str, Optional[RoleType]] = {}
+
+    class Config:
+        # required for Enum to properly work
+        use_enum_values = True
+
+
 class AuthorizationMetadata(BaseModel):
     metadata_id: PydanticObjectId
     user_id: EmailStr
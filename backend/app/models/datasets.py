@@ -3,10 +3,20 @@ from enum import Enum, auto
 from typing import List, Optional
 
 import pymongo
+from app.db import role_cache
 from app.models.authorization import AuthorizationDB, RoleType
 from app.models.groups import GroupOut
 from app.models.users import UserOut
-from beanie import Document, PydanticObjectId, View
+from beanie import (
+    Delete,
+    Document,
+    PydanticObjectId,
+    Replace,
+    Save,
+    SaveChanges,
+    View,
+    after_event,
+)
 from pydantic import BaseModel, Field
 
 
@@ -65,6 +75,14 @@ class DatasetDB(Document, DatasetBaseCommon):
             ],
         ]
 
+    @after_event(Replace, Save, SaveChanges)
+    def invalidate_cached_status(self):
+        role_cache.invalidate_dataset_status(self.id)
+
+    @after_event(Delete)
+    def invalidate_cached_roles(self):
+        role_cache.invalidate_dataset(self.id)
+
 
 class DatasetFreezeDB(Document, DatasetBaseCommon):
     frozen: bool = True
@@ -78,8 +96,23 @@ class DatasetFreezeDB(Document, DatasetBaseCommon):
                 ("name", pymongo.TEXT),
                 ("description", pymongo.TEXT),
             ],
+            pymongo.IndexModel(
+                [
+                    ("origin_id", pymongo.ASCENDING),
+                    ("frozen_version_num", pymongo.DESCENDING),
+                ],
+                background=True,
+            ),
         ]
 
+    @after_event(Replace, Save, SaveChanges)
+    def invalidate_cached_status(self):
+        role_cache.invalidate_dataset_status(self.id)
+
+    @after_event(Delete)
+    def invalidate_cached_roles(self):
+        role_cache.invalidate_dataset(self.id)
+
 
 class DatasetDBViewList(View, DatasetBaseCommon):
     id: PydanticObjectId = Field(None, alias="_id")  # necessary for Views
@@ -135,6 +168,28 @@ class DatasetFreezeOut(DatasetFreezeDB):
         fields = {"id": "id"}
 
 
+class DatasetChangeType(AutoName):
+    ADDED = auto()
+    REMOVED = auto()
+    MODIFIED = auto()
+
+
+class DatasetChange(BaseModel):
+    """A difference between two versions of a dataset."""
+
+    change: DatasetChangeType
+    # "folder", "file" or "metadata"
+    object_type: str
+    # the current document, or the one a released document was copied from
+    origin_id: PydanticObjectId
+    name: Optional[str] = None
+    # the file or dataset metadata is attached to, by its origin
+    resource_id: Optional[PydanticObjectId] = None
+
+    class Config:
+        use_enum_values = True
+
+
 class UserAndRole(BaseModel):
     user: UserOut
     role: RoleType
@@ -2,9 +2,21 @@ from datetime import datetime
 from enum import Enum, auto
 from typing import List, Optional
 
+import pymongo
+from app.db import role_cache
 from app.models.authorization import AuthorizationDB
+from app.models.mongomodel import _released_stages
 from app.models.users import UserOut
-from beanie import Document, PydanticObjectId, View
+from beanie import (
+    Delete,
+    Document,
+    PydanticObjectId,
+    Replace,
+    Save,
+    SaveChanges,
+    View,
+    after_event,
+)
 from pydantic import BaseModel, Field
 
 
@@ -49,11 +61,19 @@ class FileVersion(BaseModel):
     version_id: str
     version_num: int = 1
     bytes: int = 0
+    sha256: Optional[str] = None
+    md5: Optional[str] = None
 
 
 class FileVersionDB(Document, FileVersion):
     class Settings:
         name = "file_versions"
+        indexes = [
+            pymongo.IndexModel(
+                [("file_id", pymongo.ASCENDING), ("version_num", pymongo.DESCENDING)],
+                background=True,
+            ),
+        ]
 
 
 class FileBase(BaseModel):
@@ -81,6 +101,8 @@ class FileBaseCommon(FileBase):
     views: int = 0
     downloads: int = 0
     bytes: int = 0
+    sha256: Optional[str] = None
+    md5: Optional[str] = None
     content_type: ContentType = ContentType()
     thumbnail_id: Optional[PydanticObjectId] = None
     storage_type: StorageType = StorageType.MINIO
@@ -92,17 +114,48 @@ class FileBaseCommon(FileBase):
 class FileDB(Document, FileBaseCommon):
     class Settings:
         name = "files"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("dataset_id", pymongo.ASCENDING),
+                    ("folder_id", pymongo.ASCENDING),
+                    ("created", pymongo.DESCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel([("folder_id", pymongo.ASCENDING)], background=True),
+        ]
 
     class Config:
         # required for Enum to properly work
         use_enum_values = True
 
+    @after_event(Replace, Save, SaveChanges, Delete)
+    def invalidate_cached_file(self):
+        role_cache.invalidate_file(self.id)
+
 
 class FileFreezeDB(Document, FileBaseCommon):
     frozen: bool = True
+    # releases containing this document, more than one when later releases share it, see FREEZE_SNAPSHOTS
+    release_ids: List[PydanticObjectId] = []
+    # hash of the content it was released with, see app.db.dataset.diff
+    content_hash: Optional[str] = None
 
     class Settings:
         name = "files_freeze"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("dataset_id", pymongo.ASCENDING),
+                    ("folder_id", pymongo.ASCENDING),
+                    ("created", pymongo.DESCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel([("origin_id", pymongo.ASCENDING)], background=True),
+            pymongo.IndexModel([("release_ids", pymongo.ASCENDING)], background=True),
+        ]
 
 
 class FileDBViewList(View, FileBaseCommon):
@@ -126,7 +179,7 @@ class FileDBViewList(View, FileBaseCommon):
             {
                 "$unionWith": {
                     "coll": "files_freeze",
-                    "pipeline": [{"$addFields": {"frozen": True}}],
+                    "pipeline": _released_stages({"frozen": True}),
                 }
             },
             {
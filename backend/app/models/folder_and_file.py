@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from app.models.authorization import AuthorizationDB
 from app.models.files import ContentType, FileBaseCommon, FileDB
+from app.models.mongomodel import _released_stages
 from app.models.users import UserOut
 from beanie import PydanticObjectId, View
 from pydantic import Field
@@ -63,17 +64,17 @@ class FolderFileViewList(View, FileBaseCommon):
             {
                 "$unionWith": {
                     "coll": "files_freeze",
-                    "pipeline": [
-                        {"$addFields": {"object_type": "file", "frozen": True}}
-                    ],
+                    "pipeline": _released_stages(
+                        {"object_type": "file", "frozen": True}
+                    ),
                 }
             },
             {
                 "$unionWith": {
                     "coll": "folders_freeze",
-                    "pipeline": [
-                        {"$addFields": {"object_type": "folder", "frozen": True}}
-                    ],
+                    "pipeline": _released_stages(
+                        {"object_type": "folder", "frozen": True}
+                    ),
                 }
             },
             {
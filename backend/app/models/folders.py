@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import List, Optional
 
+import pymongo
 from app.models.authorization import AuthorizationDB
+from app.models.mongomodel import _released_stages
 from app.models.users import UserOut
 from beanie import Document, PydanticObjectId, View
 from pydantic import BaseModel, Field
@@ -28,18 +30,46 @@ class FolderBaseCommon(FolderBase):
     modified: datetime = Field(default_factory=datetime.utcnow)
     object_type: str = "folder"
     origin_id: Optional[PydanticObjectId] = None
+    # materialized path: IDs of the enclosing folders from the outermost one down and the names joined as "outer/inner/"
+    ancestors: List[PydanticObjectId] = []
+    path: str = ""
 
 
 class FolderDB(Document, FolderBaseCommon):
     class Settings:
         name = "folders"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("dataset_id", pymongo.ASCENDING),
+                    ("parent_folder", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel([("ancestors", pymongo.ASCENDING)], background=True),
+        ]
 
 
 class FolderFreezeDB(Document, FolderBaseCommon):
     frozen: bool = True
+    # releases containing this document, more than one when later releases share it, see FREEZE_SNAPSHOTS
+    release_ids: List[PydanticObjectId] = []
+    # hash of the content it was released with, see app.db.dataset.diff
+    content_hash: Optional[str] = None
 
     class Settings:
         name = "folders_freeze"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("dataset_id", pymongo.ASCENDING),
+                    ("parent_folder", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel([("ancestors", pymongo.ASCENDING)], background=True),
+            pymongo.IndexModel([("release_ids", pymongo.ASCENDING)], background=True),
+        ]
 
 
 class FolderDBViewList(View, FolderBaseCommon):
@@ -63,7 +93,7 @@ class FolderDBViewList(View, FolderBaseCommon):
             {
                 "$unionWith": {
                     "coll": "folders_freeze",
-                    "pipeline": [{"$addFields": {"frozen": True}}],
+                    "pipeline": _released_stages({"frozen": True}),
                 }
             },
             {
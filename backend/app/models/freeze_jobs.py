@@ -0,0 +1,68 @@
+from datetime import datetime
+from enum import Enum
+from typing import Dict, Optional
+
+import pymongo
+from app.models.users import UserOut
+from beanie import Document, Insert, PydanticObjectId, Replace, Save, before_event
+from pydantic import BaseModel, Field
+
+
+class FreezeJobStatus(str, Enum):
+    """Progress of copying a dataset into a new released version."""
+
+    CREATED = "CREATED"
+    PROCESSING = "PROCESSING"
+    SUCCEEDED = "SUCCEEDED"
+    ERROR = "ERROR"
+
+
+class FreezeJobBase(BaseModel):
+    dataset_id: PydanticObjectId
+    # assigned when the job is created so the release can be referenced before it is written
+    frozen_dataset_id: PydanticObjectId
+    frozen_version_num: int
+    # release whose unchanged files and folders were shared instead of copied, see FREEZE_SNAPSHOTS
+    previous_frozen_dataset_id: Optional[PydanticObjectId] = None
+    status: FreezeJobStatus = FreezeJobStatus.CREATED
+    # what is being copied right now, e.g. "folders" or "files"
+    stage: Optional[str] = None
+    total_files: int = 0
+    total_folders: int = 0
+    frozen_files: int = 0
+    frozen_folders: int = 0
+    # documents written so far by collection, including metadata, thumbnails and visualizations
+    written: Dict[str, int] = {}
+    # documents of the previous release shared by this one, by collection
+    shared: Dict[str, int] = {}
+    error: Optional[str] = None
+    created: datetime = Field(default_factory=datetime.utcnow)
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+    # last time the job was saved, a running job that stops saving was interrupted
+    heartbeat: Optional[datetime] = None
+
+
+class FreezeJobDB(Document, FreezeJobBase):
+    """Background job that releases a dataset. The released dataset only becomes visible once everything else has been
+    copied, and whatever was written is removed again if the job fails."""
+
+    creator: UserOut
+
+    class Settings:
+        name = "freeze_jobs"
+        indexes = [
+            [
+                ("dataset_id", pymongo.ASCENDING),
+                ("created", pymongo.DESCENDING),
+            ],
+        ]
+
+    @before_event(Insert, Replace, Save)
+    def beat(self):
+        self.heartbeat = datetime.utcnow()
+
+
+class FreezeJobOut(FreezeJobDB):
+    class Config:
+        fields = {"id": "id"}
@@ -0,0 +1,51 @@
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+import pymongo
+from app.models.users import UserOut
+from beanie import Document, PydanticObjectId
+from pydantic import BaseModel, Field
+
+
+class IngestionJobStatus(str, Enum):
+    """Progress of creating a dataset's files and folders from an uploaded archive."""
+
+    CREATED = "CREATED"
+    PROCESSING = "PROCESSING"
+    SUCCEEDED = "SUCCEEDED"
+    ERROR = "ERROR"
+
+
+class IngestionJobBase(BaseModel):
+    dataset_id: PydanticObjectId
+    filename: str
+    status: IngestionJobStatus = IngestionJobStatus.CREATED
+    total_files: int = 0
+    total_folders: int = 0
+    processed_files: int = 0
+    failed_files: int = 0
+    bytes: int = 0
+    # the most recent error messages, older ones are dropped
+    errors: List[str] = []
+    created: datetime = Field(default_factory=datetime.utcnow)
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+
+
+class IngestionJobDB(Document, IngestionJobBase):
+    """Background job that unpacks an uploaded archive into a dataset. Counters are updated as members are stored so
+    clients can poll for progress."""
+
+    creator: UserOut
+
+    class Settings:
+        name = "ingestion_jobs"
+        indexes = [
+            [("dataset_id", pymongo.ASCENDING)],
+        ]
+
+
+class IngestionJobOut(IngestionJobDB):
+    class Config:
+        fields = {"id": "id"}
@@ -139,7 +139,18 @@ class EventListenerJobDB(Document, EventListenerJobBase):
                 ("resource_ref.resource_id", pymongo.TEXT),
                 ("listener_id", pymongo.TEXT),
                 ("status", pymongo.TEXT),
-            ]
+            ],
+            pymongo.IndexModel(
+                [
+                    ("resource_ref.resource_id", pymongo.ASCENDING),
+                    ("resource_ref.version", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel(
+                [("listener_id", pymongo.ASCENDING), ("created", pymongo.DESCENDING)],
+                background=True,
+            ),
         ]
 
 
@@ -195,6 +206,10 @@ class EventListenerJobUpdateDB(Document, EventListenerJobUpdateBase):
                 ("job_id", pymongo.TEXT),
                 ("status", pymongo.TEXT),
             ],
+            pymongo.IndexModel(
+                [("job_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)],
+                background=True,
+            ),
         ]
 
 
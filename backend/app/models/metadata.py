@@ -2,6 +2,7 @@ import collections.abc
 from datetime import datetime
 from typing import List, Optional, Union
 
+import pymongo
 from app.models.listeners import (
     EventListenerIn,
     EventListenerOut,
@@ -261,6 +262,16 @@ class MetadataBaseCommon(MetadataBase):
 class MetadataDB(Document, MetadataBaseCommon):
     class Settings:
         name = "metadata"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("resource.resource_id", pymongo.ASCENDING),
+                    ("resource.collection", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+            pymongo.IndexModel([("definition", pymongo.ASCENDING)], background=True),
+        ]
 
     class Config:
         arbitrary_types_allowed = True
@@ -274,9 +285,20 @@ class MetadataDB(Document, MetadataBaseCommon):
 
 class MetadataFreezeDB(Document, MetadataBaseCommon):
     frozen: bool = True
+    # hash of the content it was released with, see app.db.dataset.diff
+    content_hash: Optional[str] = None
 
     class Settings:
         name = "metadata_freeze"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("resource.resource_id", pymongo.ASCENDING),
+                    ("resource.collection", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+        ]
 
     @validator("resource")
     def resource_dbref_is_valid(cls, v):
@@ -0,0 +1,66 @@
+from typing import Dict, List, Tuple
+
+from app.models.folders import FolderDB, FolderFreezeDB
+from beanie import free_fall_migration
+from pymongo import UpdateOne
+
+BATCH_SIZE = 1000
+
+
+def _lineage(folders: Dict) -> Dict:
+    """Ancestors and path of every folder by ID, walking up the parents once per folder. A broken tree with a cycle is
+    cut where the cycle closes."""
+    lineage: Dict = {}
+    for folder_id in folders:
+        chain = []
+        while (
+            folder_id not in lineage and folder_id in folders and folder_id not in chain
+        ):
+            chain.append(folder_id)
+            folder_id = folders[folder_id].get("parent_folder")
+        ancestors: List = []
+        path = ""
+        if folder_id in lineage:
+            ancestors = lineage[folder_id][0] + [folder_id]
+            path = lineage[folder_id][1]
+        for current in reversed(chain):
+            path = path + folders[current]["name"] + "/"
+            lineage[current] = (ancestors, path)
+            ancestors = ancestors + [current]
+    return lineage
+
+
+async def _backfill(collection):
+    folders = {
+        folder["_id"]: folder
+        async for folder in collection.find({}, {"name": 1, "parent_folder": 1})
+    }
+    updates: List[UpdateOne] = []
+    lineage: Dict[object, Tuple[List, str]] = _lineage(folders)
+    for folder_id, (ancestors, path) in lineage.items():
+        updates.append(
+            UpdateOne(
+                {"_id": folder_id}, {"$set": {"ancestors": ancestors, "path": path}}
+            )
+        )
+        if len(updates) >= BATCH_SIZE:
+            await collection.bulk_write(updates, ordered=False)
+            updates = []
+    if len(updates) > 0:
+        await collection.bulk_write(updates, ordered=False)
+
+
+class Forward:
+    @free_fall_migration(document_models=[FolderDB, FolderFreezeDB])
+    async def add_folder_ancestors(self, session):
+        for model in (FolderDB, FolderFreezeDB):
+            await _backfill(model.get_motor_collection())
+
+
+class Backward:
+    @free_fall_migration(document_models=[FolderDB, FolderFreezeDB])
+    async def remove_folder_ancestors(self, session):
+        for model in (FolderDB, FolderFreezeDB):
+            await model.get_motor_collection().update_many(
+                {}, {"$unset": {"ancestors": "", "path": ""}}
+            )
@@ -0,0 +1,23 @@
+from app.models.files import FileFreezeDB
+from app.models.folders import FolderFreezeDB
+from beanie import free_fall_migration
+
+
+class Forward:
+    @free_fall_migration(document_models=[FileFreezeDB, FolderFreezeDB])
+    async def add_release_ids(self, session):
+        # released before releases could share documents, each belongs to the release it was copied for
+        for model in (FileFreezeDB, FolderFreezeDB):
+            await model.get_motor_collection().update_many(
+                {"release_ids": {"$exists": False}},
+                [{"$set": {"release_ids": ["$dataset_id"]}}],
+            )
+
+
+class Backward:
+    @free_fall_migration(document_models=[FileFreezeDB, FolderFreezeDB])
+    async def remove_release_ids(self, session):
+        for model in (FileFreezeDB, FolderFreezeDB):
+            await model.get_motor_collection().update_many(
+                {}, {"$unset": {"release_ids": ""}}
+            )
@@ -1,5 +1,6 @@
-from typing import Optional
+from typing import List, Optional
 
+from app.config import settings
 from beanie import PydanticObjectId
 from bson import ObjectId
 from bson.errors import InvalidId
@@ -27,3 +28,16 @@ class MongoDBRef(BaseModel):
     collection: str
     resource_id: PydanticObjectId
     version: Optional[int]
+
+
+def _released_stages(fields: dict) -> List[dict]:
+    """Stages applied to released files or folders in a view. With `FREEZE_SNAPSHOTS` one released document can
+    belong to several releases, it is listed once for each of them with `dataset_id` set to the release.
+    """
+    stages = [{"$addFields": fields}]
+    if settings.FREEZE_SNAPSHOTS:
+        stages += [
+            {"$unwind": "$release_ids"},
+            {"$addFields": {"dataset_id": "$release_ids"}},
+        ]
+    return stages
@@ -1,11 +1,27 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
 from beanie.odm.enums import SortDirection
+from bson import ObjectId, json_util
+from fastapi import HTTPException
 from pydantic import BaseModel
 
+# (field, direction) pairs, always ending with _id so that the order is total
+SortSpec = List[Tuple[str, int]]
+
+# what a sort key can hold, anything else in a cursor (e.g. {"$ne": null}) would be read by $match as an operator
+CURSOR_VALUE_TYPES = (type(None), bool, int, float, str, datetime, ObjectId)
+
 
 class PageMetadata(BaseModel):
-    total_count: int = 0
+    # None if the count was not requested
+    total_count: Optional[int] = 0
     skip: int = 0
     limit: int = 0
+    # pass as `cursor` to get the page after this one, None on the last page
+    next_cursor: Optional[str] = None
 
 
 class Paged(BaseModel):
@@ -49,12 +65,116 @@ def _get_page_query(
         }
 
 
-def _construct_page_metadata(items_and_counts, skip, limit):
-    if len(items_and_counts) > 0 and len(items_and_counts[0]["metadata"]) > 0:
+def _sort_spec(sort_field="created", ascending=True, sort_clause=None) -> SortSpec:
+    """Sort order of a listing in the form `_get_page_pipeline` and cursors use, with `_id` as the final tie breaker."""
+    if sort_clause is not None:
+        sort = list(sort_clause["$sort"].items())
+    else:
+        sort = [
+            (
+                sort_field,
+                SortDirection.ASCENDING if ascending else SortDirection.DESCENDING,
+            )
+        ]
+    if all(field != "_id" for field, _ in sort):
+        sort.append(("_id", sort[-1][1]))
+    return sort
+
+
+def _field_value(item: dict, field: str) -> Any:
+    for part in field.split("."):
+        item = item.get(part) if isinstance(item, dict) else None
+    return item
+
+
+def _encode_cursor(item: dict, sort: SortSpec) -> str:
+    values = [_field_value(item, field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort: SortSpec) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(sort)
+        or not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _keyset_match(sort: SortSpec, values: list) -> dict:
+    """Match the documents that come after `values` in `sort` order: equal on a prefix of the sort fields and past
+    the value on the next one."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prefix: values[j] for j, (prefix, _) in enumerate(sort[:i])}
+        clause[field] = {
+            "$gt" if direction == SortDirection.ASCENDING else "$lt": values[i]
+        }
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def _get_page_pipeline(
+    skip: int,
+    limit: int,
+    sort: SortSpec,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+) -> List[dict]:
+    """
+    Aggregation stages returning one page of a listing in the same shape as `_get_page_query`.
+
+    With a cursor the page starts right after the item the cursor was made from, found with a range match on the sort
+    key instead of skipping everything before it, so late pages cost the same as the first. Without `include_total`
+    the page stages run directly on the filtered documents rather than inside a `$facet`, so an index on the sort key
+    can serve them and only `limit` documents are read.
+
+    Args:
+        skip: number of items to skip, ignored when a cursor is given
+        limit: page size
+        sort: sort order, see `_sort_spec`
+        cursor: `next_cursor` of the previous page
+        include_total: whether to count all matching items
+    """
+    page = []
+    if cursor is not None:
+        page.append({"$match": _keyset_match(sort, _decode_cursor(cursor, sort))})
+    page.append({"$sort": dict(sort)})
+    if cursor is None and skip > 0:
+        page.append({"$skip": skip})
+    page.append({"$limit": limit})
+
+    if include_total:
+        return [{"$facet": {"metadata": [{"$count": "total_count"}], "data": page}}]
+    # the facet only wraps the page in the usual shape, it always yields one document even if the page is empty
+    return page + [{"$facet": {"data": [{"$skip": 0}]}}]
+
+
+def _construct_page_metadata(
+    items_and_counts,
+    skip,
+    limit,
+    sort: Optional[SortSpec] = None,
+    include_total: bool = True,
+):
+    if len(items_and_counts) > 0 and len(items_and_counts[0].get("metadata", [])) > 0:
         page_metadata = PageMetadata(
             **items_and_counts[0]["metadata"][0], skip=skip, limit=limit
         )
     else:
         page_metadata = PageMetadata(skip=skip, limit=limit)
+    if not include_total:
+        page_metadata.total_count = None
+
+    # a full page may be followed by more items
+    if sort is not None and len(items_and_counts) > 0:
+        data = items_and_counts[0]["data"]
+        if limit > 0 and len(data) == limit:
+            page_metadata.next_cursor = _encode_cursor(data[-1], sort)
 
     return page_metadata
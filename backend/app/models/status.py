@@ -1,6 +1,63 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
 from app.config import settings
 from pydantic import BaseModel
 
 
 class Status(BaseModel):
     version: str = settings.version
+
+
+class StoragePoolStatus(BaseModel):
+    """Usage of one connection pool of the shared Minio clients."""
+
+    client: str
+    host: str
+    port: int
+    maxsize: int
+    in_use: int
+    connections_opened: int
+    requests: int
+
+
+class IndexUsage(BaseModel):
+    """Operations served by one index since the server started or the index was built, from `$indexStats`."""
+
+    name: str
+    key: Dict[str, Any]
+    ops: int
+    since: Optional[datetime] = None
+
+
+class CollectionIndexStatus(BaseModel):
+    collection: str
+    indexes: List[IndexUsage]
+
+
+class QueryPlanStatus(BaseModel):
+    """Winning plan of a query shape the routers run, with `collscan` set when no index can serve it."""
+
+    collection: str
+    filter: List[str]
+    sort: List[str] = []
+    stages: List[str]
+    indexes: List[str] = []
+    collscan: bool
+
+
+class ProfiledCollscan(BaseModel):
+    """Operations recorded by the database profiler that scanned a whole collection, grouped by filtered fields."""
+
+    collection: str
+    op: str
+    filter: List[str]
+    count: int
+    max_millis: int
+    last_seen: datetime
+
+
+class IndexStatus(BaseModel):
+    collections: List[CollectionIndexStatus]
+    query_plans: List[QueryPlanStatus]
+    profiled_collscans: List[ProfiledCollscan] = []
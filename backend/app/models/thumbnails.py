@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+import pymongo
 from app.models.files import ContentType
 from app.models.users import UserOut
 from beanie import Document, PydanticObjectId, View
@@ -35,6 +36,9 @@ class ThumbnailFreezeDB(Document, ThumbnailBaseCommon):
 
     class Settings:
         name = "thumbnails_freeze"
+        indexes = [
+            pymongo.IndexModel([("origin_id", pymongo.ASCENDING)], background=True),
+        ]
 
 
 class ThumbnailDBViewList(View, ThumbnailBaseCommon):
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import pymongo
+from app.config import settings
+from app.models.users import UserOut
+from beanie import Document, PydanticObjectId
+from pydantic import BaseModel, Field
+
+
+class UploadChunk(BaseModel):
+    """A chunk received for an upload session. Chunks map one-to-one to Minio multipart parts."""
+
+    chunk_num: int
+    etag: str
+    bytes: int = 0
+    created: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UploadSessionBase(BaseModel):
+    name: str
+    content_type: Optional[str] = None
+    folder_id: Optional[PydanticObjectId] = None
+
+
+class UploadSessionIn(UploadSessionBase):
+    pass
+
+
+class UploadSessionDB(Document, UploadSessionBase):
+    """Resumable upload of a single file in numbered chunks. The Minio object is keyed by `file_id`, which becomes the
+    ID of the FileDB entry when the session is committed.
+
+    Presigned sessions let the client send bytes straight to Minio, either as one PUT (no `upload_id`) or as
+    multipart parts, in which case Minio rather than `chunks` is the record of what has been received.
+    """
+
+    dataset_id: PydanticObjectId
+    file_id: PydanticObjectId = Field(default_factory=PydanticObjectId)
+    upload_id: Optional[
+        str
+    ] = None  # Minio multipart upload, None for a single presigned PUT
+    presigned: bool = False
+    chunk_size: int = settings.MINIO_UPLOAD_CHUNK_SIZE
+    # keyed by str(chunk_num) so a single chunk can be set atomically
+    chunks: Dict[str, UploadChunk] = {}
+    creator: UserOut
+    created: datetime = Field(default_factory=datetime.utcnow)
+    modified: datetime = Field(default_factory=datetime.utcnow)
+    expires: datetime = Field(
+        default_factory=lambda: datetime.utcnow()
+        + timedelta(seconds=settings.UPLOAD_SESSION_EXPIRATION)
+    )
+
+    class Settings:
+        name = "upload_sessions"
+        indexes = [
+            [("dataset_id", pymongo.ASCENDING)],
+            [("expires", pymongo.ASCENDING)],
+        ]
+
+
+class UploadSessionOut(UploadSessionDB):
+    class Config:
+        fields = {"id": "id"}
@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
+import pymongo
 from beanie import Document
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr, Field
@@ -58,6 +59,14 @@ class UserAPIKeyBase(BaseModel):
 class UserAPIKeyDB(Document, UserAPIKeyBase):
     class Settings:
         name = "user_keys"
+        indexes = [
+            pymongo.IndexModel(
+                [("user", pymongo.ASCENDING), ("key", pymongo.ASCENDING)],
+                background=True,
+            ),
+            # removal of expired keys, see api_key_sweeper
+            pymongo.IndexModel([("expires", pymongo.ASCENDING)], background=True),
+        ]
 
 
 class UserAPIKeyOut(UserAPIKeyDB):
@@ -74,3 +83,11 @@ class ListenerAPIKeyBase(UserAPIKeyBase):
 class ListenerAPIKeyDB(Document, ListenerAPIKeyBase):
     class Settings:
         name = "listener_keys"
+        indexes = [
+            pymongo.IndexModel(
+                [("user", pymongo.ASCENDING), ("key", pymongo.ASCENDING)],
+                background=True,
+            ),
+            # removal of expired keys, see api_key_sweeper
+            pymongo.IndexModel([("expires", pymongo.ASCENDING)], background=True),
+        ]
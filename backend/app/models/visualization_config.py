@@ -1,5 +1,6 @@
 from typing import List, Optional
 
+import pymongo
 from app.models.listeners import EventListenerJobDB, ExtractorInfo
 from app.models.metadata import MongoDBRef
 from app.models.visualization_data import VisualizationDataOut
@@ -29,10 +30,21 @@ class VisualizationConfigBaseCommon(VisualizationConfigBase):
 class VisualizationConfigDB(Document, VisualizationConfigBaseCommon):
     class Settings:
         name = "visualization_config"
+        indexes = [
+            pymongo.IndexModel(
+                [
+                    ("resource.resource_id", pymongo.ASCENDING),
+                    ("resource.collection", pymongo.ASCENDING),
+                ],
+                background=True,
+            ),
+        ]
 
 
 class VisualizationConfigFreezeDB(Document, VisualizationConfigBaseCommon):
     frozen: bool = True
+    # hash of the content it was released with, see app.db.dataset.diff
+    content_hash: Optional[str] = None
 
     class Settings:
         name = "visualization_config_freeze"
@@ -2,6 +2,7 @@ import json
 from datetime import datetime
 from typing import Optional
 
+import pymongo
 from app.models.files import ContentType
 from app.models.users import UserOut
 from beanie import Document, PydanticObjectId, View
@@ -40,10 +41,17 @@ class VisualizationDataBaseCommon(VisualizationDataBase):
 class VisualizationDataDB(Document, VisualizationDataBaseCommon):
     class Settings:
         name = "visualization_data"
+        indexes = [
+            pymongo.IndexModel(
+                [("visualization_config_id", pymongo.ASCENDING)], background=True
+            ),
+        ]
 
 
 class VisualizationDataFreezeDB(Document, VisualizationDataBaseCommon):
     frozen: bool = True
+    # hash of the content it was released with, see app.db.dataset.diff
+    content_hash: Optional[str] = None
 
     class Settings:
         name = "visualization_data_freeze"
@@ -1,14 +1,16 @@
 import json
 
+from app.db.resolver import _get_by_id
 from app.keycloak_auth import (
+    RequestIdentity,
     create_user,
     enable_disable_user,
     get_current_user,
+    get_identity,
     keycloak_openid,
 )
 from app.models.datasets import DatasetDBViewList
 from app.models.users import UserDB, UserIn, UserLogin, UserOut
-from beanie import PydanticObjectId
 from fastapi import APIRouter, Depends, HTTPException
 from keycloak.exceptions import (
     KeycloakAuthenticationError,
@@ -97,36 +99,27 @@ async def authenticate_user(email: str, password: str):
 
 @router.get("/users/me/is_admin", response_model=bool)
 async def get_admin(
-    dataset_id: str = None, current_username=Depends(get_current_user)
+    dataset_id: str = None, identity: RequestIdentity = Depends(get_identity)
 ) -> bool:
-    if (
-        current_user := await UserDB.find_one(UserDB.email == current_username.email)
-    ) is not None:
+    if (current_user := await identity.get_user()) is not None:
         if current_user.admin:
             return current_user.admin
     elif (
         dataset_id
-        and (
-            dataset_db := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id)
-            )
-        )
-        is not None
+        and (dataset_db := await _get_by_id(DatasetDBViewList, dataset_id)) is not None
     ):
         # TODO: question regarding resource creator is considered as admin of the resource?
-        return dataset_db.creator.email == current_username.email
+        return dataset_db.creator.email == identity.email
     else:
         return False
 
 
 @router.get("/users/me/admin_mode")
 async def get_admin_mode(
-    enable_admin: bool = False, current_username=Depends(get_current_user)
+    enable_admin: bool = False, identity: RequestIdentity = Depends(get_identity)
 ) -> bool:
-    """Get Admin mode from User Object."""
-    if (
-        current_user := await UserDB.find_one(UserDB.email == current_username.email)
-    ) is not None:
+    """Get Admin mode from User Object. Shares the user lookup of the request."""
+    if (current_user := await identity.get_user()) is not None:
         if current_user.admin:
             if enable_admin:
                 return True
@@ -148,12 +141,10 @@ async def get_admin_mode(
 async def set_admin_mode(
     admin_mode_on: bool,
     admin=Depends(get_admin),
-    current_username=Depends(get_current_user),
+    identity: RequestIdentity = Depends(get_identity),
 ) -> bool:
     """Set Admin mode from User Object."""
-    if (
-        current_user := await UserDB.find_one(UserDB.email == current_username.email)
-    ) is not None:
+    if (current_user := await identity.get_user()) is not None:
         # only admin can set admin mode
         if admin:
             current_user.admin_mode = admin_mode_on
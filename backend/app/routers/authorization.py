@@ -1,13 +1,24 @@
+from app.db.resolver import _get_by_id
 from app.dependencies import get_elasticsearchclient
 from app.deps.authorization_deps import (
     Authorization,
+    _resolve_dataset_roles,
+    _resolve_file_roles,
+    _resolve_metadata_roles,
     get_role_by_file,
     get_role_by_group,
     get_role_by_metadata,
 )
-from app.keycloak_auth import get_current_username, get_user
+from app.keycloak_auth import (
+    RequestIdentity,
+    get_current_username,
+    get_identity,
+    get_user,
+)
 from app.models.authorization import (
     AuthorizationBase,
+    AuthorizationBatchIn,
+    AuthorizationBatchOut,
     AuthorizationDB,
     AuthorizationMetadata,
     AuthorizationOut,
@@ -91,9 +102,7 @@ async def get_dataset_role(
     )
     if auth_db is None:
         if (
-            current_dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id)
-            )
+            current_dataset := await _get_by_id(DatasetDBViewList, dataset_id)
         ) is not None:
             if (
                 current_dataset.status == DatasetStatus.AUTHENTICATED.name
@@ -156,14 +165,39 @@ async def get_metadata_role(
     return role
 
 
+@router.post("/batch", response_model=AuthorizationBatchOut)
+async def get_roles(
+    resources: AuthorizationBatchIn,
+    current_user=Depends(get_current_username),
+    enable_admin: bool = False,
+    admin_mode: bool = Depends(get_admin_mode),
+    admin=Depends(get_admin),
+):
+    """Retrieve the roles of the user on many datasets, files and metadata at once, as the single resource role
+    endpoints would return them. A resource maps to null if the user has no role on it or it does not exist.
+    """
+    if admin and admin_mode:
+        return AuthorizationBatchOut(
+            datasets={str(i): RoleType.OWNER for i in resources.dataset_ids},
+            files={str(i): RoleType.OWNER for i in resources.file_ids},
+            metadata={str(i): RoleType.OWNER for i in resources.metadata_ids},
+        )
+    files = await _resolve_file_roles(current_user, resources.file_ids)
+    return AuthorizationBatchOut(
+        datasets=await _resolve_dataset_roles(current_user, resources.dataset_ids),
+        files={str(i): files.get(str(i)) for i in resources.file_ids},
+        metadata=await _resolve_metadata_roles(current_user, resources.metadata_ids),
+    )
+
+
 @router.get("/groups/{group_id}/role", response_model=RoleType)
 async def get_group_role(
     group_id: str,
-    current_user=Depends(get_current_username),
+    identity: RequestIdentity = Depends(get_identity),
     role: RoleType = Depends(get_role_by_group),
 ):
     """Retrieve role of user on a particular group (i.e. whether they can change group memberships)."""
-    if (user := await UserDB.find_one(UserDB.email == current_user)) is not None:
+    if (user := await identity.get_user()) is not None:
         # return viewer if read only user
         if user.read_only_user:
             return RoleType.VIEWER
@@ -184,9 +218,7 @@ async def set_dataset_group_role(
     allow: bool = Depends(Authorization("editor")),
 ):
     """Assign an entire group a specific role for a dataset."""
-    if (
-        dataset := await DatasetDBViewList.find_one(DatasetDBViewList.id == dataset_id)
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if (group := await GroupDB.get(group_id)) is not None:
             # First, remove any existing role the group has on the dataset
             await remove_dataset_group_role(dataset_id, group_id, es, user_id, allow)
@@ -287,11 +319,7 @@ async def set_dataset_user_role(
 ):
     """Assign a single user a specific role for a dataset."""
 
-    if (
-        dataset := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if (user := await UserDB.find_one(UserDB.email == username)) is not None:
             # First, remove any existing role the user has on the dataset
             await remove_dataset_user_role(dataset_id, username, es, user_id, allow)
@@ -357,9 +385,7 @@ async def remove_dataset_group_role(
 ):
     """Remove any role the group has with a specific dataset."""
 
-    if (
-        dataset := await DatasetDBViewList.find_one(DatasetDBViewList.id == dataset_id)
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if (group := await GroupDB.get(group_id)) is not None:
             if (
                 auth_db := await AuthorizationDB.find_one(
@@ -397,11 +423,7 @@ async def remove_dataset_user_role(
 ):
     """Remove any role the user has with a specific dataset."""
 
-    if (
-        dataset := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if (await UserDB.find_one(UserDB.email == username)) is not None:
             if (
                 auth_db := await AuthorizationDB.find_one(
@@ -429,11 +451,7 @@ async def get_dataset_roles(
     allow: bool = Depends(Authorization("editor")),
 ):
     """Get a list of all users and groups that have assigned roles on this dataset."""
-    if (
-        dataset := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         roles = DatasetRoles(dataset_id=str(dataset.id))
 
         async for auth in AuthorizationDB.find(
@@ -1,29 +1,42 @@
 import datetime
-import hashlib
-import io
 import os
 import shutil
 import tempfile
 import zipfile
-from collections.abc import Iterable, Mapping
 from typing import List, Optional
 
 from app import dependencies
 from app.config import settings
-from app.db.dataset.download import _increment_data_downloads
+from app.db import role_cache
+from app.db.dataset.diff import _diff_dataset
+from app.db.dataset.download import (
+    _archive_name,
+    _dataset_archive_response,
+    _frozen_archive_key,
+    _frozen_archive_ready,
+    _increment_data_downloads,
+    _schedule_frozen_archive,
+)
+from app.db.dataset.freeze import _create_freeze_job, _freeze_dataset
+from app.db.dataset.ingest import (
+    TAR_SUFFIXES,
+    _archive_suffix,
+    _create_archive_dataset,
+    _ingest_tar,
+    _ingest_zip,
+    zstandard,
+)
 from app.db.dataset.version import (
     _delete_frozen_dataset,
     _delete_thumbnail,
     _delete_visualizations,
-    _freeze_dataset_metadata,
-    _freeze_dataset_thumbnail,
-    _freeze_dataset_visualization,
-    _freeze_files_folders_w_metadata_vis,
     remove_file_entry,
 )
-from app.db.folder.hierarchy import _get_folder_hierarchy
+from app.db.file.upload import _delete_upload_session
+from app.db.folder.hierarchy import _child_lineage, _move_folder, _subtree_query
+from app.db.resolver import _get_by_id
 from app.deps.authorization_deps import Authorization, CheckStatus
-from app.keycloak_auth import get_current_user, get_token, get_user
+from app.keycloak_auth import get_current_user, get_user
 from app.models.authorization import AuthorizationDB, RoleType
 from app.models.datasets import (
     DatasetBase,
@@ -45,15 +58,24 @@ from app.models.folders import (
     FolderOut,
     FolderPatch,
 )
+from app.models.freeze_jobs import FreezeJobDB, FreezeJobOut
+from app.models.ingestion import IngestionJobDB, IngestionJobOut
 from app.models.licenses import standard_licenses
-from app.models.metadata import MetadataDB
-from app.models.pages import Paged, _construct_page_metadata, _get_page_query
+from app.models.metadata import MetadataDB, MetadataDBViewList
+from app.models.pages import (
+    Paged,
+    _construct_page_metadata,
+    _get_page_pipeline,
+    _get_page_query,
+    _sort_spec,
+)
 from app.models.thumbnails import ThumbnailDB
-from app.models.users import UserOut
+from app.models.uploads import UploadSessionDB
 from app.rabbitmq.listeners import submit_dataset_job
 from app.routers.authentication import get_admin, get_admin_mode
 from app.routers.files import add_file_entry, add_local_file_entry
 from app.routers.licenses import delete_license
+from app.routers.utils import get_presigned_url
 from app.search.connect import delete_document_by_id
 from app.search.index import (
     index_dataset,
@@ -61,18 +83,26 @@ from app.search.index import (
     index_folder,
     remove_folder_index,
 )
+from app.storage.backend import StorageBackend
 from beanie import PydanticObjectId
-from beanie.operators import And, Or
-from bson import ObjectId, json_util
+from beanie.operators import And, In, Or
+from bson import ObjectId
 from elasticsearch import Elasticsearch
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    HTTPException,
+    Request,
+    UploadFile,
+)
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
-from minio import Minio
 from pika.adapters.blocking_connection import BlockingChannel
 from pymongo import DESCENDING
-from rocrate.model.person import Person
-from rocrate.rocrate import ROCrate
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 
 router = APIRouter()
 security = HTTPBearer()
@@ -80,111 +110,6 @@ security = HTTPBearer()
 clowder_bucket = os.getenv("MINIO_BUCKET_NAME", "clowder")
 
 
-def _describe_zip_contents(file_list: list):
-    """Traverse a list of zipfile entries and create a dictionary structure like so:
-    {
-        ""__CLOWDER_FILE_LIST__"": ['list', 'of', 'root', 'files'],
-        "folder_1": {
-            ""__CLOWDER_FILE_LIST__"": ['list', 'of', 'folder_1', 'files']
-        },
-        "folder_2": {
-            ""__CLOWDER_FILE_LIST__"": ['list', 'of', 'folder_2', 'files'],
-            "subfolder_3": {
-                ""__CLOWDER_FILE_LIST__"": ['list', 'of', subfolder_3', 'files']
-            },
-        },
-        ...
-    }
-    """
-    empty_entry = {"__CLOWDER_FILE_LIST__": []}
-
-    def path_parts_to_dict(entries, last_is_file=True):
-        if len(entries) == 1:
-            if last_is_file:
-                return {"__CLOWDER_FILE_LIST__": [entries[0]]}
-            else:
-                return {entries[0]: empty_entry.copy()}
-        else:
-            return {entries[0]: path_parts_to_dict(entries[1:])}
-
-    def nested_update(target_dict, update_dict):
-        for k, v in update_dict.items():
-            if isinstance(v, Mapping):
-                current = target_dict[k] if k in target_dict else {}
-                target_dict[k] = nested_update(current, v)
-            elif isinstance(v, Iterable):
-                current = target_dict[k] if k in target_dict else []
-                if v not in current:
-                    target_dict[k] = list(set(current + v))
-            else:
-                target_dict[k] = v
-        return target_dict
-
-    zip_structure = empty_entry.copy()
-    for entry in file_list:
-        if "__MACOSX" in entry or entry.endswith(".DS_Store"):
-            # TODO: These are not visible in OSX 10.3+ and hard to delete. Leaving this in to minimize user frustration.
-            continue
-        if entry.endswith(os.path.sep):
-            # this is a folder, not a file
-            folder_parts = os.path.normpath(entry).split(os.path.sep)
-            if len(folder_parts) > 1:
-                folder_dict = path_parts_to_dict(folder_parts, False)
-                zip_structure = nested_update(zip_structure, folder_dict)
-            elif entry not in zip_structure:
-                zip_structure[entry.rstrip(os.path.sep)] = empty_entry.copy()
-            continue
-
-        parts = os.path.normpath(entry).split(os.path.sep)
-        if len(parts) > 1:
-            parts_dict = path_parts_to_dict(parts)
-            zip_structure = nested_update(zip_structure, parts_dict)
-        else:
-            zip_structure["__CLOWDER_FILE_LIST__"].append(entry)
-
-    return zip_structure
-
-
-async def _create_folder_structure(
-    dataset_id: str,
-    contents: dict,
-    folder_path: str,
-    folder_lookup: dict,
-    user: UserOut,
-    parent_folder_id: Optional[str] = None,
-):
-    """Recursively create folders encountered in folder_path until the target folder is created.
-    Arguments:
-        - dataset_id: destination dataset
-        - contents: list of contents in folder (see _describe_zip_contents() for structure)
-        - folder_path: full path to folder from dataset root (e.g. folder/subfolder/subfolder2)
-        - folder_lookup: mapping from folder_path to folder_id for reference later
-        - parent_folder_id: destination folder
-    """
-    for k, v in contents.items():
-        if k == "__CLOWDER_FILE_LIST__":
-            continue
-
-        # Create the folder
-        folder_dict = {
-            "dataset_id": dataset_id,
-            "name": k,
-            "parent_folder": parent_folder_id,
-        }
-        folder_db = FolderDB(**folder_dict, creator=user)
-        await folder_db.insert()
-
-        # Store ID and call recursively on child folders
-        new_folder_path = folder_path + os.path.sep + k
-        folder_lookup[new_folder_path] = folder_db.id
-        if isinstance(v, Mapping):
-            folder_lookup = await _create_folder_structure(
-                dataset_id, v, new_folder_path, folder_lookup, user, folder_db.id
-            )
-
-    return folder_lookup
-
-
 @router.post("", response_model=DatasetOut)
 async def save_dataset(
     dataset_in: DatasetIn,
@@ -222,18 +147,21 @@ async def get_datasets(
     user_id=Depends(get_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     mine: bool = False,
     admin=Depends(get_admin),
     enable_admin: bool = False,
     admin_mode: bool = Depends(get_admin_mode),
 ):
+    sort = _sort_spec("created", ascending=False)
     query = [DatasetDBViewList.frozen == False]  # noqa: E712
 
     if admin and admin_mode and not mine:
         datasets_and_count = (
             await DatasetDBViewList.find(*query)
             .aggregate(
-                [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+                _get_page_pipeline(skip, limit, sort, cursor, include_total),
             )
             .to_list()
         )
@@ -242,7 +170,7 @@ async def get_datasets(
         datasets_and_count = (
             await DatasetDBViewList.find(*query)
             .aggregate(
-                [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+                _get_page_pipeline(skip, limit, sort, cursor, include_total),
             )
             .to_list()
         )
@@ -258,12 +186,14 @@ async def get_datasets(
         datasets_and_count = (
             await DatasetDBViewList.find(*query)
             .aggregate(
-                [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+                _get_page_pipeline(skip, limit, sort, cursor, include_total),
             )
             .to_list()
         )
 
-    page_metadata = _construct_page_metadata(datasets_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        datasets_and_count, skip, limit, sort, include_total
+    )
     # TODO have to change _id this way otherwise it won't work
     # TODO need to research if there is other pydantic trick to make it work
 
@@ -286,13 +216,7 @@ async def get_dataset(
     allow: bool = Depends(Authorization("viewer")),
 ):
     if authenticated or public or allow:
-        if (
-            dataset := await DatasetDBViewList.find_one(
-                Or(
-                    DatasetDBViewList.id == PydanticObjectId(dataset_id),
-                )
-            )
-        ) is not None:
+        if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
             return dataset.dict()
         raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
     else:
@@ -308,18 +232,15 @@ async def get_dataset_files(
     user_id=Depends(get_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     admin=Depends(get_admin),
     enable_admin: bool = False,
     admin_mode: bool = Depends(get_admin_mode),
     allow: bool = Depends(Authorization("viewer")),
 ):
-    if (
-        await DatasetDBViewList.find_one(
-            Or(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id),
-            )
-        )
-    ) is not None:
+    sort = _sort_spec("created", ascending=False)
+    if (await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if authenticated or public or (admin and admin_mode):
             query = [
                 FileDBViewList.dataset_id == ObjectId(dataset_id),
@@ -338,11 +259,13 @@ async def get_dataset_files(
         files_and_count = (
             await FileDBViewList.find(*query)
             .aggregate(
-                [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+                _get_page_pipeline(skip, limit, sort, cursor, include_total),
             )
             .to_list()
         )
-        page_metadata = _construct_page_metadata(files_and_count, skip, limit)
+        page_metadata = _construct_page_metadata(
+            files_and_count, skip, limit, sort, include_total
+        )
         page = Paged(
             metadata=page_metadata,
             data=[
@@ -429,7 +352,7 @@ async def patch_dataset(
 @router.delete("/{dataset_id}")
 async def delete_dataset(
     dataset_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("editor")),
 ):
@@ -466,9 +389,16 @@ async def delete_dataset(
         ):
             await remove_file_entry(file.id, fs, es)
 
+        # abort unfinished uploads
+        async for session in UploadSessionDB.find(
+            UploadSessionDB.dataset_id == PydanticObjectId(dataset_id)
+        ):
+            await _delete_upload_session(session, fs)
+
         await AuthorizationDB.find(
             AuthorizationDB.dataset_id == PydanticObjectId(dataset_id)
         ).delete()
+        role_cache.invalidate_roles(dataset_id)
 
         # don't delete standard license
         standard_license_ids = [license.id for license in standard_licenses]
@@ -485,66 +415,19 @@ async def delete_dataset(
 @router.post("/{dataset_id}/freeze", response_model=DatasetFreezeOut)
 async def freeze_dataset(
     dataset_id: str,
+    background_tasks: BackgroundTasks,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization(RoleType.OWNER)),
 ):
-    # Retrieve the dataset by ID
+    """Release the current state of a dataset as a new version. The copy is written in the background, its progress is
+    reported by `/datasets/{dataset_id}/freeze_jobs`."""
     if (dataset := await DatasetDB.get(PydanticObjectId(dataset_id))) is not None:
-        frozen_dataset_data = dataset.dict()
-
-        # Copy the dataset to Public Freeze Dataset collection
-        # else search in freeze dataset collection to get the latest version of the dataset
-        latest_frozen_dataset = (
-            await DatasetFreezeDB.find(
-                DatasetFreezeDB.origin_id == PydanticObjectId(dataset_id)
-            )
-            .sort(("frozen_version_num", DESCENDING))
-            .first_or_none()
+        job, frozen_dataset = await _create_freeze_job(dataset, user)
+        background_tasks.add_task(
+            _freeze_dataset, job, dataset, frozen_dataset, user, fs
         )
-
-        frozen_dataset_data["origin_id"] = frozen_dataset_data.pop("id")
-
-        if latest_frozen_dataset is None:
-            # if no origin id associated with that dataset, freeze it as the very fist version
-            frozen_dataset_data["frozen_version_num"] = 1
-        else:
-            frozen_dataset_data["frozen_version_num"] = (
-                latest_frozen_dataset.frozen_version_num + 1
-            )
-
-        # start freezing associate information
-        frozen_dataset_data["frozen"] = True
-
-        # if dataset has thumbnail
-        if dataset.thumbnail_id is not None:
-            frozen_dataset_thumbnail_id = await _freeze_dataset_thumbnail(
-                dataset.thumbnail_id
-            )
-            frozen_dataset_data["thumbnail_id"] = frozen_dataset_thumbnail_id
-
-        frozen_dataset = DatasetFreezeDB(**frozen_dataset_data)
-        await frozen_dataset.insert()
-
-        # dataset metadata
-        await _freeze_dataset_metadata(dataset_id, frozen_dataset.id)
-
-        # dataset visualization
-        await _freeze_dataset_visualization(dataset_id, frozen_dataset.id)
-
-        # recursively freeze both files, folders, and associate metadata, visualization (if any)
-        await _freeze_files_folders_w_metadata_vis(dataset_id, frozen_dataset.id)
-
-        # Create authorization entry
-        await AuthorizationDB(
-            dataset_id=frozen_dataset.id,
-            role=RoleType.OWNER,
-            creator=user.email,
-        ).save()
-
-        # TODO thumbnails, visualizations
-
         return frozen_dataset.dict()
 
     raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
@@ -556,7 +439,7 @@ async def get_freeze_datasets(
     skip: int = 0,
     limit: int = 10,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("owner")),
 ):
@@ -589,7 +472,7 @@ async def get_freeze_datasets(
 async def get_freeze_dataset_lastest_version_num(
     dataset_id: str,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("owner")),
 ):
@@ -614,7 +497,7 @@ async def get_freeze_dataset_version(
     dataset_id: str,
     frozen_version_num: int,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("owner")),
 ):
@@ -646,7 +529,7 @@ async def delete_freeze_dataset_version(
     dataset_id: str,
     frozen_version_num: int,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("owner")),
 ):
@@ -674,14 +557,19 @@ async def add_folder(
     allow: bool = Depends(Authorization("uploader")),
 ):
     if (await DatasetDB.get(PydanticObjectId(dataset_id))) is not None:
-        parent_folder = folder_in.parent_folder
-        if parent_folder is not None:
-            if (await FolderDB.get(PydanticObjectId(parent_folder))) is None:
+        parent = None
+        if (parent_folder := folder_in.parent_folder) is not None:
+            if (parent := await FolderDB.get(PydanticObjectId(parent_folder))) is None:
                 raise HTTPException(
                     status_code=400, detail=f"Parent folder {parent_folder} not found"
                 )
+        ancestors, path = _child_lineage(parent, folder_in.name)
         new_folder = FolderDB(
-            **folder_in.dict(), creator=user, dataset_id=PydanticObjectId(dataset_id)
+            **folder_in.dict(),
+            creator=user,
+            dataset_id=PydanticObjectId(dataset_id),
+            ancestors=ancestors,
+            path=path,
         )
         await new_folder.insert()
         await index_folder(es, FolderOut(**new_folder.dict()))
@@ -700,13 +588,7 @@ async def get_dataset_folders(
     limit: int = 10,
     allow: bool = Depends(Authorization("viewer")),
 ):
-    if (
-        await DatasetDBViewList.find_one(
-            Or(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id),
-            )
-        )
-    ) is not None:
+    if (await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if authenticated or public:
             query = [
                 FolderDBViewList.dataset_id == ObjectId(dataset_id),
@@ -754,18 +636,22 @@ async def get_dataset_folders_and_files(
     user_id=Depends(get_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     admin=Depends(get_admin),
     enable_admin: bool = False,
     admin_mode: bool = Depends(get_admin_mode),
     allow: bool = Depends(Authorization("viewer")),
 ):
-    if (
-        await DatasetDBViewList.find_one(
-            Or(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id),
-            )
-        )
-    ) is not None:
+    sort = _sort_spec(
+        sort_clause={
+            "$sort": {
+                "object_type": -1,  # folder first
+                "created": -1,  # then sort by created descendingly
+            }
+        }
+    )
+    if (await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if authenticated or public or (admin and admin_mode):
             query = [
                 FolderFileViewList.dataset_id == ObjectId(dataset_id),
@@ -798,22 +684,13 @@ async def get_dataset_folders_and_files(
         folders_files_and_count = (
             await FolderFileViewList.find(*query)
             .aggregate(
-                [
-                    _get_page_query(
-                        skip,
-                        limit,
-                        sort_clause={
-                            "$sort": {
-                                "object_type": -1,  # folder first
-                                "created": -1,  # then sort by created descendingly
-                            }
-                        },
-                    )
-                ],
+                _get_page_pipeline(skip, limit, sort, cursor, include_total),
             )
             .to_list()
         )
-        page_metadata = _construct_page_metadata(folders_files_and_count, skip, limit)
+        page_metadata = _construct_page_metadata(
+            folders_files_and_count, skip, limit, sort, include_total
+        )
         page = Paged(
             metadata=page_metadata,
             data=[
@@ -831,37 +708,22 @@ async def get_dataset_folders_and_files(
 async def delete_folder(
     dataset_id: str,
     folder_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(Authorization("editor")),
 ):
     if (await DatasetDB.get(PydanticObjectId(dataset_id))) is not None:
         if (folder := await FolderDB.get(PydanticObjectId(folder_id))) is not None:
-            # delete current folder and files
-            async for file in FileDB.find(FileDB.folder_id == ObjectId(folder_id)):
+            # the folder and everything nested in it
+            subtree = [
+                subfolder.id
+                async for subfolder in FolderDB.find(_subtree_query(folder.id))
+            ]
+            async for file in FileDB.find(In(FileDB.folder_id, subtree)):
                 await remove_file_entry(file.id, fs, es)
-
-            # recursively delete child folder and files
-            async def _delete_nested_folders(parent_folder_id):
-                while (
-                    await FolderDB.find_one(
-                        FolderDB.dataset_id == ObjectId(dataset_id),
-                        FolderDB.parent_folder == ObjectId(parent_folder_id),
-                    )
-                ) is not None:
-                    async for subfolder in FolderDB.find(
-                        FolderDB.dataset_id == PydanticObjectId(dataset_id),
-                        FolderDB.parent_folder == PydanticObjectId(parent_folder_id),
-                    ):
-                        async for file in FileDB.find(FileDB.folder_id == subfolder.id):
-                            await remove_file_entry(file.id, fs, es)
-                        await _delete_nested_folders(subfolder.id)
-                        await subfolder.delete()
-                        await remove_folder_index(subfolder.id, es)
-
-            await _delete_nested_folders(folder_id)
-            await folder.delete()
-            await remove_folder_index(folder.id, es)
+            await FolderDB.find(In(FolderDB.id, subtree)).delete()
+            for subfolder_id in subtree:
+                await remove_folder_index(subfolder_id, es)
             return {"deleted": folder_id}
         else:
             raise HTTPException(status_code=404, detail=f"Folder {folder_id} not found")
@@ -874,13 +736,7 @@ async def get_folder(
     folder_id: str,
     allow: bool = Depends(Authorization("viewer")),
 ):
-    if (
-        await DatasetDBViewList.find_one(
-            Or(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id),
-            )
-        )
-    ) is not None:
+    if (await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if (folder := await FolderDB.get(PydanticObjectId(folder_id))) is not None:
             return folder.dict()
         else:
@@ -899,18 +755,22 @@ async def patch_folder(
 ):
     if await DatasetDB.get(PydanticObjectId(dataset_id)) is not None:
         if (folder := await FolderDB.get(PydanticObjectId(folder_id))) is not None:
-            # update folder
-            if folder_info.name is not None:
-                folder.name = folder_info.name
             # allow moving folder around within the hierarchy
+            parent = None
             if folder_info.parent_folder is not None:
-                if (
-                    await FolderDB.get(PydanticObjectId(folder_info.parent_folder))
-                    is not None
+                parent = await FolderDB.get(PydanticObjectId(folder_info.parent_folder))
+                if parent is not None and (
+                    parent.id == folder.id or folder.id in parent.ancestors
                 ):
-                    folder.parent_folder = folder_info.parent_folder
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Folder {folder_id} cannot be moved into itself",
+                    )
+            if parent is None and folder.parent_folder is not None:
+                parent = await FolderDB.get(folder.parent_folder)
             folder.modified = datetime.datetime.utcnow()
-            await folder.save()
+            # update folder along with the ancestors and paths of its subfolders
+            await _move_folder(folder, parent, folder_info.name or folder.name)
             await index_folder(es, FolderOut(**folder.dict()), update=True)
 
             return folder.dict()
@@ -928,7 +788,7 @@ async def save_file(
     dataset_id: str,
     folder_id: Optional[str] = None,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     file: UploadFile = File(...),
     es=Depends(dependencies.get_elasticsearchclient),
     rabbitmq_client: BlockingChannel = Depends(dependencies.get_rabbitmq),
@@ -981,7 +841,7 @@ async def save_files(
     files: List[UploadFile],
     folder_id: Optional[str] = None,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es=Depends(dependencies.get_elasticsearchclient),
     rabbitmq_client: BlockingChannel = Depends(dependencies.get_rabbitmq),
     allow: bool = Depends(Authorization("uploader")),
@@ -1093,243 +953,223 @@ async def save_local_file(
 
 @router.post("/createFromZip", response_model=DatasetOut)
 async def create_dataset_from_zip(
+    background_tasks: BackgroundTasks,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     file: UploadFile = File(...),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     rabbitmq_client: BlockingChannel = Depends(dependencies.get_rabbitmq),
-    token: str = Depends(get_token),
 ):
+    """Create a dataset from the folders and files of a zip archive. The dataset is returned right away and its contents
+    are added by a background ingestion job, see `GET /datasets/{dataset_id}/ingestions`.
+    """
     if file.filename.endswith(".zip") is False:
         raise HTTPException(status_code=404, detail="File is not a zip file")
 
-    # Read contents of zip file into temporary location
-    with tempfile.TemporaryFile() as tmp_zip:
-        tmp_zip.write(file.file.read())
+    # Copy the upload to a file that outlives the request, a chunk at a time
+    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp_zip:
+        await run_in_threadpool(
+            shutil.copyfileobj, file.file, tmp_zip, settings.MINIO_UPLOAD_CHUNK_SIZE
+        )
+    if not await run_in_threadpool(zipfile.is_zipfile, tmp_zip.name):
+        os.remove(tmp_zip.name)
+        raise HTTPException(status_code=400, detail="File is not a valid zip file")
 
-        with zipfile.ZipFile(tmp_zip, "r") as zip_file:
-            zip_contents = zip_file.namelist()
-            zip_directory = _describe_zip_contents(zip_contents)
+    dataset, job = await _create_archive_dataset(file.filename, ".zip", user, es)
+    background_tasks.add_task(
+        _ingest_zip, job, dataset, tmp_zip.name, user, fs, es, rabbitmq_client
+    )
+    return dataset.dict()
 
-        # Create dataset
-        dataset_in = {
-            "name": file.filename.rstrip(".zip"),
-            "description": "Uploaded as %s" % file.filename,
-        }
-        dataset = DatasetDB(**dataset_in, creator=user)
-        dataset.save()
 
-        # Create folders
-        folder_lookup = await _create_folder_structure(
-            dataset.id, zip_directory, "", {}, user
+@router.post("/createFromArchive", response_model=DatasetOut)
+async def create_dataset_from_archive(
+    filename: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    user=Depends(get_current_user),
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
+    rabbitmq_client: BlockingChannel = Depends(dependencies.get_rabbitmq),
+):
+    """Create a dataset from an archive sent as the raw request body, named by `filename` whose suffix gives the
+    format: .zip, .tar, .tar.gz/.tgz, .tar.bz2, .tar.xz or .tar.zst/.tzst.
+
+    Tar archives are read as a stream while the request is received: folders and files are created as their entries
+    arrive and the archive is never stored as a whole, so the dataset is returned once the upload is complete. Zip
+    archives need their central directory at the end, so they are saved to a temporary file first and unpacked by a
+    background job as in `createFromZip`. Progress is reported by `GET /datasets/{dataset_id}/ingestions`.
+
+    If a tar stream cannot be read to its end the dataset is removed again with everything stored so far, and the
+    request fails with 400, or 499 when the client disconnected.
+    """
+    if (suffix := _archive_suffix(filename)) is None:
+        raise HTTPException(
+            status_code=400, detail=f"Archive format of {filename} is not supported"
         )
 
-        # Go back through zipfile, this time uploading files to folders
-        with zipfile.ZipFile(tmp_zip, "r") as zip_file:
-            for entry in zip_contents:
-                if "__MACOSX" in entry or entry.endswith(".DS_Store"):
-                    # TODO: These are not visible in OSX 10.3+ and hard to delete. Leaving this in to minimize user frustration.
-                    continue
-
-                # Create temporary file and upload
-                if not entry.endswith(os.path.sep):
-                    filename = os.path.basename(entry)
-                    foldername = os.path.sep + os.path.dirname(entry)
-                    extracted = zip_file.extract(entry, path="/tmp")
-                    if foldername in folder_lookup:
-                        folder_id = folder_lookup[foldername]
-                        new_file = FileDB(
-                            name=filename,
-                            creator=user,
-                            dataset_id=dataset.id,
-                            folder_id=folder_id,
-                        )
-                    else:
-                        new_file = FileDB(
-                            name=filename, creator=user, dataset_id=dataset.id
-                        )
-                    with open(extracted, "rb") as file_reader:
-                        await add_file_entry(
-                            new_file,
-                            user,
-                            fs,
-                            es,
-                            rabbitmq_client,
-                            token,
-                            file_reader,
-                        )
-                    if os.path.isfile(extracted):
-                        os.remove(extracted)
+    if suffix == ".zip":
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as tmp_zip:
+            async for chunk in request.stream():
+                await run_in_threadpool(tmp_zip.write, chunk)
+        if not await run_in_threadpool(zipfile.is_zipfile, tmp_zip.name):
+            os.remove(tmp_zip.name)
+            raise HTTPException(status_code=400, detail="File is not a valid zip file")
+        dataset, job = await _create_archive_dataset(filename, suffix, user, es)
+        background_tasks.add_task(
+            _ingest_zip, job, dataset, tmp_zip.name, user, fs, es, rabbitmq_client
+        )
+        return dataset.dict()
 
+    compression = TAR_SUFFIXES[suffix]
+    if compression == "zst" and zstandard is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Zstandard archives are not supported, the zstandard package is not installed",
+        )
+    dataset, job = await _create_archive_dataset(filename, suffix, user, es)
+    try:
+        await _ingest_tar(
+            job, dataset, request.stream(), compression, user, fs, es, rabbitmq_client
+        )
+    except Exception as e:
+        await delete_dataset(str(dataset.id), fs, es, allow=True)
+        await job.delete()
+        if isinstance(e, ClientDisconnect):
+            raise HTTPException(
+                status_code=499,
+                detail="Client disconnected before the archive was complete",
+            )
+        raise HTTPException(
+            status_code=400, detail=f"Archive {filename} could not be read: {e}"
+        )
     return dataset.dict()
 
 
-@router.get("/{dataset_id}/download")
-async def download_dataset(
+@router.get("/{dataset_id}/ingestions", response_model=List[IngestionJobOut])
+async def get_dataset_ingestions(
     dataset_id: str,
-    es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
-    user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("viewer")),
+):
+    """Jobs that created the contents of a dataset from an archive, newest first."""
+    return (
+        await IngestionJobDB.find(
+            IngestionJobDB.dataset_id == PydanticObjectId(dataset_id)
+        )
+        .sort(("created", DESCENDING))
+        .to_list()
+    )
+
+
+@router.get("/{dataset_id}/ingestions/{job_id}", response_model=IngestionJobOut)
+async def get_dataset_ingestion(
+    dataset_id: str,
+    job_id: str,
     allow: bool = Depends(Authorization("viewer")),
 ):
     if (
-        dataset := await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
+        job := await IngestionJobDB.find_one(
+            IngestionJobDB.id == PydanticObjectId(job_id),
+            IngestionJobDB.dataset_id == PydanticObjectId(dataset_id),
         )
     ) is not None:
-        current_temp_dir = tempfile.mkdtemp(prefix="rocratedownload")
-        crate = ROCrate()
-        user_full_name = user.first_name + " " + user.last_name
-        user_crate_id = str(user.id)
-        crate.add(Person(crate, user_crate_id, properties={"name": user_full_name}))
-
-        manifest_path = os.path.join(current_temp_dir, "manifest-md5.txt")
-        bagit_path = os.path.join(current_temp_dir, "bagit.txt")
-        bag_info_path = os.path.join(current_temp_dir, "bag-info.txt")
-        tagmanifest_path = os.path.join(current_temp_dir, "tagmanifest-md5.txt")
-
-        with open(manifest_path, "w") as f:
-            pass  # Create empty file so no errors later if the dataset is empty
-
-        with open(bagit_path, "w") as f:
-            f.write("Bag-Software-Agent: clowder.ncsa.illinois.edu" + "\n")
-            f.write("Bagging-Date: " + str(datetime.datetime.now()) + "\n")
-
-        with open(bag_info_path, "w") as f:
-            f.write("BagIt-Version: 0.97" + "\n")
-            f.write("Tag-File-Character-Encoding: UTF-8" + "\n")
-
-        # Write dataset metadata if found
-        metadata = await MetadataDB.find(
-            MetadataDB.resource.resource_id == ObjectId(dataset_id)
-        ).to_list()
-        if len(metadata) > 0:
-            datasetmetadata_path = os.path.join(
-                current_temp_dir, "_dataset_metadata.json"
+        return job.dict()
+    raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found")
+
+
+@router.get("/{dataset_id}/diff")
+async def diff_dataset_versions(
+    dataset_id: str,
+    base: int,
+    target: Optional[int] = None,
+    allow: bool = Depends(Authorization("viewer")),
+):
+    """
+    Stream what was added, removed or modified between two releases of a dataset, given by `frozen_version_num`, or
+    between a release and the working draft if no `target` is given. Each line is one `DatasetChange` in JSON.
+    """
+    if (await DatasetDB.get(PydanticObjectId(dataset_id))) is None:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    releases = []
+    for frozen_version_num in (base, target):
+        if frozen_version_num is None:
+            releases.append(None)
+        elif (
+            release := await DatasetFreezeDB.find_one(
+                DatasetFreezeDB.origin_id == PydanticObjectId(dataset_id),
+                DatasetFreezeDB.frozen_version_num == frozen_version_num,
+                DatasetFreezeDB.deleted == False,  # noqa: E712
             )
-            metadata_content = json_util.dumps(metadata)
-            with open(datasetmetadata_path, "w") as f:
-                f.write(metadata_content)
-            crate.add_file(
-                datasetmetadata_path,
-                dest_path="metadata/_dataset_metadata.json",
-                properties={"name": "_dataset_metadata.json"},
+        ) is not None:
+            releases.append(release)
+        else:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Dataset {dataset_id} version {frozen_version_num} not found",
             )
 
-        bag_size = 0  # bytes
-        file_count = 0
+    async def lines():
+        async for change in _diff_dataset(PydanticObjectId(dataset_id), *releases):
+            yield change.json() + "\n"
 
-        async for file in FileDBViewList.find(
-            FileDBViewList.dataset_id == ObjectId(dataset_id)
-        ):
-            # find the bytes id
-            # if it's working draft file_id == origin_id
-            # if it's published origin_id points to the raw bytes
-            bytes_file_id = str(file.origin_id) if file.origin_id else str(file.id)
-            file_count += 1
-            file_name = file.name
-            if file.folder_id is not None:
-                hierarchy = await _get_folder_hierarchy(file.folder_id, "")
-                dest_folder = os.path.join(current_temp_dir, hierarchy.lstrip("/"))
-                if not os.path.isdir(dest_folder):
-                    os.makedirs(dest_folder, exist_ok=True)
-                file_name = hierarchy + file_name
-            current_file_path = os.path.join(current_temp_dir, file_name.lstrip("/"))
-
-            content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_file_id)
-            file_md5_hash = hashlib.md5(content.data).hexdigest()
-            with open(current_file_path, "wb") as f1:
-                f1.write(content.data)
-            with open(manifest_path, "a") as mpf:
-                mpf.write(file_md5_hash + " " + file_name + "\n")
-            crate.add_file(
-                current_file_path,
-                dest_path="data/" + file_name,
-                properties={"name": file_name},
-            )
-            content.close()
-            content.release_conn()
-
-            current_file_size = os.path.getsize(current_file_path)
-            bag_size += current_file_size
-
-            metadata = await MetadataDB.find(
-                MetadataDB.resource.resource_id == ObjectId(dataset_id)
-            ).to_list()
-            if len(metadata) > 0:
-                metadata_filename = file_name + "_metadata.json"
-                metadata_filename_temp_path = os.path.join(
-                    current_temp_dir, metadata_filename
-                )
-                metadata_content = json_util.dumps(metadata)
-                with open(metadata_filename_temp_path, "w") as f:
-                    f.write(metadata_content)
-                crate.add_file(
-                    metadata_filename_temp_path,
-                    dest_path="metadata/" + metadata_filename,
-                    properties={"name": metadata_filename},
-                )
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-        bag_size_kb = bag_size / 1024
-
-        with open(bagit_path, "a") as f:
-            f.write("Bag-Size: " + str(bag_size_kb) + " kB" + "\n")
-            f.write("Payload-Oxum: " + str(bag_size) + "." + str(file_count) + "\n")
-            f.write("Internal-Sender-Identifier: " + dataset_id + "\n")
-            f.write("Internal-Sender-Description: " + dataset.description + "\n")
-            f.write("Contact-Name: " + user_full_name + "\n")
-            f.write("Contact-Email: " + user.email + "\n")
-        crate.add_file(
-            bagit_path, dest_path="bagit.txt", properties={"name": "bagit.txt"}
-        )
-        crate.add_file(
-            manifest_path,
-            dest_path="manifest-md5.txt",
-            properties={"name": "manifest-md5.txt"},
-        )
-        crate.add_file(
-            bag_info_path, dest_path="bag-info.txt", properties={"name": "bag-info.txt"}
-        )
 
-        # Generate tag manifest file
-        manifest_md5_hash = hashlib.md5(open(manifest_path, "rb").read()).hexdigest()
-        bagit_md5_hash = hashlib.md5(open(bagit_path, "rb").read()).hexdigest()
-        bag_info_md5_hash = hashlib.md5(open(bag_info_path, "rb").read()).hexdigest()
-
-        with open(tagmanifest_path, "w") as f:
-            f.write(bagit_md5_hash + " " + "bagit.txt" + "\n")
-            f.write(manifest_md5_hash + " " + "manifest-md5.txt" + "\n")
-            f.write(bag_info_md5_hash + " " + "bag-info.txt" + "\n")
-        crate.add_file(
-            tagmanifest_path,
-            dest_path="tagmanifest-md5.txt",
-            properties={"name": "tagmanifest-md5.txt"},
-        )
+@router.get("/{dataset_id}/freeze_jobs", response_model=List[FreezeJobOut])
+async def get_dataset_freeze_jobs(
+    dataset_id: str,
+    allow: bool = Depends(Authorization(RoleType.OWNER)),
+):
+    """Jobs that released versions of a dataset, newest first."""
+    return (
+        await FreezeJobDB.find(FreezeJobDB.dataset_id == PydanticObjectId(dataset_id))
+        .sort(("created", DESCENDING))
+        .to_list()
+    )
+
 
-        version_name = (
-            f"-v{dataset.frozen_version_num}"
-            if dataset.frozen and dataset.frozen_version_num > 0
-            else ""
+@router.get("/{dataset_id}/freeze_jobs/{job_id}", response_model=FreezeJobOut)
+async def get_dataset_freeze_job(
+    dataset_id: str,
+    job_id: str,
+    allow: bool = Depends(Authorization(RoleType.OWNER)),
+):
+    if (
+        job := await FreezeJobDB.find_one(
+            FreezeJobDB.id == PydanticObjectId(job_id),
+            FreezeJobDB.dataset_id == PydanticObjectId(dataset_id),
         )
-        zip_name = dataset.name + version_name + ".zip"
-        path_to_zip = os.path.join(current_temp_dir, zip_name)
-        crate.write_zip(path_to_zip)
-        f = open(path_to_zip, "rb", buffering=0)
-        zip_bytes = f.read()
-        stream = io.BytesIO(zip_bytes)
-        f.close()
-        try:
-            shutil.rmtree(current_temp_dir)
-        except Exception as e:
-            print("could not delete file")
-            print(e)
+    ) is not None:
+        return job.dict()
+    raise HTTPException(status_code=404, detail=f"Freeze job {job_id} not found")
 
-        # Get content type & open file stream
-        response = StreamingResponse(
-            stream,
-            media_type="application/x-zip-compressed",
+
+@router.get("/{dataset_id}/download")
+async def download_dataset(
+    dataset_id: str,
+    request: Request,
+    es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
+    user=Depends(get_current_user),
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("viewer")),
+):
+    # a deleted release keeps its document but nothing of it is served
+    if (
+        dataset := await _get_by_id(DatasetDBViewList, dataset_id)
+    ) is not None and not dataset.deleted:
+        # released metadata is only in the view, as in the prebuilt archive
+        response = await _dataset_archive_response(
+            request,
+            dataset,
+            fs,
+            MetadataDBViewList if dataset.frozen else MetadataDB,
+            user,
         )
-        response.headers["Content-Disposition"] = "attachment; filename=%s" % zip_name
+        # revalidations and later ranges of a prebuilt archive are not counted again
+        if response.status_code != 200 and not response.headers.get(
+            "Content-Range", ""
+        ).startswith("bytes 0-"):
+            return response
         await _increment_data_downloads(dataset_id)
 
         # reindex
@@ -1344,6 +1184,53 @@ async def download_dataset(
     raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
 
 
+@router.get("/{dataset_id}/download/url")
+async def download_dataset_url(
+    dataset_id: str,
+    expires_in_seconds: Optional[int] = None,
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
+    allow: bool = Depends(Authorization("viewer")),
+):
+    """Presigned URL of the prebuilt archive of a released dataset version, so it can be fetched from storage
+    directly. Responds 404 while the archive is still being built; the build is started if it was not running.
+    """
+    if (
+        dataset := await _get_by_id(DatasetDBViewList, dataset_id)
+    ) is None or dataset.deleted:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    if not dataset.frozen or not settings.CACHE_FROZEN_ARCHIVES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Dataset {dataset_id} is not a released version with a prebuilt archive",
+        )
+    if not external_fs.supports_presign:
+        raise HTTPException(
+            status_code=400, detail="Storage backend does not support presigned URLs"
+        )
+    if not await _frozen_archive_ready(dataset_id, fs):
+        _schedule_frozen_archive(dataset, fs)
+        raise HTTPException(
+            status_code=404, detail=f"Archive of dataset {dataset_id} is not ready yet"
+        )
+
+    if expires_in_seconds is None:
+        expires = datetime.timedelta(seconds=settings.MINIO_EXPIRES)
+    else:
+        expires = datetime.timedelta(seconds=expires_in_seconds)
+    zip_name = _archive_name(dataset)
+    presigned_url = await get_presigned_url(
+        external_fs,
+        _frozen_archive_key(dataset_id),
+        expires=expires,
+        extra_query_params={
+            "response-content-disposition": "attachment; filename=%s" % zip_name
+        },
+    )
+    await _increment_data_downloads(dataset_id)
+    return {"presigned_url": presigned_url}
+
+
 # submits file to extractor
 # can handle parameeters pass in as key/values in info
 @router.post("/{dataset_id}/extract")
@@ -1376,21 +1263,13 @@ async def get_dataset_extract(
 @router.get("/{dataset_id}/thumbnail")
 async def download_dataset_thumbnail(
     dataset_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     allow: bool = Depends(Authorization("viewer")),
 ):
     # If dataset exists in MongoDB, download from Minio
-    if (
-        dataset := await DatasetDBViewList.find_one(
-            Or(
-                DatasetDBViewList.id == PydanticObjectId(dataset_id),
-            )
-        )
-    ) is not None:
+    if (dataset := await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         if dataset.thumbnail_id is not None:
-            content = fs.get_object(
-                settings.MINIO_BUCKET_NAME, str(dataset.thumbnail_id)
-            )
+            content = await fs.get_stream(str(dataset.thumbnail_id))
         else:
             raise HTTPException(
                 status_code=404,
@@ -1398,7 +1277,7 @@ async def download_dataset_thumbnail(
             )
 
         # Get content type & open file stream
-        response = StreamingResponse(content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE))
+        response = StreamingResponse(content)
         # TODO: How should filenames be handled for thumbnails?
         response.headers["Content-Disposition"] = "attachment; filename=%s" % "thumb"
         return response
@@ -5,7 +5,12 @@ from app.keycloak_auth import get_current_user, get_current_username
 from app.models.feeds import FeedDB, FeedIn, FeedOut
 from app.models.files import FileOut
 from app.models.listeners import EventListenerDB, FeedListener
-from app.models.pages import Paged, _construct_page_metadata, _get_page_query
+from app.models.pages import (
+    Paged,
+    _construct_page_metadata,
+    _get_page_pipeline,
+    _sort_spec,
+)
 from app.models.users import UserOut
 from app.rabbitmq.listeners import submit_file_job
 from app.routers.authentication import get_admin, get_admin_mode
@@ -120,10 +125,13 @@ async def get_feeds(
     user=Depends(get_current_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     admin=Depends(get_admin),
     admin_mode=Depends(get_admin_mode),
 ):
     """Fetch all existing Feeds."""
+    sort = _sort_spec("created", ascending=False)
     criteria_list = []
     if not admin or not admin_mode:
         criteria_list.append(FeedDB.creator == user.email)
@@ -140,11 +148,13 @@ async def get_feeds(
             *criteria_list,
         )
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(feeds_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        feeds_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
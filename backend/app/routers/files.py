@@ -1,12 +1,14 @@
+import asyncio
 import io
-import time
+import logging
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Set
 
 from app import dependencies
 from app.config import settings
 from app.db.dataset.version import remove_file_entry, remove_local_file_entry
 from app.db.file.download import _increment_file_downloads
+from app.db.resolver import _get_by_id
 from app.deps.authorization_deps import FileAuthorization
 from app.keycloak_auth import get_current_user, get_token
 from app.models.files import (
@@ -22,22 +24,35 @@ from app.models.thumbnails import ThumbnailDB
 from app.models.users import UserOut
 from app.rabbitmq.listeners import EventListenerJobDB, submit_file_job
 from app.routers.feeds import check_feed_listeners
-from app.routers.utils import get_content_type
+from app.routers.utils import get_content_type, get_presigned_url
 from app.search.connect import insert_record, update_record
 from app.search.index import index_file, index_thumbnail
+from app.storage.backend import StorageBackend
+from app.storage.responses import local_file_response, object_response
 from beanie import PydanticObjectId
 from beanie.odm.operators.find.logical import Or
 from bson import ObjectId
 from elasticsearch import Elasticsearch, NotFoundError
-from fastapi import APIRouter, Depends, File, HTTPException, Security, UploadFile
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Request,
+    Security,
+    UploadFile,
+)
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from minio import Minio
 from pika.adapters.blocking_connection import BlockingChannel
 
 router = APIRouter()
 security = HTTPBearer()
 
+logger = logging.getLogger(__name__)
+
+# feed checks of new files still running, referenced so they are not garbage collected
+_feed_checks: Set[asyncio.Task] = set()
+
 
 async def _resubmit_file_extractors(
     file: FileOut,
@@ -84,7 +99,7 @@ async def _resubmit_file_extractors(
 async def add_file_entry(
     new_file: FileDB,
     user: UserOut,
-    fs: Minio,
+    fs: StorageBackend,
     es: Elasticsearch,
     rabbitmq_client: BlockingChannel,
     file: Optional[io.BytesIO] = None,
@@ -104,48 +119,84 @@ async def add_file_entry(
     new_file_id = new_file.id
     content_type_obj = get_content_type(new_file.name, content_type)
 
-    # Use unique ID as key for Minio and get initial version ID
-    response = fs.put_object(
-        settings.MINIO_BUCKET_NAME,
-        str(new_file_id),
-        file,
-        length=-1,
-        part_size=settings.MINIO_UPLOAD_CHUNK_SIZE,
-        content_type=new_file.content_type.content_type,
-    )  # async write chunk to minio
-    version_id = response.version_id
-    bytes = len(fs.get_object(settings.MINIO_BUCKET_NAME, str(new_file_id)).data)
+    # Use unique ID as key for Minio and get initial version ID. Size and checksums are computed while streaming.
+    stored = await fs.put_stream(str(new_file_id), file, content_type_obj.content_type)
+    new_file.content_type = content_type_obj
+    await complete_file_entry(
+        new_file,
+        user,
+        es,
+        rabbitmq_client,
+        stored.version_id,
+        stored.bytes,
+        sha256=stored.sha256,
+        md5=stored.md5,
+    )
+
+
+async def complete_file_entry(
+    new_file: FileDB,
+    user: UserOut,
+    es: Elasticsearch,
+    rabbitmq_client: BlockingChannel,
+    version_id: Optional[str],
+    bytes: int,
+    sha256: Optional[str] = None,
+    md5: Optional[str] = None,
+):
+    """Record the first version of a file whose bytes are already in Minio, then index it and submit it to feeds.
+
+    Arguments:
+        new_file: FileDB object whose ID is the Minio object key
+        version_id: Minio version ID of the uploaded object
+        bytes: size of the uploaded object
+    """
     if version_id is None:
         # TODO: This occurs in testing when minio is not running
         version_id = 999999999
     new_file.version_id = version_id
     new_file.version_num = 1
     new_file.bytes = bytes
-    new_file.content_type = content_type_obj
-    await new_file.replace()
+    new_file.sha256 = sha256
+    new_file.md5 = md5
+    await new_file.save()
 
     # Add FileVersion entry and update file
     new_version = FileVersionDB(
-        file_id=new_file_id,
+        file_id=new_file.id,
         creator=user,
         version_id=version_id,
         bytes=bytes,
+        sha256=sha256,
+        md5=md5,
     )
     await new_version.insert()
 
     # Add entry to the file index
     await index_file(es, FileOut(**new_file.dict()))
 
-    # TODO - timing issue here, check_feed_listeners needs to happen asynchronously.
-    time.sleep(1)
-
-    # Submit file job to any qualifying feeds
-    await check_feed_listeners(
-        es,
-        FileOut(**new_file.dict()),
-        user,
-        rabbitmq_client,
+    # Submit file job to any qualifying feeds, without holding up the upload or the rest of an archive
+    task = asyncio.create_task(
+        _check_feed_listeners_later(
+            es, FileOut(**new_file.dict()), user, rabbitmq_client
+        )
     )
+    _feed_checks.add(task)
+    task.add_done_callback(_feed_checks.discard)
+
+
+async def _check_feed_listeners_later(
+    es: Elasticsearch,
+    file_out: FileOut,
+    user: UserOut,
+    rabbitmq_client: BlockingChannel,
+):
+    # TODO - timing issue here, the new file can only be matched by a feed's search once the index has refreshed
+    await asyncio.sleep(1)
+    try:
+        await check_feed_listeners(es, file_out, user, rabbitmq_client)
+    except Exception as e:
+        logger.error(f"Submitting file {file_out.id} to feeds failed: {e}")
 
 
 async def add_local_file_entry(
@@ -166,7 +217,7 @@ async def add_local_file_entry(
     await index_file(es, FileOut(**new_file.dict()))
 
     # TODO - timing issue here, check_feed_listeners needs to happen asynchronously.
-    time.sleep(1)
+    await asyncio.sleep(1)
 
     # Submit file job to any qualifying feeds
     await check_feed_listeners(
@@ -182,7 +233,7 @@ async def update_file(
     file_id: str,
     token=Depends(get_token),
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     file: UploadFile = File(...),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     credentials: HTTPAuthorizationCredentials = Security(security),
@@ -205,15 +256,12 @@ async def update_file(
             )
 
         # Update file in Minio and get the new version IDs
-        response = fs.put_object(
-            settings.MINIO_BUCKET_NAME,
+        stored = await fs.put_stream(
             str(updated_file.id),
             file.file,
-            length=-1,
-            part_size=settings.MINIO_UPLOAD_CHUNK_SIZE,
-            content_type=updated_file.content_type.content_type,
-        )  # async write chunk to minio
-        version_id = response.version_id
+            updated_file.content_type.content_type,
+        )
+        version_id = stored.version_id
 
         # Update version/creator/created flags
         updated_file.name = file.filename
@@ -222,10 +270,10 @@ async def update_file(
         updated_file.version_id = version_id
         updated_file.version_num = updated_file.version_num + 1
 
-        # Update byte size
-        updated_file.bytes = len(
-            fs.get_object(settings.MINIO_BUCKET_NAME, str(updated_file.id)).data
-        )
+        # Update byte size and checksums
+        updated_file.bytes = stored.bytes
+        updated_file.sha256 = stored.sha256
+        updated_file.md5 = stored.md5
         await updated_file.replace()
 
         # Put entry in FileVersion collection
@@ -235,6 +283,8 @@ async def update_file(
             version_id=updated_file.version_id,
             version_num=updated_file.version_num,
             bytes=updated_file.bytes,
+            sha256=updated_file.sha256,
+            md5=updated_file.md5,
         )
 
         await new_version.insert()
@@ -273,24 +323,22 @@ async def update_file(
 @router.get("/{file_id}")
 async def download_file(
     file_id: str,
+    request: Request,
     version: Optional[int] = None,
     increment: Optional[bool] = True,
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
     # If file exists in MongoDB, download from Minio
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # find the bytes id
         # if it's working draft file_id == origin_id
         # if it's published origin_id points to the raw bytes
         bytes_file_id = str(file.origin_id) if file.origin_id else str(file.id)
 
         if file.storage_type == StorageType.MINIO:
+            version_id = None
             if version is not None:
                 # Version is specified, so get the minio ID from versions table if possible
                 file_vers = await FileVersionDB.find_one(
@@ -302,31 +350,27 @@ async def download_file(
                 )
                 if file_vers is not None:
                     vers = FileVersion(**file_vers.dict())
-                    content = fs.get_object(
-                        settings.MINIO_BUCKET_NAME,
-                        bytes_file_id,
-                        version_id=vers.version_id,
-                    )
+                    version_id = vers.version_id
                 else:
                     raise HTTPException(
                         status_code=404,
                         detail=f"File {file_id} version {version} not found",
                     )
-            else:
-                # If no version specified, get latest version directly
-                content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_file_id)
 
-            # Get content type & open file stream
-            response = StreamingResponse(
-                content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE)
-            )
-            response.headers["Content-Disposition"] = (
-                "attachment; filename=%s" % file.name
+            # If no version specified the latest version is sent. Range and conditional requests are honoured.
+            response = await object_response(
+                request,
+                fs,
+                bytes_file_id,
+                version_id=version_id,
+                filename=file.name,
+                media_type=file.content_type.content_type,
             )
 
         elif file.storage_type == StorageType.LOCAL:
-            response = FileResponse(
-                path=file.storage_path,
+            response = await local_file_response(
+                request,
+                file.storage_path,
                 filename=file.name,
                 media_type=file.content_type.content_type,
             )
@@ -337,7 +381,11 @@ async def download_file(
             )
 
         if response:
-            if increment:
+            # revalidations and later ranges of the same download are not counted again
+            if increment and (
+                response.status_code == 200
+                or response.headers.get("Content-Range", "").startswith("bytes 0-")
+            ):
                 await _increment_file_downloads(file_id)
 
                 # reindex
@@ -356,15 +404,11 @@ async def download_file_url(
     expires_in_seconds: Optional[int] = 3600,
     increment: Optional[bool] = True,
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
-    external_fs: Minio = Depends(dependencies.get_external_fs),
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
     # If file exists in MongoDB, download from Minio
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # find the bytes id
         # if it's working draft file_id == origin_id
         # if it's published origin_id points to the raw bytes
@@ -386,9 +430,9 @@ async def download_file_url(
             if file_vers is not None:
                 vers = FileVersion(**file_vers.dict())
                 # If no version specified, get latest version directly
-                presigned_url = external_fs.presigned_get_object(
-                    bucket_name=settings.MINIO_BUCKET_NAME,
-                    object_name=bytes_file_id,
+                presigned_url = await get_presigned_url(
+                    external_fs,
+                    bytes_file_id,
                     version_id=vers.version_id,
                     expires=expires,
                 )
@@ -399,10 +443,8 @@ async def download_file_url(
                 )
         else:
             # If no version specified, get latest version directly
-            presigned_url = external_fs.presigned_get_object(
-                bucket_name=settings.MINIO_BUCKET_NAME,
-                object_name=bytes_file_id,
-                expires=expires,
+            presigned_url = await get_presigned_url(
+                external_fs, bytes_file_id, expires=expires
             )
 
         if presigned_url is not None:
@@ -423,7 +465,7 @@ async def download_file_url(
 @router.delete("/{file_id}")
 async def delete_file(
     file_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
     allow: bool = Depends(FileAuthorization("editor")),
 ):
@@ -442,11 +484,7 @@ async def get_file_summary(
     file_id: str,
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # TODO: Incrementing too often (3x per page view)
         # file.views += 1
         # await file.replace()
@@ -461,11 +499,7 @@ async def get_file_version_details(
     version_num: Optional[int] = 0,
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # TODO: Incrementing too often (3x per page view)
         file_vers = await FileVersionDB.find_one(
             Or(
@@ -491,11 +525,7 @@ async def get_file_versions(
     limit: int = 20,
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         mongo_versions = []
         if file.storage_type == StorageType.MINIO:
             async for ver in (
@@ -575,28 +605,22 @@ async def resubmit_file_extractions(
 @router.get("/{file_id}/thumbnail")
 async def download_file_thumbnail(
     file_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    request: Request,
+    fs: StorageBackend = Depends(dependencies.get_fs),
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
     # If file exists in MongoDB, download from Minio
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # TODO investigate what happens with dataset versoning and thumbnail
-        if file.thumbnail_id is not None:
-            content = fs.get_object(settings.MINIO_BUCKET_NAME, str(file.thumbnail_id))
-        else:
+        if file.thumbnail_id is None:
             raise HTTPException(
                 status_code=404, detail=f"File {file_id} has no associated thumbnail"
             )
 
-        # Get content type & open file stream
-        response = StreamingResponse(content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE))
         # TODO: How should filenames be handled for thumbnails?
-        response.headers["Content-Disposition"] = "attachment; filename=%s" % "thumb"
-        return response
+        return await object_response(
+            request, fs, str(file.thumbnail_id), filename="thumb"
+        )
     else:
         raise HTTPException(status_code=404, detail=f"File {file_id} not found")
 
@@ -2,12 +2,18 @@ from datetime import datetime
 from typing import Optional
 
 from app import dependencies
+from app.db import role_cache
 from app.deps.authorization_deps import AuthorizationDB, GroupAuthorization
 from app.keycloak_auth import get_current_user, get_user
 from app.models.authorization import RoleType
 from app.models.datasets import DatasetDB, DatasetOut
 from app.models.groups import GroupBase, GroupDB, GroupIn, GroupOut, Member
-from app.models.pages import Paged, _construct_page_metadata, _get_page_query
+from app.models.pages import (
+    Paged,
+    _construct_page_metadata,
+    _get_page_pipeline,
+    _sort_spec,
+)
 from app.models.users import UserDB, UserOut
 from app.routers.authentication import get_admin, get_admin_mode
 from app.search.index import index_dataset, index_dataset_files
@@ -37,6 +43,8 @@ async def get_groups(
     user_id=Depends(get_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     enable_admin: bool = False,
     admin_mode: bool = Depends(get_admin_mode),
     admin=Depends(get_admin),
@@ -49,6 +57,7 @@ async def get_groups(
 
 
     """
+    sort = _sort_spec("created", ascending=False)
     criteria_list = []
     if not admin or not admin_mode:
         criteria_list.append(
@@ -63,11 +72,13 @@ async def get_groups(
             *criteria_list,
         )
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(groups_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        groups_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -83,6 +94,8 @@ async def search_group(
     user_id=Depends(get_user),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     enable_admin: bool = False,
     admin_mode: bool = Depends(get_admin_mode),
     admin=Depends(get_admin),
@@ -94,6 +107,7 @@ async def search_group(
         skip -- number of initial records to skip (i.e. for pagination)
         limit -- restrict number of records to be returned (i.e. for pagination)
     """
+    sort = _sort_spec("created", ascending=False)
 
     criteria_list = [
         Or(
@@ -112,11 +126,13 @@ async def search_group(
             *criteria_list,
         )
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(groups_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        groups_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -194,6 +210,7 @@ async def edit_group(
                 ).update(
                     Push({AuthorizationDB.user_ids: user.email}),
                 )
+                role_cache.invalidate_user(user.email)
         try:
             group.name = group_dict["name"]
             await group.replace()
@@ -251,6 +268,7 @@ async def add_member(
                 ).update(
                     Push({AuthorizationDB.user_ids: username}),
                 )
+                role_cache.invalidate_user(username)
                 # index the datasets in the group
                 group_authorizations = await AuthorizationDB.find(
                     AuthorizationDB.group_ids == ObjectId(group_id)
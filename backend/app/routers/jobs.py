@@ -9,7 +9,12 @@ from app.models.listeners import (
     EventListenerJobUpdateOut,
     EventListenerJobViewList,
 )
-from app.models.pages import Paged, _construct_page_metadata, _get_page_query
+from app.models.pages import (
+    Paged,
+    _construct_page_metadata,
+    _get_page_pipeline,
+    _sort_spec,
+)
 from beanie import PydanticObjectId
 from beanie.operators import GTE, LT, Or, RegEx
 from bson import ObjectId
@@ -29,6 +34,8 @@ async def get_all_job_summary(
     created: Optional[str] = None,
     skip: int = 0,
     limit: int = 2,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
 ):
     """
     Get a list of all jobs from the db.
@@ -42,6 +49,7 @@ async def get_all_job_summary(
         skip -- number of initial records to skip (i.e. for pagination)
         limit -- restrict number of records to be returned (i.e. for pagination)
     """
+    sort = _sort_spec("created", ascending=False)
     filters = [
         Or(
             EventListenerJobViewList.creator.email == current_user_id,
@@ -79,11 +87,13 @@ async def get_all_job_summary(
     jobs_and_count = (
         await EventListenerJobViewList.find(*filters)
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(jobs_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        jobs_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from app import dependencies
 from app.config import settings
+from app.db.resolver import _get_by_id
 from app.deps.authorization_deps import Authorization
 from app.keycloak_auth import UserOut, get_current_user
 from app.models.datasets import DatasetDB, DatasetDBViewList, DatasetOut
@@ -247,11 +248,7 @@ async def get_dataset_metadata(
     user=Depends(get_current_user),
     allow: bool = Depends(Authorization("viewer")),
 ):
-    if (
-        await DatasetDBViewList.find_one(
-            DatasetDBViewList.id == PydanticObjectId(dataset_id)
-        )
-    ) is not None:
+    if (await _get_by_id(DatasetDBViewList, dataset_id)) is not None:
         query = [MetadataDBViewList.resource.resource_id == ObjectId(dataset_id)]
 
         if listener_name is not None:
@@ -2,6 +2,7 @@ from typing import List, Optional
 
 from app import dependencies
 from app.config import settings
+from app.db.resolver import _get_by_id
 from app.deps.authorization_deps import FileAuthorization
 from app.keycloak_auth import UserOut, get_current_user
 from app.models.files import FileDB, FileDBViewList, FileOut, FileVersionDB
@@ -340,11 +341,7 @@ async def get_file_metadata(
     allow: bool = Depends(FileAuthorization("viewer")),
 ):
     """Get file metadata."""
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         query = [MetadataDBViewList.resource.resource_id == ObjectId(file_id)]
 
         # Validate specified version, or use latest by default
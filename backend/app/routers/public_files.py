@@ -1,8 +1,8 @@
 from typing import List, Optional
 
 from app import dependencies
-from app.config import settings
 from app.db.file.download import _increment_file_downloads
+from app.db.resolver import _get_by_id
 from app.models.datasets import DatasetDBViewList, DatasetStatus
 from app.models.files import FileDBViewList, FileOut, FileVersion, FileVersionDB
 from app.models.metadata import (
@@ -11,13 +11,12 @@ from app.models.metadata import (
     MetadataDefinitionOut,
     MetadataOut,
 )
-from beanie import PydanticObjectId
+from app.storage.backend import StorageBackend
 from beanie.odm.operators.find.logical import Or
 from bson import ObjectId
 from fastapi import APIRouter, Depends, Form, HTTPException
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
-from minio import Minio
 
 router = APIRouter()
 security = HTTPBearer()
@@ -27,18 +26,12 @@ security = HTTPBearer()
 async def get_file_summary(
     file_id: str,
 ):
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # TODO: Incrementing too often (3x per page view)
         # file.views += 1
         # await file.replace()
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 return file.dict()
@@ -51,16 +44,10 @@ async def get_file_version_details(
     file_id: str,
     version_num: Optional[int] = 0,
 ):
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # TODO: Incrementing too often (3x per page view)
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 file_vers = await FileVersionDB.find_one(
@@ -86,12 +73,10 @@ async def get_file_versions(
     skip: int = 0,
     limit: int = 20,
 ):
-    file = await FileDBViewList.find_one(FileDBViewList.id == PydanticObjectId(file_id))
+    file = await _get_by_id(FileDBViewList, file_id)
     if file is not None:
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 mongo_versions = []
@@ -111,23 +96,17 @@ async def download_file(
     file_id: str,
     version: Optional[int] = None,
     increment: Optional[bool] = True,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
 ):
     # If file exists in MongoDB, download from Minio
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         # find the bytes id
         # if it's working draft file_id == origin_id
         # if it's published origin_id points to the raw bytes
         bytes_file_id = str(file.origin_id) if file.origin_id else str(file.id)
 
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 if version is not None:
@@ -141,10 +120,8 @@ async def download_file(
                     )
                     if file_vers is not None:
                         vers = FileVersion(**file_vers.dict())
-                        content = fs.get_object(
-                            settings.MINIO_BUCKET_NAME,
-                            bytes_file_id,
-                            version_id=vers.version_id,
+                        content = await fs.get_stream(
+                            bytes_file_id, version_id=vers.version_id
                         )
                     else:
                         raise HTTPException(
@@ -153,12 +130,10 @@ async def download_file(
                         )
                 else:
                     # If no version specified, get latest version directly
-                    content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_file_id)
+                    content = await fs.get_stream(bytes_file_id)
 
                 # Get content type & open file stream
-                response = StreamingResponse(
-                    content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE)
-                )
+                response = StreamingResponse(content)
                 response.headers["Content-Disposition"] = (
                     "attachment; filename=%s" % file.name
                 )
@@ -174,24 +149,16 @@ async def download_file(
 @router.get("/{file_id}/thumbnail")
 async def download_file_thumbnail(
     file_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
 ):
     # If file exists in MongoDB, download from Minio
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 if file.thumbnail_id is not None:
-                    content = fs.get_object(
-                        settings.MINIO_BUCKET_NAME, str(file.thumbnail_id)
-                    )
+                    content = await fs.get_stream(str(file.thumbnail_id))
                 else:
                     raise HTTPException(
                         status_code=404,
@@ -199,9 +166,7 @@ async def download_file_thumbnail(
                     )
 
                 # Get content type & open file stream
-                response = StreamingResponse(
-                    content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE)
-                )
+                response = StreamingResponse(content)
                 # TODO: How should filenames be handled for thumbnails?
                 response.headers["Content-Disposition"] = (
                     "attachment; filename=%s" % "thumb"
@@ -221,15 +186,9 @@ async def get_file_metadata(
     listener_version: Optional[float] = Form(None),
 ):
     """Get file metadata."""
-    if (
-        file := await FileDBViewList.find_one(
-            FileDBViewList.id == PydanticObjectId(file_id)
-        )
-    ) is not None:
+    if (file := await _get_by_id(FileDBViewList, file_id)) is not None:
         if (
-            dataset := await DatasetDBViewList.find_one(
-                DatasetDBViewList.id == PydanticObjectId(file.dataset_id)
-            )
+            dataset := await _get_by_id(DatasetDBViewList, file.dataset_id)
         ) is not None:
             if dataset.status == DatasetStatus.PUBLIC.name:
                 query = [MetadataDBViewList.resource.resource_id == ObjectId(file_id)]
@@ -1,6 +1,6 @@
+from app.db.folder.hierarchy import _get_ancestors
+from app.db.resolver import _get_by_id
 from app.models.folders import FolderDBViewList
-from beanie import PydanticObjectId
-from bson import ObjectId
 from fastapi import APIRouter, HTTPException
 
 router = APIRouter()
@@ -10,24 +10,11 @@ router = APIRouter()
 async def download_folder(
     folder_id: str,
 ):
-    folder = await FolderDBViewList.find_one(
-        FolderDBViewList.id == PydanticObjectId(folder_id)
-    )
+    folder = await _get_by_id(FolderDBViewList, folder_id)
     if folder is not None:
-        path = []
-        current_folder_id = folder_id
-        # TODO switch to $graphLookup
-        while (
-            current_folder := await FolderDBViewList.find_one(
-                FolderDBViewList.id == ObjectId(current_folder_id)
-            )
-        ) is not None:
-            folder_info = {
-                "folder_name": current_folder.name,
-                "folder_id": str(current_folder.id),
-            }
-            path.insert(0, folder_info)
-            current_folder_id = current_folder.parent_folder
-        return path
+        return [
+            {"folder_name": current_folder.name, "folder_id": str(current_folder.id)}
+            for current_folder in await _get_ancestors(folder) + [folder]
+        ]
     else:
         raise HTTPException(status_code=404, detail=f"File {folder_id} not found")
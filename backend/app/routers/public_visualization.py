@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from app import dependencies
 from app.config import settings
+from app.db.resolver import _get_by_id
 from app.models.visualization_config import (
     VisualizationConfigDBViewList,
     VisualizationConfigOut,
@@ -12,11 +13,12 @@ from app.models.visualization_data import (
     VisualizationDataDBViewList,
     VisualizationDataOut,
 )
+from app.routers.utils import get_presigned_url
+from app.storage.backend import StorageBackend
 from beanie import PydanticObjectId
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import HTTPBearer
-from minio import Minio
 from starlette.responses import StreamingResponse
 
 router = APIRouter()
@@ -38,23 +40,21 @@ async def get_visualization(visualization_id: str):
 
 @router.get("/{visualization_id}/bytes")
 async def download_visualization(
-    visualization_id: str, fs: Minio = Depends(dependencies.get_fs)
+    visualization_id: str, fs: StorageBackend = Depends(dependencies.get_fs)
 ):
     # If visualization exists in MongoDB, download from Minio
     if (
-        visualization := await VisualizationDataDBViewList.find_one(
-            VisualizationDataDBViewList.id == PydanticObjectId(visualization_id)
-        )
+        visualization := await _get_by_id(VisualizationDataDBViewList, visualization_id)
     ) is not None:
         bytes_visualization_id = (
             str(visualization.origin_id)
             if visualization.origin_id
             else str(visualization.id)
         )
-        content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_visualization_id)
+        content = await fs.get_stream(bytes_visualization_id)
 
         # Get content type & open file stream
-        response = StreamingResponse(content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE))
+        response = StreamingResponse(content)
         response.headers["Content-Disposition"] = (
             "attachment; filename=%s" % visualization.name
         )
@@ -69,13 +69,11 @@ async def download_visualization(
 async def download_visualization_url(
     visualization_id: str,
     expires_in_seconds: Optional[int] = 3600,
-    external_fs: Minio = Depends(dependencies.get_external_fs),
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
 ):
     # If visualization exists in MongoDB, download from Minio
     if (
-        visualization := await VisualizationDataDBViewList.find_one(
-            VisualizationDataDBViewList.id == PydanticObjectId(visualization_id)
-        )
+        visualization := await _get_by_id(VisualizationDataDBViewList, visualization_id)
     ) is not None:
         bytes_visualization_id = (
             str(visualization.origin_id)
@@ -88,10 +86,8 @@ async def download_visualization_url(
             expires = timedelta(seconds=expires_in_seconds)
 
         # Generate a signed URL with expiration time
-        presigned_url = external_fs.presigned_get_object(
-            bucket_name=settings.MINIO_BUCKET_NAME,
-            object_name=bytes_visualization_id,
-            expires=expires,
+        presigned_url = await get_presigned_url(
+            external_fs, bytes_visualization_id, expires=expires
         )
 
         return {"presigned_url": presigned_url}
@@ -128,9 +124,7 @@ async def get_visconfig(
     config_id: PydanticObjectId,
 ):
     if (
-        vis_config := await VisualizationConfigDBViewList.find_one(
-            VisualizationConfigDBViewList.id == PydanticObjectId(config_id)
-        )
+        vis_config := await _get_by_id(VisualizationConfigDBViewList, config_id)
     ) is not None:
         config_visdata = []
         query = [VisualizationDataDBViewList.visualization_config_id == config_id]
@@ -149,11 +143,7 @@ async def get_visdata_from_visconfig(
     config_id: PydanticObjectId,
 ):
     config_visdata = []
-    if (
-        await VisualizationConfigDBViewList.find_one(
-            VisualizationConfigDBViewList.id == PydanticObjectId(config_id)
-        )
-    ) is not None:
+    if (await _get_by_id(VisualizationConfigDBViewList, config_id)) is not None:
         query = [VisualizationDataDBViewList.visualization_config_id == config_id]
         async for vis_data in VisualizationDataDBViewList.find(*query):
             config_visdata.append(vis_data)
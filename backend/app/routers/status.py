@@ -1,5 +1,11 @@
-from app.models.status import Status
-from fastapi import APIRouter
+from typing import List
+
+from app import dependencies
+from app.db.indexes import _get_index_status
+from app.keycloak_auth import get_current_user
+from app.models.status import IndexStatus, Status, StoragePoolStatus
+from app.routers.authentication import get_admin
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import HTTPBearer
 
 router = APIRouter()
@@ -9,3 +15,29 @@ security = HTTPBearer()
 @router.get("", response_model=Status)
 async def get_status():
     return Status()
+
+
+@router.get("/storage", response_model=List[StoragePoolStatus])
+async def get_storage_status(
+    current_user=Depends(get_current_user), admin=Depends(get_admin)
+):
+    """Connection pool usage of the shared Minio clients, to help tune MINIO_POOL_MAXSIZE."""
+    if not admin:
+        raise HTTPException(
+            status_code=403,
+            detail=f"User {current_user.email} is not an admin. Only admin can see storage status.",
+        )
+    return dependencies.get_fs_pool_stats()
+
+
+@router.get("/indexes", response_model=IndexStatus)
+async def get_index_status(
+    current_user=Depends(get_current_user), admin=Depends(get_admin)
+):
+    """Usage of every MongoDB index and the query plans of the hot query shapes, with collection scans flagged."""
+    if not admin:
+        raise HTTPException(
+            status_code=403,
+            detail=f"User {current_user.email} is not an admin. Only admin can see index status.",
+        )
+    return await _get_index_status()
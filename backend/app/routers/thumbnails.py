@@ -1,7 +1,7 @@
 from typing import Optional
 
 from app import dependencies
-from app.config import settings
+from app.db.resolver import _get_by_id
 from app.keycloak_auth import get_current_user
 from app.models.datasets import DatasetDB
 from app.models.files import FileDB
@@ -13,12 +13,12 @@ from app.models.thumbnails import (
     ThumbnailOut,
 )
 from app.routers.utils import get_content_type
+from app.storage.backend import StorageBackend
+from app.storage.responses import object_response
 from beanie import PydanticObjectId
 from beanie.odm.operators.update.general import Inc
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
 from fastapi.security import HTTPBearer
-from minio import Minio
-from starlette.responses import StreamingResponse
 
 router = APIRouter()
 security = HTTPBearer()
@@ -27,7 +27,7 @@ security = HTTPBearer()
 @router.post("", response_model=ThumbnailOut)
 async def add_thumbnail(
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     file: UploadFile = File(...),
 ):
     """Insert Thumbnail object into MongoDB (makes Clowder ID), then Minio"""
@@ -40,23 +40,18 @@ async def add_thumbnail(
     thumb_db.content_type = get_content_type(file.filename, file.content_type)
 
     # Use unique ID as key for Minio
-    fs.put_object(
-        settings.MINIO_BUCKET_NAME,
-        str(thumb_db.id),
-        file.file,
-        length=-1,
-        part_size=settings.MINIO_UPLOAD_CHUNK_SIZE,
-        content_type=thumb_db.content_type.content_type,
-    )  # async write chunk to minio
-    thumb_db.bytes = len(
-        fs.get_object(settings.MINIO_BUCKET_NAME, str(thumb_db.id)).data
+    stored = await fs.put_stream(
+        str(thumb_db.id), file.file, thumb_db.content_type.content_type
     )
+    thumb_db.bytes = stored.bytes
     await thumb_db.replace()
     return thumb_db.dict()
 
 
 @router.delete("/{thumbnail_id}")
-async def remove_thumbnail(thumb_id: str, fs: Minio = Depends(dependencies.get_fs)):
+async def remove_thumbnail(
+    thumb_id: str, fs: StorageBackend = Depends(dependencies.get_fs)
+):
     if (thumbnail := await ThumbnailDB.get(PydanticObjectId(thumb_id))) is not None:
         # Delete from associated resources
         async for file in FileDB.find(
@@ -76,7 +71,7 @@ async def remove_thumbnail(thumb_id: str, fs: Minio = Depends(dependencies.get_f
                 ThumbnailFreezeDB.origin_id == PydanticObjectId(thumb_id)
             )
         ) is None:
-            fs.remove_object(settings.MINIO_BUCKET_NAME, thumb_id)
+            await fs.delete(thumb_id)
 
         await thumbnail.delete()
         return {"deleted": thumb_id}
@@ -86,24 +81,23 @@ async def remove_thumbnail(thumb_id: str, fs: Minio = Depends(dependencies.get_f
 @router.get("/{thumbnail_id}")
 async def download_thumbnail(
     thumbnail_id: str,
-    fs: Minio = Depends(dependencies.get_fs),
+    request: Request,
+    fs: StorageBackend = Depends(dependencies.get_fs),
     increment: Optional[bool] = False,
 ):
     # If thumbnail exists in MongoDB, download from Minio
-    if (
-        thumbnail := await ThumbnailDBViewList.find_one(
-            ThumbnailDBViewList.id == PydanticObjectId(thumbnail_id)
-        )
-    ) is not None:
+    if (thumbnail := await _get_by_id(ThumbnailDBViewList, thumbnail_id)) is not None:
         bytes_thumbnail_id = (
             str(thumbnail.origin_id) if thumbnail.origin_id else str(thumbnail.id)
         )
-        content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_thumbnail_id)
-
-        # Get content type & open file stream
-        response = StreamingResponse(content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE))
-        response.headers["Content-Disposition"] = "attachment; filename=%s" % "thumb"
-        if increment:
+        response = await object_response(
+            request,
+            fs,
+            bytes_thumbnail_id,
+            filename="thumb",
+            media_type=thumbnail.content_type.content_type,
+        )
+        if increment and response.status_code != 304:
             # Increment download count
             await thumbnail.update(Inc({ThumbnailDB.downloads: 1}))
         return response
@@ -0,0 +1,317 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app import dependencies
+from app.config import settings
+from app.db.file.upload import _delete_upload_session
+from app.deps.authorization_deps import Authorization
+from app.keycloak_auth import get_current_user
+from app.models.datasets import DatasetDB
+from app.models.files import FileDB, FileOut
+from app.models.folders import FolderDB
+from app.models.uploads import (
+    UploadChunk,
+    UploadSessionDB,
+    UploadSessionIn,
+    UploadSessionOut,
+)
+from app.routers.files import complete_file_entry
+from app.routers.utils import get_content_type, get_presigned_url
+from app.storage.backend import ObjectNotFoundError, StorageBackend, UploadedPart
+from beanie import PydanticObjectId
+from beanie.odm.operators.update.general import Set
+from bson import ObjectId
+from elasticsearch import Elasticsearch
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pika.adapters.blocking_connection import BlockingChannel
+
+router = APIRouter()
+
+# Minio/S3 limit on the number of parts in a multipart upload
+MAX_CHUNKS = 10000
+
+
+def _check_chunk_num(chunk_num: int):
+    if chunk_num < 1 or chunk_num > MAX_CHUNKS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk number must be between 1 and {MAX_CHUNKS}",
+        )
+
+
+def _get_expires(expires_in_seconds: Optional[int]) -> timedelta:
+    if expires_in_seconds is None:
+        return timedelta(seconds=settings.MINIO_EXPIRES)
+    return timedelta(seconds=expires_in_seconds)
+
+
+async def _get_upload_session(dataset_id: str, session_id: str) -> UploadSessionDB:
+    if (
+        ObjectId.is_valid(session_id)
+        and (session := await UploadSessionDB.get(PydanticObjectId(session_id)))
+        is not None
+        and session.dataset_id == PydanticObjectId(dataset_id)
+    ):
+        return session
+    raise HTTPException(
+        status_code=404, detail=f"Upload session {session_id} not found"
+    )
+
+
+@router.post("/{dataset_id}/uploads", response_model=UploadSessionOut)
+async def create_upload_session(
+    dataset_id: str,
+    session_in: UploadSessionIn,
+    presigned: bool = False,
+    multipart: bool = True,
+    user=Depends(get_current_user),
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Start a resumable upload of one file. Chunks of `chunk_size` bytes are then PUT by number (starting at 1) and
+    the session is committed once all of them have been received.
+
+    With `presigned` the bytes go directly to Minio through presigned URLs instead of through the API, either as
+    multipart parts or, with `multipart=false`, as a single PUT."""
+    if not multipart and not presigned:
+        raise HTTPException(
+            status_code=400,
+            detail="Uploads through the API are always multipart",
+        )
+    if presigned and not fs.supports_presign:
+        raise HTTPException(
+            status_code=400,
+            detail="Presigned uploads are not supported by the storage backend",
+        )
+    if (await DatasetDB.get(PydanticObjectId(dataset_id))) is None:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+    if session_in.folder_id is not None:
+        if (await FolderDB.get(PydanticObjectId(session_in.folder_id))) is None:
+            raise HTTPException(
+                status_code=404, detail=f"Folder {session_in.folder_id} not found"
+            )
+
+    content_type = get_content_type(session_in.name, session_in.content_type)
+    session = UploadSessionDB(
+        **session_in.dict(exclude={"content_type"}),
+        content_type=content_type.content_type,
+        dataset_id=PydanticObjectId(dataset_id),
+        presigned=presigned,
+        creator=user,
+    )
+    if multipart:
+        session.upload_id = await fs.create_multipart(
+            str(session.file_id), content_type.content_type
+        )
+    await session.insert()
+    return session.dict()
+
+
+@router.get("/{dataset_id}/uploads/{session_id}", response_model=UploadSessionOut)
+async def get_upload_session(
+    dataset_id: str,
+    session_id: str,
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Return the session, including which chunks have already been received."""
+    session = await _get_upload_session(dataset_id, session_id)
+    if session.presigned and session.upload_id is not None:
+        # parts were sent straight to storage, so ask it what has arrived
+        session.chunks = {
+            str(part.part_number): UploadChunk(
+                chunk_num=part.part_number,
+                etag=part.etag,
+                bytes=part.size,
+                created=part.last_modified or datetime.utcnow(),
+            )
+            for part in await fs.list_parts(str(session.file_id), session.upload_id)
+        }
+    return session.dict()
+
+
+@router.get("/{dataset_id}/uploads/{session_id}/url")
+async def get_upload_url(
+    dataset_id: str,
+    session_id: str,
+    expires_in_seconds: Optional[int] = 3600,
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Presigned URL to PUT the whole file directly to Minio for a single-object presigned session."""
+    session = await _get_upload_session(dataset_id, session_id)
+    if not session.presigned or session.upload_id is not None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload session {session_id} is not a single presigned upload",
+        )
+    presigned_url = await get_presigned_url(
+        external_fs,
+        str(session.file_id),
+        "PUT",
+        expires=_get_expires(expires_in_seconds),
+    )
+    return {"presigned_url": presigned_url}
+
+
+@router.get("/{dataset_id}/uploads/{session_id}/chunks/{chunk_num}/url")
+async def get_upload_chunk_url(
+    dataset_id: str,
+    session_id: str,
+    chunk_num: int,
+    expires_in_seconds: Optional[int] = 3600,
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Presigned URL to PUT one multipart part directly to Minio for a presigned multipart session."""
+    session = await _get_upload_session(dataset_id, session_id)
+    if not session.presigned or session.upload_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload session {session_id} is not a presigned multipart upload",
+        )
+    _check_chunk_num(chunk_num)
+    presigned_url = await get_presigned_url(
+        external_fs,
+        str(session.file_id),
+        "PUT",
+        expires=_get_expires(expires_in_seconds),
+        extra_query_params={
+            "partNumber": str(chunk_num),
+            "uploadId": session.upload_id,
+        },
+    )
+    return {"presigned_url": presigned_url}
+
+
+@router.put(
+    "/{dataset_id}/uploads/{session_id}/chunks/{chunk_num}",
+    response_model=UploadChunk,
+)
+async def upload_chunk(
+    dataset_id: str,
+    session_id: str,
+    chunk_num: int,
+    request: Request,
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Upload one chunk as the raw request body. Re-sending a chunk number replaces the earlier upload."""
+    session = await _get_upload_session(dataset_id, session_id)
+    if session.upload_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload session {session_id} is not a multipart upload",
+        )
+    _check_chunk_num(chunk_num)
+    data = await request.body()
+    if len(data) == 0 or len(data) > session.chunk_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk must contain between 1 and {session.chunk_size} bytes",
+        )
+
+    etag = await fs.upload_part(
+        str(session.file_id), session.upload_id, chunk_num, data
+    )
+    chunk = UploadChunk(chunk_num=chunk_num, etag=etag, bytes=len(data))
+
+    # receiving data keeps an abandoned-looking session alive
+    now = datetime.utcnow()
+    await session.update(
+        Set(
+            {
+                f"chunks.{chunk_num}": chunk.dict(),
+                "modified": now,
+                "expires": now + timedelta(seconds=settings.UPLOAD_SESSION_EXPIRATION),
+            }
+        )
+    )
+    return chunk.dict()
+
+
+@router.post("/{dataset_id}/uploads/{session_id}/commit", response_model=FileOut)
+async def commit_upload_session(
+    dataset_id: str,
+    session_id: str,
+    user=Depends(get_current_user),
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    es: Elasticsearch = Depends(dependencies.get_elasticsearchclient),
+    rabbitmq_client: BlockingChannel = Depends(dependencies.get_rabbitmq),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Assemble the received chunks into the final object and create the file entry. For presigned sessions this is
+    the completion hook the client calls once its uploads to Minio have finished."""
+    session = await _get_upload_session(dataset_id, session_id)
+    if (dataset := await DatasetDB.get(PydanticObjectId(dataset_id))) is None:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+
+    if session.upload_id is not None:
+        if session.presigned:
+            parts = await fs.list_parts(str(session.file_id), session.upload_id)
+        else:
+            parts = [
+                UploadedPart(
+                    part_number=chunk.chunk_num, etag=chunk.etag, size=chunk.bytes
+                )
+                for chunk in session.chunks.values()
+            ]
+        parts.sort(key=lambda p: p.part_number)
+        if len(parts) == 0:
+            raise HTTPException(status_code=400, detail="No chunks have been uploaded")
+        missing = sorted(
+            set(range(1, parts[-1].part_number + 1)) - set(p.part_number for p in parts)
+        )
+        if len(missing) > 0:
+            raise HTTPException(status_code=400, detail=f"Missing chunks {missing}")
+        if not session.presigned:
+            # presigned parts may use any size Minio accepts
+            for part in parts[:-1]:
+                if part.size != session.chunk_size:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Chunk {part.part_number} must be {session.chunk_size} bytes, only the last chunk can be smaller",
+                    )
+        await fs.complete_multipart(str(session.file_id), session.upload_id, parts)
+
+    # storage is the source of truth for what was actually stored
+    try:
+        stat = await fs.stat(str(session.file_id))
+    except ObjectNotFoundError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Upload session {session_id} has no uploaded object",
+        )
+
+    new_file = FileDB(
+        id=session.file_id,
+        name=session.name,
+        creator=user,
+        dataset_id=dataset.id,
+        folder_id=session.folder_id,
+        status=dataset.status,
+        content_type=get_content_type(session.name, session.content_type),
+    )
+    await complete_file_entry(
+        new_file,
+        user,
+        es,
+        rabbitmq_client,
+        stat.version_id,
+        stat.size,
+    )
+    await session.delete()
+    return new_file.dict()
+
+
+@router.delete("/{dataset_id}/uploads/{session_id}")
+async def delete_upload_session(
+    dataset_id: str,
+    session_id: str,
+    fs: StorageBackend = Depends(dependencies.get_fs),
+    allow: bool = Depends(Authorization("uploader")),
+):
+    """Abort the upload and discard any chunks received so far."""
+    session = await _get_upload_session(dataset_id, session_id)
+    await _delete_upload_session(session, fs)
+    return {"deleted": session_id}
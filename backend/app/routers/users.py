@@ -1,9 +1,15 @@
 from datetime import timedelta
 from secrets import token_urlsafe
+from typing import Optional
 
 from app.config import settings
-from app.keycloak_auth import get_current_username
-from app.models.pages import Paged, _construct_page_metadata, _get_page_query
+from app.keycloak_auth import forget_api_key, get_current_username
+from app.models.pages import (
+    Paged,
+    _construct_page_metadata,
+    _get_page_pipeline,
+    _sort_spec,
+)
 from app.models.users import (
     ListenerAPIKeyDB,
     UserAPIKeyDB,
@@ -24,6 +30,8 @@ async def get_user_api_keys(
     current_user=Depends(get_current_username),
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
 ):
     """List all api keys that user has created
 
@@ -31,14 +39,17 @@ async def get_user_api_keys(
         skip: number of page to skip
         limit: number to limit per page
     """
+    sort = _sort_spec("created", ascending=False)
     apikeys_and_count = (
         await UserAPIKeyDB.find(UserAPIKeyDB.user == current_user)
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="created", ascending=False)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(apikeys_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        apikeys_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -85,6 +96,7 @@ async def delete_user_api_key(
         # Only allow user to delete their own key
         if apikey.user == current_user:
             await apikey.delete()
+            forget_api_key(apikey.user, apikey.key)
             return apikey.dict()
         else:
             raise HTTPException(
@@ -95,11 +107,19 @@ async def delete_user_api_key(
 
 
 @router.get("", response_model=Paged)
-async def get_users(skip: int = 0, limit: int = 2):
+async def get_users(
+    skip: int = 0,
+    limit: int = 2,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+):
+    sort = _sort_spec("email", ascending=True)
     users_and_count = await UserDB.aggregate(
-        [_get_page_query(skip, limit, sort_field="email", ascending=True)],
+        _get_page_pipeline(skip, limit, sort, cursor, include_total),
     ).to_list()
-    page_metadata = _construct_page_metadata(users_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        users_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -114,7 +134,10 @@ async def search_users(
     text: str,
     skip: int = 0,
     limit: int = 2,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
 ):
+    sort = _sort_spec("email", ascending=True)
     users_and_count = (
         await UserDB.find(
             Or(
@@ -124,11 +147,13 @@ async def search_users(
             )
         )
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="email", ascending=True)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(users_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        users_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
@@ -143,18 +168,23 @@ async def search_users_prefix(
     prefix: str,
     skip: int = 0,
     limit: int = 2,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
 ):
+    sort = _sort_spec("email", ascending=True)
     query_regx = f"^{prefix}.*"
     users_and_count = (
         await UserDB.find(
             Or(RegEx(field=UserDB.email, pattern=query_regx, options="i")),
         )
         .aggregate(
-            [_get_page_query(skip, limit, sort_field="email", ascending=True)],
+            _get_page_pipeline(skip, limit, sort, cursor, include_total),
         )
         .to_list()
     )
-    page_metadata = _construct_page_metadata(users_and_count, skip, limit)
+    page_metadata = _construct_page_metadata(
+        users_and_count, skip, limit, sort, include_total
+    )
     page = Paged(
         metadata=page_metadata,
         data=[
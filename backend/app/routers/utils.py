@@ -2,6 +2,8 @@ import mimetypes
 from typing import Optional
 
 from app.models.files import ContentType
+from app.storage.backend import PresignNotSupportedError, StorageBackend
+from fastapi import HTTPException
 
 
 def get_content_type(
@@ -23,3 +25,12 @@ def get_content_type(
             content_type = "application/octet-stream"
     type_main = content_type.split("/")[0] if type(content_type) is str else "N/A"
     return ContentType(content_type=content_type, main_type=type_main)
+
+
+async def get_presigned_url(fs: StorageBackend, key: str, *args, **kwargs) -> str:
+    """Presigned URL for an object, see `StorageBackend.presign`. Answers 400 if the storage backend does not
+    support them."""
+    try:
+        return await fs.presign(key, *args, **kwargs)
+    except PresignNotSupportedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
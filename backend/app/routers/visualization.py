@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from app import dependencies
 from app.config import settings
+from app.db.resolver import _get_by_id
 from app.keycloak_auth import get_current_user
 from app.models.datasets import DatasetDB
 from app.models.files import FileDB
@@ -20,13 +21,13 @@ from app.models.visualization_data import (
     VisualizationDataIn,
     VisualizationDataOut,
 )
-from app.routers.utils import get_content_type
+from app.routers.utils import get_content_type, get_presigned_url
+from app.storage.backend import StorageBackend
+from app.storage.responses import object_response
 from beanie import PydanticObjectId
 from bson import ObjectId
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
 from fastapi.security import HTTPBearer
-from minio import Minio
-from starlette.responses import StreamingResponse
 
 router = APIRouter()
 security = HTTPBearer()
@@ -38,7 +39,7 @@ async def add_Visualization(
     description: str,
     config: str,
     user=Depends(get_current_user),
-    fs: Minio = Depends(dependencies.get_fs),
+    fs: StorageBackend = Depends(dependencies.get_fs),
     file: UploadFile = File(...),
 ):
     """Insert VisualizationsDataDB object into MongoDB (makes Clowder ID), then Minio.
@@ -66,17 +67,12 @@ async def add_Visualization(
     visualization_id = visualization_db.id
 
     # Use unique ID as key for Minio
-    fs.put_object(
-        settings.MINIO_BUCKET_NAME,
+    stored = await fs.put_stream(
         str(visualization_id),
         file.file,
-        length=-1,
-        part_size=settings.MINIO_UPLOAD_CHUNK_SIZE,
-        content_type=visualization_db.content_type.content_type,
-    )  # async write chunk to minio
-    visualization_db.bytes = len(
-        fs.get_object(settings.MINIO_BUCKET_NAME, str(visualization_id)).data
+        visualization_db.content_type.content_type,
     )
+    visualization_db.bytes = stored.bytes
     await visualization_db.replace()
 
     return visualization_db.dict()
@@ -85,9 +81,7 @@ async def add_Visualization(
 @router.get("/{visualization_id}", response_model=VisualizationDataOut)
 async def get_visualization(visualization_id: str):
     if (
-        visualization := await VisualizationDataDBViewList.find_one(
-            VisualizationDataDBViewList.id == PydanticObjectId(visualization_id)
-        )
+        visualization := await _get_by_id(VisualizationDataDBViewList, visualization_id)
     ) is not None:
         return visualization.dict()
     raise HTTPException(
@@ -97,7 +91,7 @@ async def get_visualization(visualization_id: str):
 
 @router.delete("/{visualization_id}")
 async def remove_visualization(
-    visualization_id: str, fs: Minio = Depends(dependencies.get_fs)
+    visualization_id: str, fs: StorageBackend = Depends(dependencies.get_fs)
 ):
     if (
         visualization := await VisualizationDataDB.get(
@@ -117,7 +111,7 @@ async def remove_visualization(
                 == PydanticObjectId(visualization_id)
             )
         ) is None:
-            fs.remove_object(settings.MINIO_BUCKET_NAME, visualization_id)
+            await fs.delete(visualization_id)
 
         await visualization.delete()
         return
@@ -128,27 +122,26 @@ async def remove_visualization(
 
 @router.get("/{visualization_id}/bytes")
 async def download_visualization(
-    visualization_id: str, fs: Minio = Depends(dependencies.get_fs)
+    visualization_id: str,
+    request: Request,
+    fs: StorageBackend = Depends(dependencies.get_fs),
 ):
     # If visualization exists in MongoDB, download from Minio
     if (
-        visualization := await VisualizationDataDBViewList.find_one(
-            VisualizationDataDBViewList.id == PydanticObjectId(visualization_id)
-        )
+        visualization := await _get_by_id(VisualizationDataDBViewList, visualization_id)
     ) is not None:
         bytes_visualization_id = (
             str(visualization.origin_id)
             if visualization.origin_id
             else str(visualization.id)
         )
-        content = fs.get_object(settings.MINIO_BUCKET_NAME, bytes_visualization_id)
-
-        # Get content type & open file stream
-        response = StreamingResponse(content.stream(settings.MINIO_UPLOAD_CHUNK_SIZE))
-        response.headers["Content-Disposition"] = (
-            "attachment; filename=%s" % visualization.name
+        return await object_response(
+            request,
+            fs,
+            bytes_visualization_id,
+            filename=visualization.name,
+            media_type=visualization.content_type.content_type,
         )
-        return response
     else:
         raise HTTPException(
             status_code=404, detail=f"Visualization {visualization_id} not found"
@@ -159,13 +152,11 @@ async def download_visualization(
 async def download_visualization_url(
     visualization_id: str,
     expires_in_seconds: Optional[int] = 3600,
-    external_fs: Minio = Depends(dependencies.get_external_fs),
+    external_fs: StorageBackend = Depends(dependencies.get_external_fs),
 ):
     # If visualization exists in MongoDB, download from Minio
     if (
-        visualization := await VisualizationDataDBViewList.find_one(
-            VisualizationDataDBViewList.id == PydanticObjectId(visualization_id)
-        )
+        visualization := await _get_by_id(VisualizationDataDBViewList, visualization_id)
     ) is not None:
         if expires_in_seconds is None:
             expires = timedelta(seconds=settings.MINIO_EXPIRES)
@@ -178,10 +169,8 @@ async def download_visualization_url(
             else str(visualization.id)
         )
         # Generate a signed URL with expiration time
-        presigned_url = external_fs.presigned_get_object(
-            bucket_name=settings.MINIO_BUCKET_NAME,
-            object_name=bytes_visualization_id,
-            expires=expires,
+        presigned_url = await get_presigned_url(
+            external_fs, bytes_visualization_id, expires=expires
         )
 
         return {"presigned_url": presigned_url}
@@ -250,9 +239,7 @@ async def get_visconfig(
     user=Depends(get_current_user),
 ):
     if (
-        vis_config := await VisualizationConfigDBViewList.find_one(
-            VisualizationConfigDBViewList.id == PydanticObjectId(config_id)
-        )
+        vis_config := await _get_by_id(VisualizationConfigDBViewList, config_id)
     ) is not None:
         config_visdata = []
         query = [VisualizationDataDBViewList.visualization_config_id == config_id]
@@ -272,11 +259,7 @@ async def get_visdata_from_visconfig(
     user=Depends(get_current_user),
 ):
     config_visdata = []
-    if (
-        await VisualizationConfigDBViewList.find_one(
-            VisualizationConfigDBViewList.id == PydanticObjectId(config_id)
-        )
-    ) is not None:
+    if (await _get_by_id(VisualizationConfigDBViewList, config_id)) is not None:
         query = [VisualizationDataDBViewList.visualization_config_id == config_id]
         async for vis_data in VisualizationDataDBViewList.find(*query):
             config_visdata.append(VisualizationDataOut(**vis_data.dict()).dict())
@@ -0,0 +1,123 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional
+
+from app.config import settings
+from pydantic import BaseModel
+
+
+class ObjectNotFoundError(Exception):
+    """The requested object (or version of it) does not exist in storage."""
+
+
+class PresignNotSupportedError(Exception):
+    """The storage backend cannot hand out presigned URLs, see `StorageBackend.supports_presign`."""
+
+
+class StoredObject(BaseModel):
+    """Result of writing an object. Size and checksums are computed while the bytes are streamed."""
+
+    version_id: Optional[str] = None
+    bytes: int = 0
+    sha256: Optional[str] = None
+    md5: Optional[str] = None
+
+
+class ObjectStat(BaseModel):
+    size: int
+    version_id: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    content_type: Optional[str] = None
+
+
+class UploadedPart(BaseModel):
+    """One part of a multipart upload that storage has received."""
+
+    part_number: int
+    etag: str
+    size: int = 0
+    last_modified: Optional[datetime] = None
+
+
+class StorageBackend(ABC):
+    """Async interface to the object store holding file, thumbnail and visualization bytes.
+
+    Objects are addressed by key (usually the Clowder ID of the resource) and are versioned: every put creates a new
+    version and reads return the latest version unless a `version_id` is given. Implementations must never block the
+    event loop.
+    """
+
+    # whether clients can be handed URLs to read or write objects without going through the API
+    supports_presign: bool = False
+
+    @abstractmethod
+    async def put_stream(
+        self, key: str, data: BinaryIO, content_type: Optional[str] = None
+    ) -> StoredObject:
+        """Store a new version of `key` by streaming `data` until EOF."""
+
+    @abstractmethod
+    async def get_stream(
+        self,
+        key: str,
+        version_id: Optional[str] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        """Open an object for reading and return an iterator over its bytes, optionally limited to a byte range.
+
+        Raises ObjectNotFoundError before anything is returned if the object does not exist.
+        """
+
+    @abstractmethod
+    async def stat(self, key: str, version_id: Optional[str] = None) -> ObjectStat:
+        """Return size, version and modification time of an object, or raise ObjectNotFoundError."""
+
+    @abstractmethod
+    async def delete(self, key: str, version_id: Optional[str] = None):
+        """Remove one version of an object, or the object itself if no version is given."""
+
+    @abstractmethod
+    async def delete_many(self, keys: List[str]):
+        """Remove several objects at once."""
+
+    @abstractmethod
+    async def presign(
+        self,
+        key: str,
+        method: str = "GET",
+        expires: timedelta = timedelta(seconds=settings.MINIO_EXPIRES),
+        version_id: Optional[str] = None,
+        extra_query_params: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """Return a URL that lets a client `method` the object directly until it expires.
+
+        Raises PresignNotSupportedError if the backend does not support presigned URLs.
+        """
+
+    @abstractmethod
+    async def create_multipart(
+        self, key: str, content_type: Optional[str] = None
+    ) -> str:
+        """Start a multipart upload of `key` and return its upload ID."""
+
+    @abstractmethod
+    async def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        """Store one part of a multipart upload and return its ETag. Re-sending a part number replaces it."""
+
+    @abstractmethod
+    async def list_parts(self, key: str, upload_id: str) -> List[UploadedPart]:
+        """List the parts received so far for a multipart upload."""
+
+    @abstractmethod
+    async def complete_multipart(
+        self, key: str, upload_id: str, parts: List[UploadedPart]
+    ) -> StoredObject:
+        """Assemble the given parts, in order, into a new version of `key`."""
+
+    @abstractmethod
+    async def abort_multipart(self, key: str, upload_id: str):
+        """Discard a multipart upload and its parts. Aborting an unknown upload is not an error."""
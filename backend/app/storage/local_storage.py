@@ -0,0 +1,240 @@
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, BinaryIO, Dict, Iterator, List, Optional
+
+from app.config import settings
+from app.storage.backend import (
+    ObjectNotFoundError,
+    ObjectStat,
+    PresignNotSupportedError,
+    StorageBackend,
+    StoredObject,
+    UploadedPart,
+)
+from app.storage.streams import HashingReader
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+
+class _ConcatReader:
+    """Read several files one after the other as if they were a single stream."""
+
+    def __init__(self, paths: List[str]):
+        self.paths = list(paths)
+        self.current = None
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            if self.current is None:
+                if len(self.paths) == 0:
+                    return b""
+                self.current = open(self.paths.pop(0), "rb")
+            chunk = self.current.read(size)
+            if chunk:
+                return chunk
+            self.current.close()
+            self.current = None
+
+
+class LocalStorage(StorageBackend):
+    """Storage on a local (or mounted) filesystem, for development and single-node deployments without Minio.
+
+    Every version of an object is a file `objects/<key>/<version_id>` and `objects/<key>/.latest` holds the ID of the
+    latest version. Multipart uploads keep their parts under `multipart/<upload_id>` until they are completed.
+    """
+
+    def __init__(self, root: str = settings.LOCAL_STORAGE_PATH):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "multipart"), exist_ok=True)
+
+    def _path(self, *parts: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *parts))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key {parts[-1]}")
+        return path
+
+    def _object_dir(self, key: str) -> str:
+        return self._path("objects", key)
+
+    def _latest_version(self, key: str) -> str:
+        try:
+            with open(os.path.join(self._object_dir(key), ".latest")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            raise ObjectNotFoundError(key)
+
+    def _version_path(self, key: str, version_id: Optional[str]) -> str:
+        if version_id is None:
+            version_id = self._latest_version(key)
+        path = self._path("objects", key, version_id)
+        if not os.path.isfile(path):
+            raise ObjectNotFoundError(key)
+        return path
+
+    def _write(self, key: str, data: BinaryIO) -> StoredObject:
+        object_dir = self._object_dir(key)
+        os.makedirs(object_dir, exist_ok=True)
+        version_id = uuid.uuid4().hex
+        reader = HashingReader(data)
+        tmp_path = os.path.join(object_dir, f".{version_id}.tmp")
+        with open(tmp_path, "wb") as f:
+            while chunk := reader.read(settings.MINIO_UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(tmp_path, os.path.join(object_dir, version_id))
+        self._set_latest(key, version_id)
+        return StoredObject(
+            version_id=version_id,
+            bytes=reader.bytes,
+            sha256=reader.sha256,
+            md5=reader.md5,
+        )
+
+    def _set_latest(self, key: str, version_id: str):
+        object_dir = self._object_dir(key)
+        tmp_path = os.path.join(object_dir, ".latest.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version_id)
+        os.replace(tmp_path, os.path.join(object_dir, ".latest"))
+
+    def _read(self, path: str, offset: int, length: Optional[int]) -> Iterator[bytes]:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = settings.MINIO_UPLOAD_CHUNK_SIZE
+                if remaining is not None:
+                    size = min(size, remaining)
+                chunk = f.read(size)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def _delete(self, key: str, version_id: Optional[str]):
+        object_dir = self._object_dir(key)
+        if version_id is None:
+            shutil.rmtree(object_dir, ignore_errors=True)
+            return
+        try:
+            os.remove(self._path("objects", key, version_id))
+        except FileNotFoundError:
+            return
+        versions = [
+            os.path.join(object_dir, name)
+            for name in os.listdir(object_dir)
+            if not name.startswith(".")
+        ]
+        if len(versions) == 0:
+            shutil.rmtree(object_dir, ignore_errors=True)
+        else:
+            # fall back to the most recently written remaining version
+            self._set_latest(key, os.path.basename(max(versions, key=os.path.getmtime)))
+
+    async def put_stream(
+        self, key: str, data: BinaryIO, content_type: Optional[str] = None
+    ) -> StoredObject:
+        return await run_in_threadpool(self._write, key, data)
+
+    async def get_stream(
+        self,
+        key: str,
+        version_id: Optional[str] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        path = await run_in_threadpool(self._version_path, key, version_id)
+        return iterate_in_threadpool(self._read(path, offset, length))
+
+    async def stat(self, key: str, version_id: Optional[str] = None) -> ObjectStat:
+        path = await run_in_threadpool(self._version_path, key, version_id)
+        st = await run_in_threadpool(os.stat, path)
+        return ObjectStat(
+            size=st.st_size,
+            version_id=os.path.basename(path),
+            etag=os.path.basename(path),
+            last_modified=datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+        )
+
+    async def delete(self, key: str, version_id: Optional[str] = None):
+        await run_in_threadpool(self._delete, key, version_id)
+
+    async def delete_many(self, keys: List[str]):
+        for key in keys:
+            await run_in_threadpool(self._delete, key, None)
+
+    async def presign(
+        self,
+        key: str,
+        method: str = "GET",
+        expires: timedelta = timedelta(seconds=settings.MINIO_EXPIRES),
+        version_id: Optional[str] = None,
+        extra_query_params: Optional[Dict[str, str]] = None,
+    ) -> str:
+        raise PresignNotSupportedError(
+            "Presigned URLs are not supported by the local storage backend"
+        )
+
+    async def create_multipart(
+        self, key: str, content_type: Optional[str] = None
+    ) -> str:
+        upload_id = uuid.uuid4().hex
+        await run_in_threadpool(os.makedirs, self._path("multipart", upload_id))
+        return upload_id
+
+    async def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        def _write_part():
+            upload_dir = self._path("multipart", upload_id)
+            tmp_path = os.path.join(upload_dir, f".{part_number}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(upload_dir, str(part_number)))
+
+        await run_in_threadpool(_write_part)
+        return hashlib.md5(data).hexdigest()
+
+    async def list_parts(self, key: str, upload_id: str) -> List[UploadedPart]:
+        def _list():
+            upload_dir = self._path("multipart", upload_id)
+            parts = []
+            for name in os.listdir(upload_dir):
+                if not name.isdigit():
+                    continue
+                path = os.path.join(upload_dir, name)
+                with open(path, "rb") as f:
+                    etag = hashlib.md5(f.read()).hexdigest()
+                st = os.stat(path)
+                parts.append(
+                    UploadedPart(
+                        part_number=int(name),
+                        etag=etag,
+                        size=st.st_size,
+                        last_modified=datetime.fromtimestamp(
+                            st.st_mtime, tz=timezone.utc
+                        ),
+                    )
+                )
+            return sorted(parts, key=lambda p: p.part_number)
+
+        return await run_in_threadpool(_list)
+
+    async def complete_multipart(
+        self, key: str, upload_id: str, parts: List[UploadedPart]
+    ) -> StoredObject:
+        upload_dir = self._path("multipart", upload_id)
+        reader = _ConcatReader(
+            [os.path.join(upload_dir, str(part.part_number)) for part in parts]
+        )
+        stored = await run_in_threadpool(self._write, key, reader)
+        await self.abort_multipart(key, upload_id)
+        return stored
+
+    async def abort_multipart(self, key: str, upload_id: str):
+        await run_in_threadpool(
+            shutil.rmtree, self._path("multipart", upload_id), ignore_errors=True
+        )
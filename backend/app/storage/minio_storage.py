@@ -0,0 +1,211 @@
+import logging
+from datetime import timedelta
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional
+
+from app.config import settings
+from app.storage.backend import (
+    ObjectNotFoundError,
+    ObjectStat,
+    StorageBackend,
+    StoredObject,
+    UploadedPart,
+)
+from app.storage.streams import HashingReader
+from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# error codes Minio uses when an object or one of its versions does not exist
+NOT_FOUND_CODES = ("NoSuchKey", "NoSuchVersion", "NoSuchObject")
+
+
+class MinioStorage(StorageBackend):
+    """Storage in a versioned Minio/S3 bucket. The Minio client is blocking, so every call runs in the threadpool."""
+
+    supports_presign = True
+
+    def __init__(self, client: Minio, bucket_name: str = settings.MINIO_BUCKET_NAME):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    async def put_stream(
+        self, key: str, data: BinaryIO, content_type: Optional[str] = None
+    ) -> StoredObject:
+        reader = HashingReader(data)
+        result = await run_in_threadpool(
+            self.client.put_object,
+            self.bucket_name,
+            key,
+            reader,
+            length=-1,
+            part_size=settings.MINIO_UPLOAD_CHUNK_SIZE,
+            content_type=content_type or "application/octet-stream",
+        )
+        return StoredObject(
+            version_id=result.version_id,
+            bytes=reader.bytes,
+            sha256=reader.sha256,
+            md5=reader.md5,
+        )
+
+    async def get_stream(
+        self,
+        key: str,
+        version_id: Optional[str] = None,
+        offset: int = 0,
+        length: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        try:
+            response = await run_in_threadpool(
+                self.client.get_object,
+                self.bucket_name,
+                key,
+                offset=offset,
+                length=length or 0,
+                version_id=version_id,
+            )
+        except S3Error as e:
+            if e.code in NOT_FOUND_CODES:
+                raise ObjectNotFoundError(key)
+            raise
+        return self._iter_response(response)
+
+    async def _iter_response(self, response) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in iterate_in_threadpool(
+                response.stream(settings.MINIO_UPLOAD_CHUNK_SIZE)
+            ):
+                yield chunk
+        finally:
+            response.close()
+            response.release_conn()
+
+    async def stat(self, key: str, version_id: Optional[str] = None) -> ObjectStat:
+        try:
+            result = await run_in_threadpool(
+                self.client.stat_object, self.bucket_name, key, version_id=version_id
+            )
+        except S3Error as e:
+            if e.code in NOT_FOUND_CODES:
+                raise ObjectNotFoundError(key)
+            raise
+        return ObjectStat(
+            size=result.size,
+            version_id=result.version_id,
+            etag=result.etag,
+            last_modified=result.last_modified,
+            content_type=result.content_type,
+        )
+
+    async def delete(self, key: str, version_id: Optional[str] = None):
+        await run_in_threadpool(
+            self.client.remove_object, self.bucket_name, key, version_id=version_id
+        )
+
+    async def delete_many(self, keys: List[str]):
+        if len(keys) == 0:
+            return
+
+        def _remove():
+            # errors are returned lazily, so the iterator has to be consumed for the request to be sent
+            return list(
+                self.client.remove_objects(
+                    self.bucket_name, [DeleteObject(key) for key in keys]
+                )
+            )
+
+        for error in await run_in_threadpool(_remove):
+            logger.error(f"Could not remove {error.name} from Minio: {error.message}")
+
+    async def presign(
+        self,
+        key: str,
+        method: str = "GET",
+        expires: timedelta = timedelta(seconds=settings.MINIO_EXPIRES),
+        version_id: Optional[str] = None,
+        extra_query_params: Optional[Dict[str, str]] = None,
+    ) -> str:
+        # the first call looks up the bucket region over the network
+        return await run_in_threadpool(
+            self.client.get_presigned_url,
+            method,
+            self.bucket_name,
+            key,
+            expires=expires,
+            version_id=version_id,
+            extra_query_params=extra_query_params,
+        )
+
+    async def create_multipart(
+        self, key: str, content_type: Optional[str] = None
+    ) -> str:
+        return await run_in_threadpool(
+            self.client._create_multipart_upload,
+            self.bucket_name,
+            key,
+            {"Content-Type": content_type or "application/octet-stream"},
+        )
+
+    async def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        return await run_in_threadpool(
+            self.client._upload_part,
+            self.bucket_name,
+            key,
+            data,
+            {},
+            upload_id,
+            part_number,
+        )
+
+    async def list_parts(self, key: str, upload_id: str) -> List[UploadedPart]:
+        def _list():
+            parts = []
+            marker = None
+            while True:
+                result = self.client._list_parts(
+                    self.bucket_name, key, upload_id, part_number_marker=marker
+                )
+                parts.extend(result.parts)
+                if not result.is_truncated:
+                    return parts
+                marker = result.next_part_number_marker
+
+        return [
+            UploadedPart(
+                part_number=part.part_number,
+                etag=part.etag,
+                size=part.size or 0,
+                last_modified=part.last_modified,
+            )
+            for part in await run_in_threadpool(_list)
+        ]
+
+    async def complete_multipart(
+        self, key: str, upload_id: str, parts: List[UploadedPart]
+    ) -> StoredObject:
+        result = await run_in_threadpool(
+            self.client._complete_multipart_upload,
+            self.bucket_name,
+            key,
+            upload_id,
+            [Part(part.part_number, part.etag) for part in parts],
+        )
+        return StoredObject(
+            version_id=result.version_id, bytes=sum(part.size for part in parts)
+        )
+
+    async def abort_multipart(self, key: str, upload_id: str):
+        try:
+            await run_in_threadpool(
+                self.client._abort_multipart_upload, self.bucket_name, key, upload_id
+            )
+        except S3Error as e:
+            # upload already completed or aborted on the Minio side
+            if e.code != "NoSuchUpload":
+                raise
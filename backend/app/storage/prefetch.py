@@ -0,0 +1,108 @@
+import asyncio
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class _ByteBudget:
+    """Counts bytes held in memory by prefetched objects and makes callers wait while the budget is spent."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, size: int):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+
+    async def release(self, size: int):
+        async with self._changed:
+            self.used -= size
+            self._changed.notify_all()
+
+
+async def _replay(chunks: List[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def prefetch_streams(
+    items: AsyncIterable[T],
+    open_stream: Callable[[T], Awaitable[AsyncIterator[bytes]]],
+    size_of: Callable[[T], Optional[int]],
+    parallelism: int,
+    byte_budget: int,
+) -> AsyncIterator[Tuple[T, AsyncIterator[bytes]]]:
+    """Yield every item with a stream of its bytes, in the original order, while later objects are already being
+    downloaded in the background.
+
+    Up to `parallelism` objects are fetched at once into memory as long as their combined size stays within
+    `byte_budget`. Once the budget is spent, fetching waits until the consumer has moved past earlier items, so memory
+    stays bounded however far ahead the listing is. Objects of unknown size or larger than the whole budget are not
+    prefetched but streamed directly when their turn comes.
+
+    Arguments:
+        items: objects to read, e.g. a Mongo cursor of files
+        open_stream: opens the storage stream for an item
+        size_of: size in bytes of an item if known
+        parallelism: maximum number of concurrent downloads
+        byte_budget: maximum number of prefetched bytes held in memory
+    """
+    budget = _ByteBudget(byte_budget)
+    downloads = asyncio.Semaphore(parallelism)
+    # ordered (item, download task or None, reserved bytes), None marks the end
+    pending: asyncio.Queue = asyncio.Queue(maxsize=max(parallelism, 1) * 2)
+
+    async def download(item: T) -> List[bytes]:
+        try:
+            return [chunk async for chunk in await open_stream(item)]
+        finally:
+            downloads.release()
+
+    async def schedule():
+        async for item in items:
+            size = size_of(item)
+            if parallelism <= 1 or size is None or size > byte_budget:
+                await pending.put((item, None, 0))
+                continue
+            await budget.acquire(size)
+            await downloads.acquire()
+            await pending.put((item, asyncio.create_task(download(item)), size))
+        await pending.put(None)
+
+    scheduler = asyncio.create_task(schedule())
+    try:
+        while True:
+            get = asyncio.ensure_future(pending.get())
+            if not scheduler.done():
+                # surface errors from listing the items instead of waiting forever
+                await asyncio.wait(
+                    {get, scheduler}, return_when=asyncio.FIRST_COMPLETED
+                )
+            if scheduler.done() and scheduler.exception() is not None:
+                get.cancel()
+                raise scheduler.exception()
+            if (entry := await get) is None:
+                break
+            item, task, size = entry
+            if task is None:
+                yield item, await open_stream(item)
+            else:
+                yield item, _replay(await task)
+                await budget.release(size)
+    finally:
+        scheduler.cancel()
+        while not pending.empty():
+            if (entry := pending.get_nowait()) is not None and entry[1] is not None:
+                entry[1].cancel()
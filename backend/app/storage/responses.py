@@ -0,0 +1,264 @@
+import os
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.storage.backend import ObjectNotFoundError, StorageBackend
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+# more ranges than this in one request are ignored and the whole object is sent instead
+MAX_RANGES = 16
+
+# (offset, length) -> bytes of that part of the object
+Reader = Callable[[int, Optional[int]], Awaitable[AsyncIterator[bytes]]]
+
+
+def _parse_ranges(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a `Range: bytes=...` header into inclusive (start, end) pairs.
+
+    Returns None if the header should be ignored (malformed or too many ranges) and an empty list if none of the ranges
+    can be satisfied.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        first, sep, last = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                # suffix range: the last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last != "" else size - 1
+                if last != "" and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        return _as_utc(parsedate_to_datetime(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime]
+) -> bool:
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        # If-None-Match uses weak comparison and takes precedence over If-Modified-Since
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+        since = _parse_http_date(if_modified_since)
+        if since is not None and last_modified is not None:
+            return int(last_modified.timestamp()) <= int(since.timestamp())
+    return False
+
+
+def _if_range_matches(
+    request: Request, etag: str, last_modified: Optional[datetime]
+) -> bool:
+    if (if_range := request.headers.get("if-range")) is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == etag
+    since = _parse_http_date(if_range)
+    return (
+        since is not None
+        and last_modified is not None
+        and int(last_modified.timestamp()) == int(since.timestamp())
+    )
+
+
+async def _ranged_response(
+    request: Request,
+    size: int,
+    etag: str,
+    last_modified: Optional[datetime],
+    read: Reader,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+    if last_modified is not None:
+        last_modified = _as_utc(last_modified)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if filename is not None:
+        headers["Content-Disposition"] = "attachment; filename=%s" % filename
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    if (range_header := request.headers.get("range")) is not None and (
+        _if_range_matches(request, etag, last_modified)
+    ):
+        ranges = _parse_ranges(range_header, size)
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            await read(0, None), media_type=media_type, headers=headers
+        )
+    if len(ranges) == 0:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            await read(start, end - start + 1),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    # several ranges are sent as a multipart/byteranges body
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type or 'application/octet-stream'}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(
+            len(h) + (end - start + 1) + 2
+            for h, (start, end) in zip(part_headers, ranges)
+        )
+        + len(closing)
+    )
+
+    async def body() -> AsyncIterator[bytes]:
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            async for chunk in await read(start, end - start + 1):
+                yield chunk
+            yield b"\r\n"
+        yield closing
+
+    return StreamingResponse(
+        body(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
+
+
+async def object_response(
+    request: Request,
+    fs: StorageBackend,
+    key: str,
+    version_id: Optional[str] = None,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    """Serve an object from storage honouring Range, If-Range, If-None-Match and If-Modified-Since.
+
+    The ETag is the storage version ID, so it changes whenever new bytes are uploaded. Byte ranges are read from
+    storage directly instead of fetching the whole object.
+
+    Arguments:
+        request: the incoming request whose headers are checked
+        fs: storage backend holding the object
+        key: key of the object in storage
+        version_id: specific version to serve, the latest one if not given
+        filename: name to send in Content-Disposition
+        media_type: Content-Type of the object
+    """
+    try:
+        stat = await fs.stat(key, version_id)
+    except ObjectNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Bytes for {key} not found")
+    # pin the version so that all ranges come from the same bytes
+    version_id = stat.version_id or version_id
+
+    async def read(offset: int, length: Optional[int]) -> AsyncIterator[bytes]:
+        return await fs.get_stream(key, version_id, offset, length)
+
+    return await _ranged_response(
+        request,
+        stat.size,
+        f'"{version_id or stat.etag}"',
+        stat.last_modified,
+        read,
+        filename,
+        media_type,
+    )
+
+
+def _pread(path: str, offset: int, length: int) -> Iterator[bytes]:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        end = offset + length
+        while offset < end:
+            chunk = os.pread(
+                fd, min(settings.MINIO_UPLOAD_CHUNK_SIZE, end - offset), offset
+            )
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+
+async def local_file_response(
+    request: Request,
+    path: str,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> Response:
+    """Serve a file registered by path (StorageType.LOCAL) with the same Range and conditional-GET handling.
+
+    Local files have no version ID, so the ETag is derived from modification time and size.
+    """
+    try:
+        st = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"File {filename} not found")
+
+    async def read(offset: int, length: Optional[int]) -> AsyncIterator[bytes]:
+        if length is None:
+            length = st.st_size - offset
+        return iterate_in_threadpool(_pread(path, offset, length))
+
+    return await _ranged_response(
+        request,
+        st.st_size,
+        f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+        datetime.fromtimestamp(st.st_mtime, tz=timezone.utc),
+        read,
+        filename,
+        media_type,
+    )
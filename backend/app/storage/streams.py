@@ -0,0 +1,32 @@
+import hashlib
+from typing import BinaryIO
+
+
+class HashingReader:
+    """Wrap a binary file-like object so that every chunk read from it is counted and hashed on the fly.
+
+    This lets an upload learn its size and checksums while it is being streamed to storage instead of reading the
+    object back afterwards.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.bytes = 0
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        if chunk:
+            self.bytes += len(chunk)
+            self._sha256.update(chunk)
+            self._md5.update(chunk)
+        return chunk
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
@@ -0,0 +1,71 @@
+import time
+import zipfile
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object that collects what zipfile writes so it can be handed out in chunks.
+
+    Because it has no `tell`, zipfile writes every entry with a data descriptor after its contents, which is what makes
+    it possible to emit an entry before its size and CRC are known.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Build a zip archive on the fly. Every method yields the archive bytes produced so far, so a response can start
+    sending before the last entry has been read and nothing is staged on disk.
+
+    Entries always carry ZIP64 extra fields since their size is not known in advance.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_DEFLATED):
+        self.compression = compression
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=compression)
+
+    def _entry(self, name: str):
+        zinfo = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        zinfo.compress_type = self.compression
+        return self._zip.open(zinfo, "w", force_zip64=True)
+
+    async def write_stream(
+        self, name: str, chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[bytes]:
+        """Add an entry whose contents come from an async iterator."""
+        entry = self._entry(name)
+        async for chunk in chunks:
+            # compression is CPU bound, keep it off the event loop
+            await run_in_threadpool(entry.write, chunk)
+            if data := self._sink.drain():
+                yield data
+        entry.close()
+        if data := self._sink.drain():
+            yield data
+
+    def write_bytes(self, name: str, data: bytes) -> bytes:
+        """Add a small in-memory entry and return the archive bytes it produced."""
+        with self._entry(name) as entry:
+            entry.write(data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Write the central directory and return the final archive bytes."""
+        self._zip.close()
+        return self._sink.drain()
@@ -22,3 +22,19 @@ def test_delete(client: TestClient, headers: dict):
     )
     # TODO: Verify it was actually deleted
     assert delete_response.status_code == 200
+
+
+def test_deleted_key_rejected(client: TestClient, headers: dict):
+    hashed_key = create_apikey(client, headers)
+    key_headers = {"X-API-KEY": hashed_key}
+    # the second request is answered from the key cache
+    for _ in range(2):
+        response = client.get(f"{settings.API_V2_STR}/users/keys", headers=key_headers)
+        assert response.status_code == 200
+    key_id = response.json().get("data")[0].get("id")
+    response = client.delete(
+        f"{settings.API_V2_STR}/users/keys/{key_id}", headers=headers
+    )
+    assert response.status_code == 200
+    response = client.get(f"{settings.API_V2_STR}/users/keys", headers=key_headers)
+    assert response.status_code == 401
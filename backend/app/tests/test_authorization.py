@@ -1,5 +1,7 @@
 from app.config import settings
-from app.tests.utils import create_dataset
+from app.models.authorization import MAX_BATCH_IDS
+from app.tests.utils import create_dataset, upload_file
+from bson import ObjectId
 from fastapi.testclient import TestClient
 
 
@@ -44,3 +46,28 @@ def test_set_admin_mode(client: TestClient, headers: dict):
     )
     assert response.status_code == 200
     assert response.json() is False
+
+
+def test_batch(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    file_id = upload_file(client, headers, dataset_id).get("id")
+    missing_id = str(ObjectId())
+
+    response = client.post(
+        f"{settings.API_V2_STR}/authorizations/batch",
+        json={"dataset_ids": [dataset_id, missing_id], "file_ids": [file_id]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "datasets": {dataset_id: "owner", missing_id: None},
+        "files": {file_id: "owner"},
+        "metadata": {},
+    }
+
+    response = client.post(
+        f"{settings.API_V2_STR}/authorizations/batch",
+        json={"file_ids": [missing_id] * (MAX_BATCH_IDS + 1)},
+        headers=headers,
+    )
+    assert response.status_code == 422
@@ -1,7 +1,19 @@
+import io
+import json
 import os
+import time
+import zipfile
 
+import pytest
 from app.config import settings
-from app.tests.utils import create_dataset, generate_png, upload_file
+from app.tests.utils import (
+    create_dataset,
+    create_folder,
+    file_content_example_1,
+    filename_example_1,
+    generate_png,
+    upload_file,
+)
 from fastapi.testclient import TestClient
 
 
@@ -270,3 +282,179 @@ def test_freeze_and_delete(client: TestClient, headers: dict):
         headers=headers,
     )
     assert response.status_code == 404
+
+
+def test_frozen_archive(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    upload_file(client, headers, dataset_id)
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze", headers=headers
+    )
+    assert response.status_code == 200
+    version_id = response.json().get("id")
+
+    # the archive is built in the background after freezing
+    for _ in range(50):
+        response = client.get(
+            f"{settings.API_V2_STR}/datasets/{version_id}/download/url",
+            headers=headers,
+        )
+        if response.status_code == 200:
+            break
+        time.sleep(0.2)
+    assert response.status_code == 200
+    assert response.json().get("presigned_url") is not None
+
+    # later downloads are served from the prebuilt archive
+    first = client.get(
+        f"{settings.API_V2_STR}/datasets/{version_id}/download", headers=headers
+    )
+    second = client.get(
+        f"{settings.API_V2_STR}/datasets/{version_id}/download", headers=headers
+    )
+    assert first.status_code == 200
+    assert first.content == second.content
+    assert zipfile.ZipFile(io.BytesIO(first.content)).testzip() is None
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{version_id}/download",
+        headers={**headers, "Range": "bytes=0-3"},
+    )
+    assert response.status_code == 206
+    assert response.content == first.content[:4]
+
+    # a deleted release is not served any more, its authorizations are gone with it
+    response = client.delete(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze/1", headers=headers
+    )
+    assert response.status_code == 200
+    for path in ("download", "download/url"):
+        response = client.get(
+            f"{settings.API_V2_STR}/datasets/{version_id}/{path}", headers=headers
+        )
+        assert response.status_code in (403, 404)
+
+
+def test_freeze_folders(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    outer = create_folder(client, headers, dataset_id, "outer").get("id")
+    create_folder(client, headers, dataset_id, "inner", outer)
+    upload_file(client, headers, dataset_id)
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze", headers=headers
+    )
+    assert response.status_code == 200
+    version_id = response.json().get("id")
+
+    # the release is written in the background, TestClient waits for it
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze_jobs", headers=headers
+    )
+    assert response.status_code == 200
+    job = response.json()[0]
+    assert job["status"] == "SUCCEEDED"
+    assert job["frozen_dataset_id"] == version_id
+    assert job["frozen_folders"] == 2
+    assert job["frozen_files"] == 1
+
+    # released folders point at each other, not at the current ones
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{version_id}/folders", headers=headers
+    )
+    assert response.status_code == 200
+    frozen_outer = response.json()["data"][0]["id"]
+    assert frozen_outer != outer
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{version_id}/folders?parent_folder={frozen_outer}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    frozen_inner = response.json()["data"][0]["id"]
+    response = client.get(
+        f"{settings.API_V2_STR}/folders/{frozen_inner}/path", headers=headers
+    )
+    assert response.json() == [
+        {"folder_name": "outer", "folder_id": frozen_outer},
+        {"folder_name": "inner", "folder_id": frozen_inner},
+    ]
+
+
+# the views are built when the app starts, CI runs this module again with FREEZE_SNAPSHOTS=True
+@pytest.mark.skipif(not settings.FREEZE_SNAPSHOTS, reason="needs FREEZE_SNAPSHOTS")
+def test_freeze_snapshots(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    upload_file(client, headers, dataset_id)
+    versions = []
+    for _ in range(2):
+        response = client.post(
+            f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze", headers=headers
+        )
+        assert response.status_code == 200
+        versions.append(response.json().get("id"))
+
+    # the unchanged file is shared with the second release instead of copied
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze_jobs", headers=headers
+    )
+    job = response.json()[0]
+    assert job["frozen_dataset_id"] == versions[1]
+    assert job["shared"].get("files_freeze") == 1
+    assert job["written"].get("files_freeze") is None
+
+    # deleting the first release only removes it from the shared file
+    response = client.delete(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze/1", headers=headers
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{versions[1]}/files", headers=headers
+    )
+    assert response.status_code == 200
+    files = response.json()["data"]
+    assert [file["name"] for file in files] == [filename_example_1]
+    assert files[0]["dataset_id"] == versions[1]
+    response = client.get(
+        f"{settings.API_V2_STR}/files/{files[0]['id']}", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.content.decode() == file_content_example_1
+
+
+def test_diff_versions(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    kept = upload_file(client, headers, dataset_id).get("id")
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze", headers=headers
+    )
+    assert response.status_code == 200
+    folder_id = create_folder(client, headers, dataset_id, "added").get("id")
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/diff?base=1", headers=headers
+    )
+    assert response.status_code == 200
+    changes = [json.loads(line) for line in response.text.splitlines()]
+    assert changes == [
+        {
+            "change": "ADDED",
+            "object_type": "folder",
+            "origin_id": folder_id,
+            "name": "added",
+            "resource_id": None,
+        }
+    ]
+    assert kept not in [change["origin_id"] for change in changes]
+
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/freeze", headers=headers
+    )
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/diff?base=2&target=1",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert json.loads(response.text)["change"] == "REMOVED"
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/diff?base=3", headers=headers
+    )
+    assert response.status_code == 404
@@ -1,10 +1,19 @@
+import base64
+import hashlib
+import io
 import os
+import tarfile
+import zipfile
 
 from app.config import settings
 from app.tests.utils import (
     create_dataset,
     create_dataset_with_custom_license,
+    create_folder,
+    file_content_example_1,
+    filename_example_1,
     generate_png,
+    upload_file,
     user_alt,
 )
 from fastapi.testclient import TestClient
@@ -65,6 +74,44 @@ def test_delete_with_metadata(client: TestClient, headers: dict):
     assert response.status_code == 404
 
 
+def test_download(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    upload_file(client, headers, dataset_id)
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/download", headers=headers
+    )
+    assert response.status_code == 200
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    assert f"data/{filename_example_1}" in names
+    assert "ro-crate-metadata.json" in names
+    md5 = hashlib.md5(file_content_example_1.encode()).hexdigest()
+    assert archive.read("manifest-md5.txt").decode() == f"{md5} {filename_example_1}\n"
+
+
+def test_download_nested_folders(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    outer_id = create_folder(client, headers, dataset_id, "outer").get("id")
+    inner_id = create_folder(client, headers, dataset_id, "inner", outer_id).get("id")
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/files?folder_id={inner_id}",
+        headers=headers,
+        files={"file": ("nested.txt", io.BytesIO(b"nested"))},
+    )
+    assert response.status_code == 200
+    upload_file(client, headers, dataset_id)
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/download", headers=headers
+    )
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert "data/outer/inner/nested.txt" in names
+    assert f"data/{filename_example_1}" in names
+
+
 def test_edit(client: TestClient, headers: dict):
     new_dataset = create_dataset(client, headers)
     response = client.patch(
@@ -135,3 +182,117 @@ def test_share_dataset(client: TestClient, headers: dict):
         headers=headers,
     )
     assert resp.status_code == 200
+
+
+def test_create_from_zip(client: TestClient, headers: dict):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w") as archive:
+        archive.writestr("top.txt", "top")
+        archive.writestr("outer/inner/nested.txt", "nested")
+        archive.writestr("empty/", "")
+        archive.writestr("__MACOSX/._top.txt", "")
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/createFromZip",
+        headers=headers,
+        files={"file": ("archive.zip", content.getvalue())},
+    )
+    assert response.status_code == 200
+    dataset_id = response.json().get("id")
+    assert response.json().get("name") == "archive"
+
+    # the test client runs the ingestion job before returning
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/ingestions", headers=headers
+    )
+    assert response.status_code == 200
+    job = response.json()[0]
+    assert job.get("status") == "SUCCEEDED"
+    assert job.get("total_files") == 2
+    assert job.get("processed_files") == 2
+    assert job.get("total_folders") == 3
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/download", headers=headers
+    )
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+    assert "data/top.txt" in names
+    assert "data/outer/inner/nested.txt" in names
+
+
+def test_create_from_tar_gz(client: TestClient, headers: dict):
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode="w:gz") as archive:
+        for name, data in [("top.txt", b"top"), ("outer/inner/nested.txt", b"nested")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/createFromArchive?filename=archive.tar.gz",
+        headers=headers,
+        content=content.getvalue(),
+    )
+    assert response.status_code == 200
+    dataset_id = response.json().get("id")
+    assert response.json().get("name") == "archive"
+
+    job = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/ingestions", headers=headers
+    ).json()[0]
+    assert job.get("status") == "SUCCEEDED"
+    assert job.get("processed_files") == 2
+    assert job.get("total_folders") == 2
+
+    # a truncated stream fails the request and leaves no dataset behind
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/createFromArchive?filename=broken.tar.gz",
+        headers=headers,
+        content=content.getvalue()[: len(content.getvalue()) // 2],
+    )
+    assert response.status_code == 400
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets?mine=true&limit=100", headers=headers
+    )
+    assert "broken" not in [dataset["name"] for dataset in response.json()["data"]]
+
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/createFromArchive?filename=archive.rar",
+        headers=headers,
+        content=b"",
+    )
+    assert response.status_code == 400
+
+
+def test_list_with_cursor(client: TestClient, headers: dict):
+    for _ in range(3):
+        create_dataset(client, headers)
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets?mine=true&limit=2&include_total=false",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    metadata = response.json().get("metadata")
+    assert metadata.get("total_count") is None
+    first_page = [dataset["id"] for dataset in response.json().get("data")]
+    assert len(first_page) == 2
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets?mine=true&limit=2&cursor={metadata.get('next_cursor')}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    second_page = [dataset["id"] for dataset in response.json().get("data")]
+    assert len(second_page) > 0
+    assert set(first_page).isdisjoint(second_page)
+
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets?cursor=not-a-cursor", headers=headers
+    )
+    assert response.status_code == 400
+
+    # operators in place of sort values
+    cursor = base64.urlsafe_b64encode(b'[{"$ne": null}, {"$ne": null}]').decode()
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets?mine=true&limit=2&cursor={cursor}",
+        headers=headers,
+    )
+    assert response.status_code == 400
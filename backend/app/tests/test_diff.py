@@ -0,0 +1,40 @@
+import asyncio
+
+from app.db.dataset.diff import _change, _content_hash, _Entry, _merge
+from beanie import PydanticObjectId
+from pydantic import BaseModel
+
+
+class _Document(BaseModel):
+    id: PydanticObjectId
+    name: str
+    views: int = 0
+
+
+def test_content_hash():
+    document = _Document(id=PydanticObjectId(), name="a")
+    # the ID of the copy and view counters do not count as content
+    copy = _Document(id=PydanticObjectId(), name="a", views=3)
+    assert _content_hash(document) == _content_hash(copy)
+    assert _content_hash(document) != _content_hash(_Document(id=document.id, name="b"))
+
+
+def test_merge():
+    a, b, c = sorted(PydanticObjectId() for _ in range(3))
+
+    async def entries(*items):
+        for origin_id, content_hash in items:
+            yield _Entry(origin_id, origin_id, None, content_hash)
+
+    async def diff():
+        return [
+            _change("file", left, right)
+            async for left, right in _merge(
+                entries((a, "1"), (b, "1")), entries((b, "2"), (c, "1"))
+            )
+        ]
+
+    removed, modified, added = asyncio.run(diff())
+    assert (removed.change, removed.origin_id) == ("REMOVED", a)
+    assert (modified.change, modified.origin_id) == ("MODIFIED", b)
+    assert (added.change, added.origin_id) == ("ADDED", c)
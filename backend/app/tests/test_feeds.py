@@ -36,12 +36,14 @@ def test_feeds(client: TestClient, headers: dict):
         client, headers, dataset_id, "xyz.txt", "This should trigger."
     ).get("id")
 
-    time.sleep(1)
-
-    # Check if job was automatically created
-    response = client.get(
-        f"{settings.API_V2_STR}/jobs?listener_id={listener_name}&file_id={file_id}",
-        headers=headers,
-    )
-    assert response.status_code == 200
+    # Check if job was automatically created, feeds are checked in the background after the upload
+    for _ in range(20):
+        response = client.get(
+            f"{settings.API_V2_STR}/jobs?listener_id={listener_name}&file_id={file_id}",
+            headers=headers,
+        )
+        assert response.status_code == 200
+        if len(response.json()) > 0:
+            break
+        time.sleep(0.5)
     assert len(response.json()) > 0
@@ -1,7 +1,14 @@
+import hashlib
 import os
 
 from app.config import settings
-from app.tests.utils import create_dataset, generate_png, upload_file, upload_files
+from app.tests.utils import (
+    create_dataset,
+    file_content_example_1,
+    generate_png,
+    upload_file,
+    upload_files,
+)
 from fastapi.testclient import TestClient
 
 
@@ -49,6 +56,31 @@ def test_get_one(client: TestClient, headers: dict):
     assert result["version_num"] == 1
     assert result["dataset_id"] == dataset_id
 
+    # Size and checksums are recorded while streaming the upload
+    content = file_content_example_1.encode()
+    assert result["bytes"] == len(content)
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    assert result["md5"] == hashlib.md5(content).hexdigest()
+
+
+def test_download_range(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    file_id = upload_file(client, headers, dataset_id).get("id")
+    url = f"{settings.API_V2_STR}/files/{file_id}?increment=false"
+
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={**headers, "Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert response.content == file_content_example_1.encode()[0:4]
+    assert response.headers["Content-Range"].startswith("bytes 0-3/")
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
 
 def test_add_thumbnail(client: TestClient, headers: dict):
     dataset_id = create_dataset(client, headers).get("id")
@@ -44,3 +44,44 @@ def test_rename_folder(client: TestClient, headers: dict):
     assert response.status_code == 200
     assert response.json().get("id") is not None
     assert response.json().get("name") == "edited name"
+
+
+def test_move_and_delete_subtree(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    a = create_folder(client, headers, dataset_id, "a").get("id")
+    b = create_folder(client, headers, dataset_id, "b", a).get("id")
+    c = create_folder(client, headers, dataset_id, "c", b).get("id")
+    d = create_folder(client, headers, dataset_id, "d").get("id")
+
+    response = client.get(f"{settings.API_V2_STR}/folders/{c}/path", headers=headers)
+    assert [f["folder_name"] for f in response.json()] == ["a", "b", "c"]
+
+    # a folder cannot be moved below itself
+    response = client.patch(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/folders/{a}",
+        json={"parent_folder": c},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    # moving b carries c along
+    response = client.patch(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/folders/{b}",
+        json={"parent_folder": d},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["path"] == "d/b/"
+    response = client.get(f"{settings.API_V2_STR}/folders/{c}/path", headers=headers)
+    assert [f["folder_name"] for f in response.json()] == ["d", "b", "c"]
+
+    response = client.delete(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/folders/{d}", headers=headers
+    )
+    assert response.status_code == 200
+    for folder_id in [b, c, d]:
+        response = client.get(
+            f"{settings.API_V2_STR}/datasets/{dataset_id}/folders/{folder_id}",
+            headers=headers,
+        )
+        assert response.status_code == 404
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+import rsa
+from app import keycloak_auth
+from app.keycloak_auth import (
+    get_current_username,
+    get_identity,
+    get_read_only_user,
+    get_user,
+    jwks,
+    verify_token,
+)
+from app.routers.authentication import get_admin, get_admin_mode
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from jose import jwk, jwt
+from keycloak.exceptions import KeycloakConnectionError
+
+
+@pytest.fixture
+def signing_key(monkeypatch):
+    public, private = rsa.newkeys(1024)
+    key = jwk.construct(public.save_pkcs1().decode(), "RS256").to_dict()
+    monkeypatch.setattr(jwks, "keys", {"test": dict(key, kid="test")})
+    # a token with an unknown key does not fetch the keys again
+    monkeypatch.setattr(jwks, "fetched", time.monotonic())
+    monkeypatch.setattr(
+        keycloak_auth, "_verified_tokens", type(keycloak_auth._verified_tokens)()
+    )
+    return private.save_pkcs1().decode()
+
+
+def _token(private_key, kid="test", expires_in=60):
+    claims = {"email": "test@test.org", "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_verify_token(signing_key):
+    token = _token(signing_key)
+    assert asyncio.run(verify_token(token))["email"] == "test@test.org"
+    # remembered until it expires
+    assert len(keycloak_auth._verified_tokens) == 1
+    assert asyncio.run(verify_token(token))["email"] == "test@test.org"
+
+    for token in (_token(signing_key, expires_in=-60), _token(signing_key, "other")):
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(verify_token(token))
+        assert e.value.status_code == 401
+    assert len(keycloak_auth._verified_tokens) == 1
+
+
+def test_keys_unavailable(signing_key, monkeypatch):
+    def certs():
+        raise KeycloakConnectionError("Can't connect to server")
+
+    monkeypatch.setattr(keycloak_auth.keycloak_openid, "certs", certs)
+    monkeypatch.setattr(jwks, "fetched", float("-inf"))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(verify_token(_token(signing_key, "rotated")))
+    assert e.value.status_code == 503
+    assert e.value.headers == {"WWW-Authenticate": "Bearer"}
+
+
+def test_token_without_email(monkeypatch):
+    async def verify(token):
+        return {"sub": "service-account"}
+
+    monkeypatch.setattr(keycloak_auth, "verify_token", verify)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(get_identity(token="token", api_key=None, token_cookie=None))
+    assert e.value.status_code == 401
+    assert e.value.headers == {"WWW-Authenticate": "Bearer"}
+
+
+def test_identity_resolved_once(monkeypatch):
+    calls = {"verify": 0, "users": 0}
+
+    async def verify(token):
+        calls["verify"] += 1
+        return {"email": "test@test.org"}
+
+    class _UserDB:
+        email = None
+
+        @staticmethod
+        async def find_one(*args):
+            calls["users"] += 1
+            return SimpleNamespace(admin=False, admin_mode=False, read_only_user=False)
+
+    monkeypatch.setattr(keycloak_auth, "verify_token", verify)
+    monkeypatch.setattr(keycloak_auth, "UserDB", _UserDB)
+
+    # the dependencies of a typical dataset route
+    app = FastAPI(dependencies=[Depends(get_current_username)])
+
+    @app.get("/")
+    async def route(
+        username=Depends(get_user),
+        admin=Depends(get_admin),
+        admin_mode: bool = Depends(get_admin_mode),
+        read_only: bool = Depends(get_read_only_user),
+    ):
+        return username == "test@test.org" and not (admin or admin_mode or read_only)
+
+    response = TestClient(app).get("/", headers={"Authorization": "Bearer token"})
+    assert response.status_code == 200
+    assert response.json() is True
+    # four token verifications and four user lookups before
+    assert calls == {"verify": 1, "users": 1}
@@ -1,3 +1,4 @@
+from app.config import settings
 from fastapi.testclient import TestClient
 
 
@@ -10,3 +11,23 @@ def test_main(client: TestClient):
 def test_docs(client: TestClient):
     response = client.get("/docs")
     assert response.status_code == 200
+
+
+def test_storage_status(client: TestClient, headers: dict):
+    # the startup bucket check already went through the internal pool
+    response = client.get(f"{settings.API_V2_STR}/status/storage", headers=headers)
+    assert response.status_code == 200
+    assert any(pool["client"] == "internal" for pool in response.json())
+
+
+def test_index_status(client: TestClient, headers: dict):
+    response = client.get(f"{settings.API_V2_STR}/status/indexes", headers=headers)
+    assert response.status_code == 200
+    files = next(
+        c for c in response.json()["collections"] if c["collection"] == "files"
+    )
+    assert "dataset_id_1_folder_id_1_created_-1" in [
+        i["name"] for i in files["indexes"]
+    ]
+    # every hot query shape is served by one of the declared indexes
+    assert not [p for p in response.json()["query_plans"] if p["collscan"]]
@@ -0,0 +1,20 @@
+from app.db.materialized import _scoped_pipeline
+from app.models.folder_and_file import FolderFileViewList
+
+
+def test_scoped_pipeline():
+    match = {"dataset_id": {"$in": ["a"]}}
+    pipeline = _scoped_pipeline(FolderFileViewList.Settings.pipeline, match)
+    assert pipeline[0] == {"$match": match}
+    unions = [stage["$unionWith"] for stage in pipeline if "$unionWith" in stage]
+    assert [union["coll"] for union in unions] == [
+        "folders",
+        "files_freeze",
+        "folders_freeze",
+    ]
+    # every union is restricted before its own stages run
+    assert all(union["pipeline"][0] == {"$match": match} for union in unions)
+    # the view definition itself is untouched
+    assert FolderFileViewList.Settings.pipeline[1]["$unionWith"]["pipeline"][0] == {
+        "$addFields": {"object_type": "folder", "frozen": False, "origin_id": "$_id"}
+    }
@@ -0,0 +1,42 @@
+from app.config import settings
+from app.db.resolver import _add_fields, _view_branches
+from app.models.datasets import DatasetDBViewList
+from app.models.mongomodel import _released_stages
+
+
+class _DatasetView:
+    @staticmethod
+    def get_settings():
+        return type(
+            "Settings",
+            (),
+            {"source": "datasets", "pipeline": DatasetDBViewList.Settings.pipeline},
+        )
+
+
+def test_view_branches():
+    branches, lookups = _view_branches(_DatasetView)
+    assert [collection for collection, _ in branches] == [
+        "datasets",
+        "datasets_freeze",
+    ]
+    assert lookups[0]["from"] == "authorization"
+
+    current = _add_fields({"_id": 1, "name": "a"}, branches[0][1])
+    assert current == {
+        "_id": 1,
+        "name": "a",
+        "frozen": False,
+        "frozen_version_num": -999,
+        "origin_id": 1,
+    }
+    frozen = _add_fields({"_id": 2, "origin_id": 1}, branches[1][1])
+    assert frozen == {"_id": 2, "origin_id": 1, "frozen": True}
+
+
+def test_shared_release_resolves_to_latest(monkeypatch):
+    monkeypatch.setattr(settings, "FREEZE_SNAPSHOTS", True)
+    stages = _released_stages({"frozen": True})
+    document = _add_fields({"_id": 2, "dataset_id": 1, "release_ids": [1, 3]}, stages)
+    assert document["dataset_id"] == 3
+    assert document["frozen"] is True
@@ -0,0 +1,58 @@
+from app.config import settings
+from app.db import role_cache
+from app.db.role_cache import MISSING, _apply_change, _TTLCache
+from bson import ObjectId
+
+
+def test_ttl_cache(monkeypatch):
+    monkeypatch.setattr(settings, "ROLE_CACHE_SIZE", 2)
+    cache = _TTLCache()
+    cache.set("a", None, cache.generation)
+    cache.set("b", "viewer", cache.generation)
+    assert cache.get("a") is None
+    cache.set("c", "owner", cache.generation)
+    # least recently used
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == "owner"
+
+    # read before an invalidation, not cached
+    generation = cache.generation
+    cache.discard("a")
+    cache.set("a", "editor", generation)
+    assert cache.get("a") is MISSING
+
+    monkeypatch.setattr(settings, "ROLE_CACHE_TTL", 0)
+    cache.set("d", "owner", cache.generation)
+    assert cache.get("d") is MISSING
+
+
+def test_apply_change(monkeypatch):
+    monkeypatch.setattr(role_cache, "roles", _TTLCache())
+    monkeypatch.setattr(role_cache, "dataset_statuses", _TTLCache())
+    dataset_id, other_id = ObjectId(), ObjectId()
+    for key in [("a@b.org", str(dataset_id)), ("a@b.org", str(other_id))]:
+        role_cache.roles.set(key, "viewer", role_cache.roles.generation)
+    role_cache.dataset_statuses.set(
+        str(dataset_id), "PUBLIC", role_cache.dataset_statuses.generation
+    )
+
+    _apply_change(
+        {
+            "ns": {"coll": "datasets"},
+            "operationType": "update",
+            "documentKey": {"_id": dataset_id},
+        }
+    )
+    assert role_cache.dataset_statuses.get(str(dataset_id)) is MISSING
+    assert role_cache.roles.get(("a@b.org", str(dataset_id))) == "viewer"
+
+    _apply_change(
+        {
+            "ns": {"coll": "authorization"},
+            "operationType": "update",
+            "documentKey": {"_id": ObjectId()},
+            "fullDocument": {"dataset_id": dataset_id},
+        }
+    )
+    assert role_cache.roles.get(("a@b.org", str(dataset_id))) is MISSING
+    assert role_cache.roles.get(("a@b.org", str(other_id))) == "viewer"
@@ -0,0 +1,139 @@
+import asyncio
+import io
+
+import pytest
+from app.routers.utils import get_presigned_url
+from app.storage.backend import ObjectNotFoundError, PresignNotSupportedError
+from app.storage.local_storage import LocalStorage
+from app.storage.prefetch import prefetch_streams
+from app.storage.responses import object_response
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+
+async def _read(fs: LocalStorage, key: str, **kwargs) -> bytes:
+    return b"".join([chunk async for chunk in await fs.get_stream(key, **kwargs)])
+
+
+@pytest.mark.asyncio
+async def test_local_storage_versions(tmp_path):
+    fs = LocalStorage(str(tmp_path))
+    first = await fs.put_stream("a", io.BytesIO(b"first version"))
+    second = await fs.put_stream("a", io.BytesIO(b"second"))
+    assert first.bytes == 13
+    assert first.version_id != second.version_id
+
+    assert await _read(fs, "a") == b"second"
+    assert await _read(fs, "a", version_id=first.version_id) == b"first version"
+    assert await _read(fs, "a", version_id=first.version_id, offset=6, length=3) == (
+        b"ver"
+    )
+    assert (await fs.stat("a")).size == 6
+
+    await fs.delete("a", version_id=second.version_id)
+    assert await _read(fs, "a") == b"first version"
+    await fs.delete_many(["a"])
+    with pytest.raises(ObjectNotFoundError):
+        await fs.stat("a")
+
+
+@pytest.mark.asyncio
+async def test_local_storage_presign(tmp_path):
+    fs = LocalStorage(str(tmp_path))
+    assert not fs.supports_presign
+    with pytest.raises(PresignNotSupportedError):
+        await fs.presign("a")
+    # routes answer 400
+    with pytest.raises(HTTPException) as e:
+        await get_presigned_url(fs, "a", "PUT")
+    assert e.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_local_storage_multipart(tmp_path):
+    fs = LocalStorage(str(tmp_path))
+    upload_id = await fs.create_multipart("b")
+    await fs.upload_part("b", upload_id, 2, b"world")
+    await fs.upload_part("b", upload_id, 1, b"hello ")
+    parts = await fs.list_parts("b", upload_id)
+    assert [p.part_number for p in parts] == [1, 2]
+
+    stored = await fs.complete_multipart("b", upload_id, parts)
+    assert stored.bytes == 11
+    assert await _read(fs, "b") == b"hello world"
+    # completing removes the parts, aborting again is harmless
+    await fs.abort_multipart("b", upload_id)
+
+
+def _range_client(fs: LocalStorage) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/{key}")
+    async def download(key: str, request: Request):
+        return await object_response(request, fs, key, media_type="text/plain")
+
+    return TestClient(app)
+
+
+@pytest.mark.asyncio
+async def test_object_response_ranges(tmp_path):
+    fs = LocalStorage(str(tmp_path))
+    await fs.put_stream("c", io.BytesIO(b"0123456789"))
+    client = _range_client(fs)
+
+    response = client.get("/c", headers={"Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.content == b"234"
+    assert response.headers["Content-Range"] == "bytes 2-4/10"
+
+    response = client.get("/c", headers={"Range": "bytes=-3"})
+    assert response.content == b"789"
+
+    response = client.get("/c", headers={"Range": "bytes=0-1,8-"})
+    assert response.status_code == 206
+    assert response.headers["Content-Type"].startswith("multipart/byteranges")
+    assert int(response.headers["Content-Length"]) == len(response.content)
+    assert b"Content-Range: bytes 8-9/10" in response.content
+
+    response = client.get("/c", headers={"Range": "bytes=20-"})
+    assert response.status_code == 416
+
+    etag = response.headers["ETag"]
+    assert client.get("/c", headers={"If-None-Match": etag}).status_code == 304
+    # a stale If-Range sends the whole object
+    response = client.get("/c", headers={"Range": "bytes=0-1", "If-Range": '"x"'})
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+
+
+@pytest.mark.asyncio
+async def test_prefetch_streams_order_and_budget():
+    sizes = [10, 30, 5, 100, 20, 20, 1, 40]
+    active = 0
+    max_active = 0
+
+    async def items():
+        for i in range(len(sizes)):
+            yield i
+
+    async def chunks(i: int):
+        yield bytes(sizes[i])
+
+    async def open_stream(i: int):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        # later items finish first
+        await asyncio.sleep(0.01 * (len(sizes) - i))
+        active -= 1
+        return chunks(i)
+
+    received = []
+    async for i, stream in prefetch_streams(
+        items(), open_stream, lambda i: sizes[i], parallelism=3, byte_budget=50
+    ):
+        received.append((i, len(b"".join([c async for c in stream]))))
+    # order is kept, the item larger than the budget is streamed directly
+    assert received == list(enumerate(sizes))
+    # three background downloads plus the one streamed directly
+    assert max_active <= 4
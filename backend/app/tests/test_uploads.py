@@ -0,0 +1,111 @@
+import requests
+from app.config import settings
+from app.tests.utils import create_dataset, file_content_example_1
+from fastapi.testclient import TestClient
+
+
+def test_chunked_upload(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+
+    # Start session
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads",
+        json={"name": "chunked.csv"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    session_id = response.json().get("id")
+    assert response.json().get("chunks") == {}
+
+    # Upload a single (final) chunk and check it is recorded
+    response = client.put(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}/chunks/1",
+        content=file_content_example_1.encode(),
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert list(response.json().get("chunks").keys()) == ["1"]
+
+    # Commit creates the file
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}/commit",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    file_id = response.json().get("id")
+    assert response.json().get("bytes") == len(file_content_example_1)
+    assert response.json().get("version_num") == 1
+
+    response = client.get(f"{settings.API_V2_STR}/files/{file_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.content == file_content_example_1.encode()
+
+    # Session is gone once committed
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}",
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+
+def test_abort_upload(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads",
+        json={"name": "aborted.csv"},
+        headers=headers,
+    )
+    session_id = response.json().get("id")
+
+    # Missing chunks cannot be committed
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}/commit",
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    response = client.delete(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    response = client.delete(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/not-a-session",
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+
+def test_presigned_upload(client: TestClient, headers: dict):
+    dataset_id = create_dataset(client, headers).get("id")
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads?presigned=true&multipart=false",
+        json={"name": "presigned.csv"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    session_id = response.json().get("id")
+
+    # Send the bytes straight to Minio
+    response = client.get(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}/url",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    presigned_url = response.json().get("presigned_url")
+    response = requests.put(presigned_url, data=file_content_example_1.encode())
+    assert response.status_code == 200
+
+    # Completion hook picks up size and version from Minio
+    response = client.post(
+        f"{settings.API_V2_STR}/datasets/{dataset_id}/uploads/{session_id}/commit",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json().get("bytes") == len(file_content_example_1)
@@ -0,0 +1,93 @@
+"""Measures dataset archive throughput with and without prefetching.
+
+Files are stored with the local storage backend and every read waits `--latency` seconds first to stand in for the
+round trip to Minio. Each dataset shape is archived with `--parallelism 1` (one file after another) and with the
+configured parallelism so the two can be compared.
+
+Run from the backend directory so the app package can be imported:
+
+`python ../scripts/develop/benchmark_archive.py --latency 0.005 --parallelism 8`
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from app.storage.local_storage import LocalStorage  # noqa: E402
+from app.storage.prefetch import prefetch_streams  # noqa: E402
+from app.storage.zipstream import ZipStream  # noqa: E402
+
+
+class SlowStorage(LocalStorage):
+    """Local storage that waits before every read like a remote object store would."""
+
+    def __init__(self, root: str, latency: float):
+        super().__init__(root)
+        self.latency = latency
+
+    async def get_stream(self, key, version_id=None, offset=0, length=None):
+        await asyncio.sleep(self.latency)
+        return await super().get_stream(key, version_id, offset, length)
+
+
+async def populate(fs: LocalStorage, count: int, size: int):
+    sizes = {}
+    for i in range(count):
+        # random bytes so compression does not make the large case trivial
+        stored = await fs.put_stream(f"{size}-{i}", io.BytesIO(os.urandom(size)))
+        sizes[f"{size}-{i}"] = stored.bytes
+    return sizes
+
+
+async def archive(fs: LocalStorage, sizes: dict, parallelism: int, budget: int):
+    async def keys():
+        for key in sizes:
+            yield key
+
+    zip_stream = ZipStream()
+    total = 0
+    start = time.perf_counter()
+    async for key, chunks in prefetch_streams(
+        keys(), fs.get_stream, sizes.get, parallelism, budget
+    ):
+        async for data in zip_stream.write_stream(f"data/{key}", chunks):
+            total += len(data)
+    total += len(zip_stream.close())
+    return total, time.perf_counter() - start
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as root:
+        fs = SlowStorage(root, args.latency)
+        shapes = [
+            ("many small files", args.small_count, args.small_size),
+            ("few huge files", args.huge_count, args.huge_size),
+        ]
+        for name, count, size in shapes:
+            sizes = await populate(fs, count, size)
+            payload = sum(sizes.values())
+            for parallelism in (1, args.parallelism):
+                total, seconds = await archive(fs, sizes, parallelism, args.budget)
+                print(
+                    f"{name:17} {count:6} x {size:>10} B  parallelism {parallelism:2}: "
+                    f"{seconds:7.2f} s  {payload / seconds / 1024 / 1024:8.1f} MiB/s  "
+                    f"{count / seconds:8.1f} files/s  zip {total} B"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--parallelism", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--small-count", type=int, default=2000)
+    parser.add_argument("--small-size", type=int, default=4 * 1024)
+    parser.add_argument("--huge-count", type=int, default=3)
+    parser.add_argument("--huge-size", type=int, default=64 * 1024 * 1024)
+    asyncio.run(main(parser.parse_args()))
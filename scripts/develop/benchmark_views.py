@@ -0,0 +1,252 @@
+"""Compares query latency of the live MongoDB views with their materialized collections.
+
+A scratch database is filled with datasets, their files, folders, metadata and authorizations. The same queries are
+then timed against the views (`$unionWith` and `$lookup` on every query) and against the materialized collections
+built by `app.db.materialized`. The scratch database is dropped afterwards.
+
+Run from the backend directory so the app package can be imported. The materialized collections are rebuilt directly,
+so no replica set is needed:
+
+`python ../scripts/develop/benchmark_views.py --datasets 2000 --files 20`
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.getcwd())
+
+from app.config import settings  # noqa: E402
+from app.db.materialized import MATERIALIZABLE_VIEWS, MaterializedViews  # noqa: E402
+from app.models.authorization import AuthorizationDB  # noqa: E402
+from app.models.datasets import (  # noqa: E402
+    DatasetDB,
+    DatasetDBViewList,
+    DatasetFreezeDB,
+)
+from app.models.files import FileDB, FileDBViewList, FileFreezeDB  # noqa: E402
+from app.models.folder_and_file import FolderFileViewList  # noqa: E402
+from app.models.folders import FolderDB, FolderDBViewList, FolderFreezeDB  # noqa: E402
+from app.models.metadata import (  # noqa: E402
+    MetadataDB,
+    MetadataDBViewList,
+    MetadataFreezeDB,
+)
+from beanie import init_beanie  # noqa: E402
+from beanie.operators import Or  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+
+def _creator(email: str) -> dict:
+    return {"email": email, "first_name": "Bench", "last_name": "Mark"}
+
+
+async def populate(db, datasets: int, files: int, users: int):
+    """Insert documents directly, far faster than going through the API."""
+    emails = [f"user{i}@example.com" for i in range(users)]
+    start = datetime.utcnow() - timedelta(days=365)
+    dataset_docs, file_docs, folder_docs, metadata_docs, auth_docs = [], [], [], [], []
+    for d in range(datasets):
+        owner = random.choice(emails)
+        dataset_id = ObjectId()
+        created = start + timedelta(minutes=d)
+        dataset_docs.append(
+            {
+                "_id": dataset_id,
+                "name": f"dataset {d}",
+                "description": "",
+                "creator": _creator(owner),
+                "created": created,
+                "modified": created,
+                "status": "PRIVATE",
+                "user_views": 0,
+                "views": 0,
+                "downloads": 0,
+                "frozen": False,
+                "frozen_version_num": -999,
+            }
+        )
+        auth_docs.append(
+            {
+                "dataset_id": dataset_id,
+                "user_ids": [owner] + random.sample(emails, 2),
+                "role": "owner",
+                "group_ids": [],
+                "creator": owner,
+                "created": created,
+                "modified": created,
+            }
+        )
+        folder_id = ObjectId()
+        folder_docs.append(
+            {
+                "_id": folder_id,
+                "name": "folder",
+                "dataset_id": dataset_id,
+                "parent_folder": None,
+                "creator": _creator(owner),
+                "created": created,
+                "modified": created,
+                "object_type": "folder",
+            }
+        )
+        for f in range(files):
+            file_id = ObjectId()
+            file_docs.append(
+                {
+                    "_id": file_id,
+                    "name": f"file {f}.txt",
+                    "creator": _creator(owner),
+                    "created": created + timedelta(seconds=f),
+                    "version_id": "N/A",
+                    "version_num": 1,
+                    "dataset_id": dataset_id,
+                    "folder_id": folder_id if f % 2 else None,
+                    "views": 0,
+                    "downloads": 0,
+                    "bytes": 1024,
+                    "content_type": {"content_type": "text/plain", "main_type": "text"},
+                    "storage_type": "minio",
+                    "object_type": "file",
+                }
+            )
+            metadata_docs.append(
+                {
+                    "content": {"index": f},
+                    "resource": {"collection": "files", "resource_id": file_id},
+                    "agent": {"creator": _creator(owner)},
+                    "created": created,
+                }
+            )
+    for model, docs in [
+        (DatasetDB, dataset_docs),
+        (AuthorizationDB, auth_docs),
+        (FolderDB, folder_docs),
+        (FileDB, file_docs),
+        (MetadataDB, metadata_docs),
+    ]:
+        for i in range(0, len(docs), 10000):
+            await db[model.get_settings().name].insert_many(docs[i : i + 10000])
+    return emails, dataset_docs, file_docs
+
+
+async def timed(name: str, mode: str, repeat: int, query):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await query()
+    seconds = time.perf_counter() - start
+    print(f"{name:26} {mode:12}: {seconds / repeat * 1000:8.2f} ms/query")
+
+
+async def run_queries(mode: str, args, emails, datasets, files):
+    dataset = random.choice(datasets)
+    file = random.choice(files)
+    email = random.choice(emails)
+
+    async def dataset_by_id():
+        await DatasetDBViewList.find_one(DatasetDBViewList.id == dataset["_id"])
+
+    async def datasets_of_user():
+        await DatasetDBViewList.find(
+            Or(
+                DatasetDBViewList.creator.email == email,
+                DatasetDBViewList.auth.user_ids == email,
+            )
+        ).sort(-DatasetDBViewList.created).limit(20).to_list()
+
+    async def files_of_dataset():
+        await FileDBViewList.find(
+            FileDBViewList.dataset_id == dataset["_id"],
+            FileDBViewList.folder_id == None,  # noqa: E711
+        ).sort(-FileDBViewList.created).limit(20).to_list()
+
+    async def folders_and_files():
+        await FolderFileViewList.find(
+            FolderFileViewList.dataset_id == dataset["_id"],
+            FolderFileViewList.auth.user_ids == dataset["creator"]["email"],
+        ).sort(-FolderFileViewList.created).limit(20).to_list()
+
+    async def metadata_of_file():
+        await MetadataDBViewList.find(
+            MetadataDBViewList.resource.resource_id == file["_id"],
+            MetadataDBViewList.resource.collection == "files",
+        ).to_list()
+
+    for name, query in [
+        ("dataset by id", dataset_by_id),
+        ("datasets of a user", datasets_of_user),
+        ("files of a dataset", files_of_dataset),
+        ("folders and files", folders_and_files),
+        ("metadata of a file", metadata_of_file),
+    ]:
+        await timed(name, mode, args.repeat, query)
+
+
+async def main(args):
+    client = AsyncIOMotorClient(str(settings.MONGODB_URL))
+    db = client[args.database]
+    await client.drop_database(args.database)
+    try:
+        await init_beanie(
+            database=db,
+            document_models=[
+                DatasetDB,
+                DatasetFreezeDB,
+                DatasetDBViewList,
+                AuthorizationDB,
+                FolderDB,
+                FolderFreezeDB,
+                FolderDBViewList,
+                FileDB,
+                FileFreezeDB,
+                FileDBViewList,
+                FolderFileViewList,
+                MetadataDB,
+                MetadataFreezeDB,
+                MetadataDBViewList,
+            ],
+            recreate_views=True,
+        )
+        emails, datasets, files = await populate(
+            db, args.datasets, args.files, args.users
+        )
+        print(
+            f"{len(datasets)} datasets, {len(files)} files and metadata, {args.users} users"
+        )
+        await run_queries("view", args, emails, datasets, files)
+
+        views = list(MATERIALIZABLE_VIEWS)
+        materialized = MaterializedViews(db, views)
+        start = time.perf_counter()
+        for view in views:
+            await materialized.rebuild(view)
+            materialized.switch(view, materialized=True)
+        print(f"materialized all views in {time.perf_counter() - start:.2f} s")
+        await run_queries("materialized", args, emails, datasets, files)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            await materialized.refresh(
+                FileDBViewList, {"_id": {"$in": [random.choice(files)["_id"]]}}
+            )
+        print(
+            f"{'refresh one file':26} {'materialized':12}: "
+            f"{(time.perf_counter() - start) / args.repeat * 1000:8.2f} ms/refresh"
+        )
+    finally:
+        await client.drop_database(args.database)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default="clowder2_view_benchmark")
+    parser.add_argument("--datasets", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))